@@ -0,0 +1,9 @@
+"""Benchmarks for header2yaml.
+
+Run them from the repository root (the grammar is loaded from
+`treesitter/my-languages.so`):
+
+    python -m benchmarks.suite --sizes 100 1000 -o results.json
+    python -m benchmarks.suite --compare before.json after.json
+    python -m benchmarks.scaling --kinds class mixed --max-nodes 100000 --repeat 5
+"""
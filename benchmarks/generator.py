@@ -0,0 +1,165 @@
+"""Seeded generator of synthetic C++ headers.
+
+`generateHeader(n, seed)` returns a header with `n` top-level items mixing
+classes (constructors, methods, overloaded operators, access specifiers),
+free functions with default parameters, `#if`/`#ifdef` nesting, typedefs,
+macros, includes and comments. The same (n, seed) always gives the same
+header. `kinds` restricts the items to some of the kinds in ITEMS.
+"""
+import random
+
+PRIMITIVES = ["int", "double", "float", "char", "bool", "long", "short",
+              "unsigned int", "unsigned long", "long long"]
+CLASS_TYPES = ["gp_Pnt", "gp_Dir", "gp_Vec", "TopoDS_Shape", "Standard_Real",
+               "Standard_Integer", "Handle_Geom_Curve"]
+OPERATORS = ["==", "!=", "+", "-", "*", "/", "+=", "-=", "<", "[]"]
+DEFAULTS = ["0", "1", "3", "42", '"name"']
+WORDS = ["compute", "value", "shape", "axis", "point", "direction", "scale",
+         "mirror", "rotate", "translate", "transform", "distance", "angle"]
+
+# Kinds of top-level item and their weight
+ITEMS = [("class", 4), ("function", 4), ("comment", 2), ("define", 1),
+         ("funcDefine", 1), ("typedef", 1), ("ifdef", 1), ("if", 1),
+         ("include", 1)]
+
+
+class Generator:
+    def __init__(self, seed=0):
+        self.rnd = random.Random(seed)
+        self.count = 0
+
+    def name(self, prefix=""):
+        self.count += 1
+        word = self.rnd.choice(WORDS)
+        if prefix:
+            word = word.capitalize()
+        return f"{prefix}{word}{self.count}"
+
+    def type(self):
+        if self.rnd.random() < 0.6:
+            return self.rnd.choice(PRIMITIVES)
+        return self.rnd.choice(CLASS_TYPES)
+
+    def params(self, withDefaults=True):
+        params = []
+        for k in range(self.rnd.randint(0, 4)):
+            typ = self.type()
+            decl = f"{typ} {self.name('p')}"
+            r = self.rnd.random()
+            if typ in CLASS_TYPES and r < 0.5:
+                decl = f"const {typ}& {self.name('p')}"
+            elif r < 0.2:
+                decl = f"{typ} *{self.name('p')}"
+            params.append(decl)
+        if withDefaults and params and self.rnd.random() < 0.4:
+            params[-1] += f" = {self.rnd.choice(DEFAULTS)}"
+        return ", ".join(params)
+
+    def comment(self, indent=""):
+        if self.rnd.random() < 0.7:
+            return f"{indent}// {' '.join(self.rnd.sample(WORDS, 4))}\n"
+        lines = [" ".join(self.rnd.sample(WORDS, 5)) for _ in range(self.rnd.randint(2, 4))]
+        body = "\n".join(f"{indent}   {l}" for l in lines)
+        return f"{indent}/*\n{body}\n{indent}*/\n"
+
+    def function(self, indent=""):
+        return f"{indent}{self.type()} {self.name()}({self.params()});\n"
+
+    def method(self, className):
+        r = self.rnd.random()
+        if r < 0.2:
+            return f"  {className}({self.params()});\n"
+        if r < 0.35:
+            op = self.rnd.choice(OPERATORS)
+            return f"  {className} operator{op}(const {className}& other) const;\n"
+        if r < 0.5:
+            body = f"{{ return {self.name('m')}; }}"
+            return f"  inline {self.type()} {self.name()}() const {body}\n"
+        if r < 0.6:
+            return self.comment("  ")
+        return f"  {self.type()} {self.name()}({self.params()});\n"
+
+    def klass(self):
+        className = self.name("C")
+        base = f" : public {self.rnd.choice(CLASS_TYPES)}" if self.rnd.random() < 0.5 else ""
+        out = [f"class {className}{base}\n{{\n", "public:\n\n"]
+        for k in range(self.rnd.randint(2, 8)):
+            out.append(self.method(className))
+        if self.rnd.random() < 0.5:
+            out.append("\nprotected:\n\n")
+            for k in range(self.rnd.randint(1, 3)):
+                out.append(self.method(className))
+        out.append("\nprivate:\n\n")
+        out.append(f"  {self.type()} {self.name('m')};\n")
+        out.append("};\n\n")
+        return "".join(out)
+
+    def block(self, depth):
+        """Body of a preprocessor branch"""
+        out = []
+        for k in range(self.rnd.randint(1, 3)):
+            if depth < 2 and self.rnd.random() < 0.3:
+                out.append(self.ifdef(depth + 1))
+            elif self.rnd.random() < 0.3:
+                out.append(self.comment())
+            else:
+                out.append(self.function())
+        return "".join(out)
+
+    def ifdef(self, depth=0):
+        key = self.rnd.choice(["#ifdef", "#ifndef"])
+        out = f"{key} {self.name('HAVE_').upper()}\n{self.block(depth)}"
+        if self.rnd.random() < 0.5:
+            out += f"#else\n{self.block(depth)}"
+        return out + "#endif\n\n"
+
+    def preprocIf(self):
+        out = f"#if {self.name('VERSION_').upper()} > {self.rnd.randint(1, 9)}\n{self.block(1)}"
+        if self.rnd.random() < 0.5:
+            out += f"#elif {self.name('VERSION_').upper()} > {self.rnd.randint(1, 9)}\n{self.block(1)}"
+        if self.rnd.random() < 0.5:
+            out += f"#else\n{self.block(1)}"
+        return out + "#endif\n\n"
+
+    def item(self, kinds=None):
+        items = [(k, w) for k, w in ITEMS if kinds is None or k in kinds]
+        kind = self.rnd.choices([k for k, _ in items], [w for _, w in items])[0]
+        if kind == "class":
+            return self.klass()
+        if kind == "function":
+            return self.function()
+        if kind == "comment":
+            return self.comment()
+        if kind == "define":
+            return f"#define {self.name('K_').upper()} {self.rnd.randint(0, 1000)}\n"
+        if kind == "funcDefine":
+            return f"#define {self.name('M_').upper()}(a, b) ((a) * (b))\n"
+        if kind == "typedef":
+            return f"typedef {self.rnd.choice(PRIMITIVES)} {self.name('T')};\n"
+        if kind == "ifdef":
+            return self.ifdef()
+        if kind == "if":
+            return self.preprocIf()
+        if self.rnd.random() < 0.5:
+            return f"#include <{self.name()}.hxx>\n"
+        return f'#include "{self.name()}.hxx"\n'
+
+    def header(self, n, kinds=None):
+        guard = f"_{self.name('G').upper()}_HeaderFile"
+        out = [f"#ifndef {guard}\n#define {guard}\n\n"]
+        for k in range(n):
+            out.append(self.item(kinds))
+        out.append("\n#endif // " + guard + "\n")
+        return "".join(out)
+
+
+def generateHeader(n, seed=0, kinds=None):
+    """Returns a synthetic header (str) with `n` top-level items"""
+    return Generator(seed).header(n, kinds)
+
+
+if __name__ == "__main__":
+    import sys
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    sys.stdout.write(generateHeader(n, seed))
@@ -0,0 +1,201 @@
+"""Measures how every phase of the conversion grows with the header size.
+
+    python -m benchmarks.scaling [--kinds class function ...] [--min-nodes N]
+                                 [--max-nodes N] [--factor F] [--budget S]
+                                 [--repeat R] [-o results.json]
+
+For every kind of item of the generator (and "mixed", all of them
+together), headers are generated at geometric sizes from `--min-nodes` to
+`--max-nodes` nodes and the phases are timed: tree-sitter `parse`,
+`walker`, `get_includes`, `process`, `stream` (`processChunks` over
+`walkChunks`) and the query-based `extract`, taking the median of
+`--repeat` runs (3 by default, the phases taking turns). A phase stops growing once a run takes
+more than `--budget` seconds. The YAML is not kept, only its
+size, which gets an exponent too. Tree-sitter keeps the number of children
+of a node on 16 bits (and crashes freeing a tree with more), so a kind
+stops growing before its headers get MAX_CHILDREN items.
+
+The growth exponent of every phase is the slope of log(time) against
+log(n log n), fitted over the sizes measured: 1 for n log n, about 0.9 for
+n and 1.8 for n^2. The same slope over the three largest sizes is given
+as well, since a quadratic term may only show up on large headers. Phases
+for which either is above 1 + `--tolerance` are flagged, and the exit
+status is 1 when any is. With fewer than MIN_REPEAT runs, a single slow run
+is enough to bend a slope: the tolerance is doubled then.
+"""
+import os, sys, time, json, math, argparse, platform, contextlib, statistics
+
+import header2yaml
+from benchmarks.generator import ITEMS, generateHeader
+
+PHASES = ["parse", "walker", "get_includes", "process", "stream", "extract"]
+
+MAX_CHILDREN = 65535
+
+MIN_REPEAT = 3
+
+
+class Counter:
+    """File that only counts what is written into it"""
+    def __init__(self):
+        self.size = 0
+
+    def write(self, txt):
+        self.size += len(txt)
+
+
+def density(kinds, seed, probe=200):
+    """Nodes per item and children of the include guard per item"""
+    data = generateHeader(probe, seed, kinds).encode("utf8")
+    tree = header2yaml.getParser().parse(data)
+    guard = tree.root_node.children[0]
+    return len(header2yaml.walker(tree.walk())) / probe, guard.child_count / probe
+
+def measure(data, phases, repeat):
+    """Returns the number of nodes, the median time of every phase in
+    `phases` and the size of the YAML for the header `data`"""
+    parser = header2yaml.getParser()
+    tree = parser.parse(data)
+    parsed = header2yaml.walker(tree.walk())
+    counter = Counter()
+
+    def convert(streaming):
+        counter.size = 0
+        out = header2yaml.Emitter(counter)
+        if streaming:
+            header2yaml.processChunks(header2yaml.walkChunks(tree.walk()), data,
+                                      "bench.hxx", out)
+        else:
+            header2yaml.process(parsed, data, "bench.hxx", out)
+        out.flush()
+
+    runs = {
+        "parse": lambda: parser.parse(data),
+        "walker": lambda: header2yaml.walker(tree.walk()),
+        "get_includes": lambda: header2yaml.get_includes(parsed, data),
+        "process": lambda: convert(False),
+        "stream": lambda: convert(True),
+        "extract": lambda: header2yaml.extract(data),
+    }
+    # The phases take turns: a slow moment of the machine then slows down one
+    # run of several phases rather than all the runs of one
+    samples = {phase: [] for phase in phases}
+    for _ in range(repeat):
+        for phase in phases:
+            t0 = time.perf_counter()
+            runs[phase]()
+            samples[phase].append(time.perf_counter() - t0)
+    times = {phase: statistics.median(samples[phase]) for phase in phases}
+    return len(parsed), times, counter.size or None
+
+def fit(points):
+    """Slope of log(time) against log(n log n), by least squares"""
+    xs = [math.log(n * math.log(n)) for n, _ in points]
+    ys = [math.log(max(t, 1e-9)) for _, t in points]
+    mx, my = sum(xs) / len(xs), sum(ys) / len(ys)
+    sxx = sum((x - mx) ** 2 for x in xs)
+    if sxx == 0:
+        return None
+    return sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / sxx
+
+def sizes(minNodes, maxNodes, factor):
+    n = minNodes
+    while n <= maxNodes * 1.0001:
+        yield int(round(n))
+        n *= factor
+
+def scaleKind(kind, args):
+    """Times the phases on growing headers of one kind of item"""
+    kinds = None if kind == "mixed" else [kind]
+    phases = list(PHASES)
+    points = {phase: [] for phase in PHASES}
+    measured = []
+    limit = None
+    nodesPerItem, childrenPerItem = density(kinds, args.seed)
+    for target in sizes(args.min_nodes, args.max_nodes, args.factor):
+        if not phases:
+            break
+        items = max(1, round(target / nodesPerItem))
+        if items * childrenPerItem > MAX_CHILDREN - 16:
+            limit = target
+            break
+        data = generateHeader(items, args.seed, kinds).encode("utf8")
+        nodes, times, output = measure(data, phases, args.repeat)
+        measured.append({"nodes": nodes, "bytes": len(data), "output": output,
+                         "times": times})
+        for phase, t in times.items():
+            points[phase].append((nodes, t))
+        # Phases over budget are not run on larger headers
+        phases = [phase for phase in phases if times[phase] <= args.budget]
+    exponents = {phase: fit(p) if len(p) >= 2 else None for phase, p in points.items()}
+    last = {phase: fit(p[-3:]) if len(p) >= 2 else None for phase, p in points.items()}
+    flagged = [phase for phase in PHASES
+               if max(exponents[phase] or 0, last[phase] or 0) > 1 + tolerance(args)]
+    outputs = [(s["nodes"], s["output"]) for s in measured if s["output"]]
+    return {"sizes": measured, "exponents": exponents, "lastExponents": last,
+            "outputExponent": fit(outputs) if len(outputs) >= 2 else None,
+            "limit": limit, "flagged": flagged}
+
+def tolerance(args):
+    """Tolerance of the exponents, doubled when there are too few runs to
+    take a meaningful median"""
+    return args.tolerance * (2 if args.repeat < MIN_REPEAT else 1)
+
+def run(args):
+    if args.repeat < MIN_REPEAT:
+        print(f"WARNING: {args.repeat} run(s) per phase: the tolerance is doubled "
+              f"({tolerance(args):.2f})")
+    report = {"meta": {"seed": args.seed, "repeat": args.repeat, "tolerance": tolerance(args),
+                       "python": platform.python_version(), "platform": platform.platform(),
+                       "date": time.strftime("%Y-%m-%d %H:%M:%S")},
+              "kinds": {}}
+    for kind in args.kinds:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = scaleKind(kind, args)
+        report["kinds"][kind] = result
+        show(kind, result)
+    return report
+
+def show(kind, result):
+    sizes = result["sizes"]
+    limit = f" (not {result['limit']}: too many items)" if result["limit"] else ""
+    print(f"{kind}: {sizes[0]['nodes']} to {sizes[-1]['nodes']} nodes{limit}")
+    for phase in PHASES:
+        e, last = result["exponents"][phase], result["lastExponents"][phase]
+        times = [s["times"][phase] for s in sizes if phase in s["times"]]
+        exponent = f"{e:5.2f} (last {last:5.2f})" if e is not None else "    -" + " " * 13
+        flag = "   <-- worse than n log n" if phase in result["flagged"] else ""
+        print(f"  {phase:14s} exponent {exponent}   {times[0] * 1000:9.2f} ms -> "
+              f"{times[-1] * 1000:10.2f} ms ({len(times)} sizes){flag}")
+    outputs = [s["output"] for s in sizes if s["output"]]
+    if result["outputExponent"] is not None:
+        print(f"  {'YAML size':14s} exponent {result['outputExponent']:5.2f}"
+              f"{'':14s}{outputs[0]:12d} ch -> {outputs[-1]:12d} ch")
+
+if __name__ == "__main__":
+    kinds = [k for k, _ in ITEMS] + ["mixed"]
+    argParser = argparse.ArgumentParser(description="header2yaml complexity scaling")
+    argParser.add_argument("--kinds", nargs="+", choices=kinds, default=kinds,
+                           help="kinds of item of the generated headers")
+    argParser.add_argument("--min-nodes", type=int, default=1000)
+    argParser.add_argument("--max-nodes", type=int, default=1000000)
+    argParser.add_argument("--factor", type=float, default=10 ** 0.5,
+                           help="ratio between two consecutive sizes")
+    argParser.add_argument("--budget", type=float, default=10,
+                           help="seconds per run above which a phase is not run on larger headers")
+    argParser.add_argument("--tolerance", type=float, default=0.15,
+                           help="flag the exponents above 1 + tolerance")
+    argParser.add_argument("--seed", type=int, default=0)
+    argParser.add_argument("--repeat", type=int, default=MIN_REPEAT,
+                           help="runs of every phase, of which the median is taken")
+    argParser.add_argument("-o", "--output", help="JSON file for the results")
+    args = argParser.parse_args()
+
+    report = run(args)
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=1)
+    flagged = [(kind, phase) for kind, r in report["kinds"].items() for phase in r["flagged"]]
+    if flagged:
+        print("Superlinear:", ", ".join(f"{phase} ({kind})" for kind, phase in flagged))
+    sys.exit(1 if flagged else 0)
@@ -0,0 +1,130 @@
+"""Times every phase of the conversion on synthetic headers.
+
+    python -m benchmarks.suite [--sizes N ...] [--seed S] [--repeat R] [-o results.json]
+    python -m benchmarks.suite --compare before.json after.json
+
+The phases are timed separately: tree-sitter `parse`, `walker`,
+`get_includes`, `process`, `addFunction` (over every function of the header),
+`parseFile` end to end, the query-based `extract` and `resolveTypes` (the
+Nim type of every parameter and return type, with a fresh TypeResolver).
+For every phase the best and mean time of `repeat` runs are saved.
+"""
+import os, time, json, argparse, platform, tempfile, contextlib
+
+import header2yaml
+from benchmarks.generator import generateHeader
+
+
+def timeit(func, repeat):
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - t0)
+    return {"best": min(runs), "mean": sum(runs) / len(runs), "runs": runs}
+
+def collectFunctions(parsed, data):
+    """The dictionaries `getFunction` builds for the header"""
+    functions = []
+    for i in range(len(parsed)):
+        try:
+            if parsed.isFunction(i):
+                functions.append(header2yaml.getFunction(data, parsed, i, len(functions), False))
+        except Exception:
+            pass
+    return functions
+
+def benchHeader(txt, repeat, folder):
+    data = txt.encode("utf8")
+    filename = os.path.join(folder, "bench.hxx")
+    with open(filename, "w") as fp:
+        fp.write(txt)
+
+    parser = header2yaml.getParser()
+    tree = parser.parse(data)
+    parsed = header2yaml.walker(tree.walk())
+    functions = collectFunctions(parsed, data)
+
+    def resolveTypes():
+        resolver = header2yaml.TypeResolver()
+        for f in functions:
+            if f.returnType:
+                resolver.resolve(f.returnType, filename)
+            for p in f.params:
+                if p.type:
+                    resolver.resolve(p.type, filename)
+
+    def addFunctions():
+        out = header2yaml.Emitter()
+        indent = header2yaml.Indenter()
+        for f in functions:
+            header2yaml.addFunction(f, indent, [], set(), out)
+
+    results = {
+        "parse": timeit(lambda: parser.parse(data), repeat),
+        "walker": timeit(lambda: header2yaml.walker(tree.walk()), repeat),
+        "get_includes": timeit(lambda: header2yaml.get_includes(parsed, data), repeat),
+        "process": timeit(lambda: header2yaml.process(parsed, data, "bench.hxx"), repeat),
+        "addFunction": timeit(addFunctions, repeat),
+        "parseFile": timeit(lambda: header2yaml.parseFile(filename, outputFolder=folder), repeat),
+        "extract": timeit(lambda: header2yaml.extract(data), repeat),
+        "resolveTypes": timeit(resolveTypes, repeat),
+    }
+    info = {"bytes": len(data), "nodes": len(parsed), "functions": len(functions)}
+    return info, results
+
+def run(sizes, seed, repeat):
+    report = {"meta": {"seed": seed, "repeat": repeat, "python": platform.python_version(),
+                       "platform": platform.platform(), "date": time.strftime("%Y-%m-%d %H:%M:%S")},
+              "sizes": {}}
+    with tempfile.TemporaryDirectory() as folder, \
+         open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for n in sizes:
+            info, results = benchHeader(generateHeader(n, seed), repeat, folder)
+            report["sizes"][str(n)] = {"info": info, "phases": results}
+    return report
+
+def show(report):
+    for n, entry in report["sizes"].items():
+        info = entry["info"]
+        print(f"size {n}: {info['bytes']} bytes, {info['nodes']} nodes, {info['functions']} functions")
+        for phase, r in entry["phases"].items():
+            print(f"  {phase:14s} best {r['best'] * 1000:10.2f} ms   mean {r['mean'] * 1000:10.2f} ms")
+
+def compare(before, after):
+    """Prints the ratio after/before of the best time of every phase"""
+    for n, entry in after["sizes"].items():
+        old = before["sizes"].get(n)
+        if old is None:
+            continue
+        print(f"size {n}:")
+        for phase, r in entry["phases"].items():
+            if phase not in old["phases"]:
+                continue
+            t0, t1 = old["phases"][phase]["best"], r["best"]
+            ratio = t1 / t0 if t0 else float("inf")
+            print(f"  {phase:14s} {t0 * 1000:10.2f} ms -> {t1 * 1000:10.2f} ms   x{ratio:.2f}")
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="header2yaml benchmarks")
+    argParser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000],
+                           help="number of top-level items of the generated headers")
+    argParser.add_argument("--seed", type=int, default=0)
+    argParser.add_argument("--repeat", type=int, default=3)
+    argParser.add_argument("-o", "--output", help="JSON file for the results")
+    argParser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"),
+                           help="compare two JSON result files")
+    args = argParser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as fp:
+            before = json.load(fp)
+        with open(args.compare[1]) as fp:
+            after = json.load(fp)
+        compare(before, after)
+    else:
+        report = run(args.sizes, args.seed, args.repeat)
+        show(report)
+        if args.output:
+            with open(args.output, "w") as fp:
+                json.dump(report, fp, indent=1)
@@ -0,0 +1,84 @@
+"""Times the ways of building the node table: `walker` over the whole tree,
+`walkChunks` piece by piece and `rewalk` after a one-line edit in the
+middle of the header.
+
+Run it from the repository root:
+
+    python benchmarks/walker.py [header ...]
+
+Without arguments it uses a synthetic header with many classes plus a
+deeply nested one.
+"""
+import sys, os, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import header2yaml
+
+CLASS = """
+class Foo%(n)d : public Base
+{
+public:
+  Foo%(n)d(const int& a, double b = 3.0);
+  int value(int x, char *name) const;
+  inline double twice(double x) { return 2 * x * (x + 1); }
+protected:
+  int m_%(n)d;
+};
+"""
+
+def wideHeader(n):
+    return "".join(CLASS % {"n": i} for i in range(n)).encode("utf8")
+
+def deepHeader(n):
+    return ("namespace a { " * n + "int f(int x);" + " }" * n).encode("utf8")
+
+def chunks(tree):
+    """Every piece of `walkChunks`"""
+    for _ in header2yaml.walkChunks(tree.walk()):
+        pass
+
+def edited(data):
+    """(previous table, tree, edit, changed ranges) once a line is inserted
+    in the middle of `data`, the tree parsed again from the previous one"""
+    parser = header2yaml.getParser()
+    tree = parser.parse(data)
+    previous = header2yaml.walker(tree.walk())
+    position = data.find(b"\n", len(data) // 2) + 1 or len(data)
+    line = b"int extra;\n"
+    newData = data[:position] + line + data[position:]
+    edit = (position, position, position + len(line))
+    point = header2yaml._point(data, position)
+    tree.edit(*edit, point, point, (point[0] + 1, 0))
+    newTree = parser.parse(newData, tree)
+    dirty = [(position, position + len(line))]
+    dirty += [(r.start_byte, r.end_byte) for r in tree.get_changed_ranges(newTree)]
+    return previous, newTree, edit, dirty
+
+def timeit(func, tree, repeat=5):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(tree)
+        t = time.perf_counter() - t0
+        best = t if best is None else min(best, t)
+    return best
+
+def run(name, data):
+    tree = header2yaml.getParser().parse(data)
+    n = len(header2yaml.walker(tree.walk()))
+    tWalker = timeit(lambda tree: header2yaml.walker(tree.walk()), tree)
+    tChunks = timeit(chunks, tree)
+    previous, newTree, edit, dirty = edited(data)
+    tRewalk = timeit(lambda tree: header2yaml.rewalk(tree.walk(), previous, edit, dirty, 1),
+                     newTree)
+    print(f"{name:30s} {n:9d} nodes  walker: {tWalker * 1000:9.1f} ms  "
+          f"walkChunks: {tChunks * 1000:9.1f} ms  rewalk: {tRewalk * 1000:9.1f} ms")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        for filename in sys.argv[1:]:
+            with open(filename, "rb") as fp:
+                run(os.path.basename(filename), fp.read())
+    else:
+        run("wide (2000 classes)", wideHeader(2000))
+        run("deep (400 namespaces)", deepHeader(400))
+        run("deep (2000 namespaces)", deepHeader(2000))
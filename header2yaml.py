@@ -1,12 +1,26 @@
 from tree_sitter import Language, Parser
-from pprint import pprint
-import textwrap, re
-from yaml import load, dump
+import textwrap, re, os, hashlib, json, shutil, bisect, time, glob, math, mmap
+import sys, collections, importlib, copy, array
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
 
 #C_LANGUAGE = Language('build/my-languages.so', 'c')
 CPP_LANGUAGE = Language('treesitter/my-languages.so', 'cpp')
 
-NIM_KEYWORDS = ["addr", "and", "as", "asm", "bind", "block", "break",
+# Parts kept in modules of their own, imported on first use: name -> module.
+# They are reachable from here too (`header2yaml.getResolver`).
+MODULES = {name: "header2yaml_nim" for name in
+           ["normalizeType", "NIM_TYPES", "readTypedefs", "TypeResolver", "getResolver",
+            "NIM_NUMBER", "NIM_OPERATORS", "nimIdent", "NimWriter"]}
+MODULES.update(SymbolIndex="header2yaml_index", ConversionServer="header2yaml_server")
+
+def __getattr__(name):
+    if name in MODULES:
+        return getattr(importlib.import_module(MODULES[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+NIM_KEYWORDS = {"addr", "and", "as", "asm", "bind", "block", "break",
                 "case", "cast", "concept", "const", "continue", "converter",
                 "defer", "discard", "distinct", "div", "do", "elif", "else",
                 "end", "enum", "except", "export", "finally", "for", "from",
@@ -15,7 +29,7 @@ NIM_KEYWORDS = ["addr", "and", "as", "asm", "bind", "block", "break",
                 "nil", "not", "notin", "object", "of", "or", "out", "proc", "ptr",
                 "raise", "ref", "return", "shl", "shr", "static", "template",
                 "try", "tuple", "type", "using", "var", "when", "while", "xor",
-                "yield"]
+                "yield"}
 
 types = {
     "void *": "pointer",
@@ -41,21 +55,681 @@ types = {
     "bool" : "bool"
 }
 
-def get_children(level,node):
-    yield  level, node
-    k = node.child_count 
-    for n in node.children:
-        yield from get_children(level+1, n)
-
-def walker(cursor):
-    """Recursively follows all nodes in the structure"""
-    depth = 0
-    _lista = []
-    for n, node in get_children(depth, cursor.node):
-        _lista.append((n, node))
-    return _lista
-    
+# Interned node-type vocabulary: every node type gets a small integer id, so
+# that the node table built by `walker` can store types in a NumPy array
+NODE_TYPES = {}
+NODE_TYPE_NAMES = []
+
+def typeId(name):
+    """Returns the id of the node type `name`, adding it if it is new"""
+    try:
+        return NODE_TYPES[name]
+    except KeyError:
+        NODE_TYPES[name] = len(NODE_TYPE_NAMES)
+        NODE_TYPE_NAMES.append(name)
+        return NODE_TYPES[name]
+
+T_PREPROC_INCLUDE        = typeId("preproc_include")
+T_PREPROC_IF             = typeId("preproc_if")
+T_BINARY_EXPRESSION      = typeId("binary_expression")
+T_DECLARATION            = typeId("declaration")
+T_FIELD_DECLARATION      = typeId("field_declaration")
+T_FUNCTION_DECLARATOR    = typeId("function_declarator")
+T_FUNCTION_DEFINITION    = typeId("function_definition")
+T_PARAMETER_LIST         = typeId("parameter_list")
+T_CAST_EXPRESSION        = typeId("cast_expression")
+T_COMPOUND_STATEMENT     = typeId("compound_statement")
+T_TYPE_IDENTIFIER        = typeId("type_identifier")
+T_PRIMITIVE_TYPE         = typeId("primitive_type")
+T_SIZED_TYPE_SPECIFIER   = typeId("sized_type_specifier")
+T_IDENTIFIER             = typeId("identifier")
+T_CALL_EXPRESSION        = typeId("call_expression")
+T_LABELED_STATEMENT      = typeId("labeled_statement")
+T_STATEMENT_IDENTIFIER   = typeId("statement_identifier")
+T_ERROR                  = typeId("ERROR")
+
+# Nodes directly under these types start a new declaration (see Segments)
+BLOCK_TYPES = ["translation_unit", "preproc_ifdef", "preproc_if", "preproc_elif",
+               "preproc_else", "declaration_list", "field_declaration_list"]
+
+# Subtrees that `walker` does not enter in signatures-only mode: function
+# bodies and constructor initializer lists
+PRUNED_TYPES = ["compound_statement", "field_initializer_list"]
+
+# Node types for which `walker` keeps prefix counts, so that "is there an X
+# under node i" is answered in constant time (see `hasTypeUnder`)
+INDEXED_TYPES = ["parameter_list", "cast_expression", "compound_statement"]
+
+class Parsed:
+    """Flattened tree as returned by `walker`: one row per node, in pre-order.
+
+    Node attributes are stored in NumPy arrays: `types` (ids from NODE_TYPES),
+    `levels`, `startBytes`, `endBytes`, `rows` (start line), `parents` (-1
+    for the root) and `ends` (position where the subtree of every node ends).
+    For the types in INDEXED_TYPES, `counts` holds how many nodes of that
+    type appear before every position. `functions` flags the nodes that
+    `process` handles as functions (see `_functions`) and `boundaries` the
+    nodes placed directly inside one of the BLOCK_TYPES.
+
+    The columns are array.array buffers that the NumPy arrays share (see
+    `_column`): `walker` fills them a chunk at a time and they are not
+    copied.
+    `nodes` stays a list, as the handlers call the tree-sitter methods of
+    the nodes; it is the only Python object kept per node.
+
+    `parsed[i]` still returns the (level, node) tuple. `preprocessed` is
+    True when a Preprocessor left the dead branches out (see `walker`).
+    The pieces of `walkChunks` give their own `boundaries`: there, nodes
+    whose parent is in an earlier piece have -1 in `parents`.
+    """
+    preprocessed = False
+
+    def __init__(self, levels, nodes, types, startBytes, endBytes, rows, parents,
+                 ends=None, boundaries=None):
+        self.nodes = nodes
+        self._levels = _column(levels, "i")   # its items are plain ints, fast to read
+        self.levels = np.frombuffer(self._levels, dtype=np.int32)
+        self.types = np.frombuffer(_column(types, "i"), dtype=np.int32)
+        self.startBytes = np.frombuffer(_column(startBytes, "q"), dtype=np.int64)
+        self.endBytes = np.frombuffer(_column(endBytes, "q"), dtype=np.int64)
+        self.rows = np.frombuffer(_column(rows, "i"), dtype=np.int32)
+        self.parents = np.frombuffer(_column(parents, "i"), dtype=np.int32)
+        if ends is None:
+            self.ends = self._subtreeEnds()
+        else:
+            self.ends = np.frombuffer(_column(ends, "q"), dtype=np.int64)
+        self.counts = {}
+        for typ in INDEXED_TYPES:
+            self.counts[typ] = np.concatenate(
+                ([0], np.cumsum(self.types == typeId(typ))))
+        self.functions, self.functionReach = self._functions()
+        self._functionList = self.functions.tolist()
+        if boundaries is None:
+            blocks = np.isin(self.types, [typeId(t) for t in BLOCK_TYPES])
+            self.boundaries = (self.parents >= 0) & blocks[np.maximum(self.parents, 0)]
+        else:
+            self.boundaries = np.array(boundaries, dtype=bool)
+
+    def _hasUnder(self, positions, typ):
+        """Vectorized `hasTypeUnder` for an array of positions"""
+        positions = np.minimum(positions, len(self.nodes) - 1)
+        counts = self.counts[typ]
+        return counts[self.ends[positions]] - counts[positions + 1] > 0
+
+    def _functions(self):
+        """Flags the nodes that start a function, in one vectorized pass:
+        function declarators and definitions, declarations holding a
+        cast_expression, field declarations holding a parameter_list and the
+        type nodes followed by an identifier or a call on their line.
+
+        Also returns, for every node, the last position read to decide (see
+        TrackedParsed).
+        """
+        n = len(self.nodes)
+        types, rows = self.types, self.rows
+        functions = np.isin(types, [T_FUNCTION_DECLARATOR, T_FUNCTION_DEFINITION])
+        reach = np.arange(n, dtype=np.int64)
+        k = np.nonzero(types == T_DECLARATION)[0]
+        functions[k] = self._hasUnder(k + 1, "cast_expression")
+        k = np.nonzero(types == T_FIELD_DECLARATION)[0]
+        functions[k] = self._hasUnder(k + 1, "parameter_list")
+
+        # Type nodes: scanning from the type node, an identifier or a
+        # call_expression shows up before the first node on a later line
+        k = np.nonzero(np.isin(types, [T_TYPE_IDENTIFIER, T_PRIMITIVE_TYPE,
+                                       T_SIZED_TYPE_SPECIFIER]))[0]
+        calls = np.nonzero(np.isin(types, [T_IDENTIFIER, T_CALL_EXPRESSION]))[0]
+        nextCall = np.append(calls, n)[np.searchsorted(calls, k)]
+        nextLine = np.searchsorted(rows, rows[k], side="right")  # rows never decrease
+        following = types[np.minimum(k + 1, n - 1)]
+        functions[k] = ((nextCall <= nextLine) & (nextCall < n) & (k + 1 < n) &
+                        ~np.isin(following, [T_LABELED_STATEMENT, T_STATEMENT_IDENTIFIER,
+                                             T_ERROR]))
+        reach[k] = np.minimum(np.maximum(np.minimum(nextCall, nextLine), k + 1), n - 1)
+        return functions, reach
+
+    def _subtreeEnds(self):
+        n = len(self.nodes)
+        ends = np.full(n, n, dtype=np.int64)
+        levels = self._levels
+        stack = []
+        for i in range(n):
+            level = levels[i]
+            while stack and levels[stack[-1]] >= level:
+                ends[stack.pop()] = i
+            stack.append(i)
+        return ends
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __getitem__(self, i):
+        return self._levels[i], self.nodes[i]
+
+    def __iter__(self):
+        return zip(self._levels, self.nodes)
+
+    def isFunction(self, i):
+        """True if node i starts a function (looked up in `functions`)"""
+        return self._functionList[i]
+
+    def span(self, i):
+        """(first line, start byte, end byte) of the declaration holding node
+        i: its nearest ancestor (or itself) in `boundaries`"""
+        boundaries, parents = self.boundaries, self.parents
+        while i > 0 and not boundaries[i] and parents[i] >= 0:
+            i = parents[i]
+        return int(self.rows[i]) + 1, int(self.startBytes[i]), int(self.endBytes[i])
+
+    def positions(self, typ):
+        """Positions of all the nodes of type `typ`"""
+        return np.nonzero(self.types == typeId(typ))[0]
+
+    def find(self, startByte, endByte, typ, level):
+        """Position of the node with that byte range, type id and level, or
+        None"""
+        startBytes = self.startBytes
+        i = int(np.searchsorted(startBytes, startByte))
+        while i < len(startBytes) and startBytes[i] == startByte:
+            if self.endBytes[i] == endByte and self.types[i] == typ and \
+               self._levels[i] == level:
+                return i
+            i += 1
+        return None
+
+WALK_CHUNK = 4096
+
+def _flush(columns, chunk):
+    """Moves the values in the `chunk` lists to the end of the array.array
+    `columns`. Appending to a list is much faster than to an array.array,
+    and NumPy converts the lists faster than `extend`."""
+    for column, values in zip(columns, chunk):
+        column.frombytes(np.array(values, dtype=column.typecode).tobytes())
+        values.clear()
+
+def _column(values, typecode):
+    """`values` as an array.array of `typecode` (itself if it is one already)"""
+    if type(values) is array.array and values.typecode == typecode:
+        return values
+    if type(values) is np.ndarray:
+        return array.array(typecode, values.astype(typecode).tobytes())
+    return array.array(typecode, values)
+
+def walker(cursor, skipBodies=False, preprocessor=None):
+    """Follows all nodes in the structure.
+
+    It iterates with the tree cursor (`goto_first_child`,
+    `goto_next_sibling`, `goto_parent`) instead of recursing, so neither
+    deep nesting nor the creation of the children lists slow it down.
+    The nodes come out in pre-order, as a recursion over the children lists
+    would give them.
+
+    With `skipBodies` (signatures-only mode), the nodes in PRUNED_TYPES are
+    kept as leaves: their byte range is there (`funcDecl` still reads the
+    body) but nothing inside them is visited.
+
+    With a Preprocessor (already `start`ed for the header), the bodies of
+    the `#if`/`#ifdef`/`#elif`/`#else` branches that are not taken are left
+    out: they are not visited and `process` writes their CONDITION/IF/ELSE
+    with an empty block.
+    """
+    pruned = set(typeId(t) for t in PRUNED_TYPES) if skipBodies else ()
+    if preprocessor is not None:
+        return _preprocessedWalk(cursor.node, pruned, preprocessor)
+    level = 0
+    nodes = []
+    # levels, types, startBytes, endBytes, rows, parents, ends
+    columns = [array.array(t) for t in "iiqqiiq"]
+    endsColumn = columns[-1]
+    # The values go to short lists first, moved to the columns every
+    # WALK_CHUNK nodes (see `_flush`)
+    chunk = [[] for _ in columns]
+    levels, types, startBytes, endBytes, rows, parents, ends = chunk
+    base = 0     # position of the first node in `chunk`
+    stack = []   # positions of the nodes from the root to the current node
+    while True:
+        node = cursor.node
+        position = len(nodes)
+        if position - base == WALK_CHUNK:
+            _flush(columns, chunk)
+            base = position
+        parents.append(stack[-1] if stack else -1)
+        stack.append(position)
+        ends.append(0)
+        levels.append(level)
+        nodes.append(node)
+        typ = typeId(node.type)
+        types.append(typ)
+        startBytes.append(node.start_byte)
+        endBytes.append(node.end_byte)
+        rows.append(node.start_point[0])
+
+        if typ not in pruned and cursor.goto_first_child():
+            level += 1
+            continue
+
+        # No children: move to the next sibling, going up when needed
+        while True:
+            position = stack.pop()
+            if position >= base:
+                ends[position - base] = len(nodes)
+            else:
+                endsColumn[position] = len(nodes)
+            if level == 0:
+                _flush(columns, chunk)
+                levels, types, startBytes, endBytes, rows, parents, ends = columns
+                return Parsed(levels, nodes, types, startBytes, endBytes,
+                              rows, parents, ends)
+            if cursor.goto_next_sibling():
+                break
+            cursor.goto_parent()
+            level -= 1
+
+def rewalk(cursor, previous, edit, dirty, rowShift):
+    """`walker` for a tree parsed again from the tree that `previous` (a
+    Parsed) was walked from, once `edit` ((start, old end, new end) bytes)
+    was applied to it.
+
+    Only the subtrees touching the edit or the `dirty` byte ranges are
+    walked. The rows of the others are copied from `previous`, their bytes
+    shifted by the size change of the edit and their lines by `rowShift`
+    when they come after it. In `nodes`, only the root of a copied subtree
+    is there: the other nodes are None until TrackedParsed looks them up.
+    """
+    start, oldEnd, newEnd = edit
+    delta = newEnd - oldEnd
+    nodes = []
+    # levels, types, startBytes, endBytes, rows, parents, ends
+    parts = [[] for _ in range(7)]
+    walked = [[] for _ in range(6)]
+    levels, types, startBytes, endBytes, rows, parents = walked
+    run = None     # [first row in `previous`, rows, position, byte shift, line shift]
+    fixes = []     # (position, parent, end) of the nodes walked and of the copied roots
+
+    def flush():
+        """Moves the rows walked, then the run copied, to `parts`"""
+        nonlocal run
+        if levels:
+            for values, column in zip(parts, walked):
+                values.append(np.array(column, dtype=np.int64))
+                column.clear()
+            parts[6].append(np.zeros(len(parts[0][-1]), dtype=np.int64))
+        if run is not None:
+            j, n, position, shift, lines = run
+            k = slice(j, j + n)
+            for values, column in zip(parts, [previous.levels[k], previous.types[k],
+                                              previous.startBytes[k] + shift,
+                                              previous.endBytes[k] + shift,
+                                              previous.rows[k] + lines,
+                                              previous.parents[k] - j + position,
+                                              previous.ends[k] - j + position]):
+                values.append(column)
+            run = None
+
+    level = 0
+    stack = []
+    while True:
+        node = cursor.node
+        position = len(nodes)
+        typ = typeId(node.type)
+        a, b = node.start_byte, node.end_byte
+        j = None
+        if level > 0 and (b < start or a > newEnd) and \
+           not any(a <= dEnd and dStart <= b for dStart, dEnd in dirty):
+            shift, lines = (delta, rowShift) if a > newEnd else (0, 0)
+            j = previous.find(a - shift, b - shift, typ, level)
+        if j is None:
+            if run is not None:
+                flush()
+            parents.append(stack[-1] if stack else -1)
+            levels.append(level)
+            types.append(typ)
+            startBytes.append(a)
+            endBytes.append(b)
+            rows.append(node.start_point[0])
+            nodes.append(node)
+            stack.append(position)
+            if cursor.goto_first_child():
+                level += 1
+                continue
+        else:
+            n = int(previous.ends[j]) - j
+            if run is not None and (run[0] + run[1], run[2] + run[1], run[3]) != (j, position, shift):
+                flush()
+            if levels:
+                flush()
+            if run is None:
+                run = [j, 0, position, shift, lines]
+            run[1] += n
+            nodes.append(node)
+            nodes.extend([None] * (n - 1))
+            stack.append(position)
+
+        # No children (or copied): move to the next sibling, going up when needed
+        while True:
+            position = stack.pop()
+            fixes.append((position, stack[-1] if stack else -1, len(nodes)))
+            if level == 0:
+                flush()
+                columns = [np.concatenate(values) for values in parts]
+                positions, fixedParents, fixedEnds = (list(values) for values in zip(*fixes))
+                columns[5][positions] = fixedParents
+                columns[6][positions] = fixedEnds
+                levels, types, startBytes, endBytes, rows, parents, ends = columns
+                return Parsed(levels, nodes, types, startBytes, endBytes,
+                              rows, parents, ends)
+            if cursor.goto_next_sibling():
+                break
+            cursor.goto_parent()
+            level -= 1
+
+# Nodes that a piece of `walkChunks` may end inside of: cutting any other
+# node would hide part of its subtree from `Parsed._functions`
+CUT_TYPES = BLOCK_TYPES + ["class_specifier", "struct_specifier", "union_specifier",
+                           "namespace_definition", "linkage_specification"]
+
+def walkChunks(cursor, skipBodies=False, chunkSize=4096, margin=1024):
+    """`walker` that yields the tree in pieces of about `chunkSize` nodes.
+
+    Every piece is a (parsed, start, cut) triple: `parsed` holds the root
+    and the nodes from where the previous piece was cut, which start at
+    position `start`; the nodes up to `cut` belong to this piece. Pieces
+    are only cut before a declaration boundary whose ancestors are all in
+    CUT_TYPES (or a whole declaration right in the ERROR root of a header
+    that does not parse), so a declaration is never split, nor an #if
+    condition or a parameter list that a handler reads on into. The
+    `margin` nodes after the cut (and at least the rest of the line of the
+    cut) are included too, since the handlers look a few nodes ahead; they
+    come again at the start of the next piece. When the handlers need more than that,
+    `send(True)` returns the same piece with twice the margin (None, and
+    the walk ends, once the piece holds the rest of the tree).
+    `levels` are the levels in the whole tree; `parents` and `ends` are
+    positions in the piece (`ends` stops at the end of the piece for the
+    nodes that go on).
+
+    Only the nodes of a piece (and its margin) are kept at a time: the
+    memory does not grow with the size of the header but with the size of
+    its largest declaration (see `processChunks`).
+    """
+    pruned = set(typeId(t) for t in PRUNED_TYPES) if skipBodies else ()
+    blocks = set(typeId(t) for t in BLOCK_TYPES)
+    containers = set(typeId(t) for t in CUT_TYPES)
+    levels = []
+    nodes = []
+    types = []
+    startBytes = []
+    endBytes = []
+    rows = []
+    parents = []
+    ends = []
+    boundaries = []
+    offset = 0       # position in the whole tree of the first node kept
+    cut = None       # position where the current piece ends
+    cuts = collections.deque()   # where the next pieces may end
+    stack = []       # (position, type, cut before) of the nodes from the root to the current node
+    opaque = 0       # nodes in `stack` but the root that are not in CUT_TYPES
+    holding = None   # end byte of the condition of the last #if
+    seeking = None   # end byte of the declaration or parameters of the last function
+    functionTypes = set([T_FUNCTION_DECLARATOR, T_FUNCTION_DEFINITION, T_DECLARATION,
+                         T_FIELD_DECLARATION, T_TYPE_IDENTIFIER, T_PRIMITIVE_TYPE,
+                         T_SIZED_TYPE_SPECIFIER])
+    parameterTypes = set(typeId(t) for t in ["parameter_list", "parenthesized_expression",
+                                             "cast_expression", "argument_list"])
+    # When the header does not parse, the root may be an ERROR: the whole
+    # declarations right in it can be cut before too
+    declarations = set(typeId(t) for t in ["declaration", "type_definition",
+                                           "function_definition", "template_declaration",
+                                           "comment", "preproc_def", "preproc_function_def",
+                                           "preproc_include", "preproc_call", "preproc_if",
+                                           "preproc_ifdef"])
+
+    def piece(size, cut):
+        """(parsed, start, cut) for the first `size` nodes kept"""
+        nodeParents = [p - offset if p >= offset else -1 for p in parents[:size]]
+        nodeEnds = [min(e - offset, size) if e else size for e in ends[:size]]
+        values = [levels[:size], nodes[:size], types[:size], startBytes[:size],
+                  endBytes[:size], rows[:size], nodeParents, nodeEnds, boundaries[:size]]
+        if offset == 0:
+            return Parsed(*values), 0, cut
+        # The root goes first, as the handlers expect
+        nodeParents[:] = [p + 1 if p >= 0 else -1 for p in nodeParents]
+        nodeEnds[:] = [e + 1 for e in nodeEnds]
+        for k, value in enumerate([0, root, rootType, 0, root.end_byte, 0, -1,
+                                   size + 1, False]):
+            values[k].insert(0, value)
+        return Parsed(*values), 1, cut - offset + 1
+
+    def enclosingEnd(node, typ, cutBefore):
+        """End byte of the parameter list or declaration `node` is in (its
+        own end when it is right in one of the CUT_TYPES)"""
+        if cutBefore or typ in parameterTypes:
+            return node.end_byte
+        for position, t, cutBefore in reversed(stack):
+            if t in containers or position == 0:
+                break
+            if t in parameterTypes or cutBefore:
+                return nodes[position - offset].end_byte
+        return node.end_byte
+
+    def drop(k):
+        for values in (levels, nodes, types, startBytes, endBytes, rows, parents,
+                       ends, boundaries):
+            del values[:k]
+
+    root = cursor.node
+    rootType = typeId(root.type)
+    level = 0
+    need = margin    # nodes wanted after the cut
+    while True:
+        node = cursor.node
+        typ = typeId(node.type)
+        position = offset + len(nodes)
+        if stack:
+            parent, parentType, _ = stack[-1]
+            boundary = parentType in blocks
+            cutBefore = boundary or (parent == 0 and parentType == T_ERROR and
+                                     typ in declarations)
+        else:
+            parent, boundary, cutBefore = -1, False, False
+        # Some handlers read on: `_processIf` to the end of the #if
+        # condition and `getFunction` to the parameters. No cut until the
+        # condition, and the parameter list or declaration of the last
+        # function, are over.
+        if holding is not None and node.start_byte >= holding:
+            holding = None
+        if seeking is not None and node.start_byte >= seeking:
+            seeking = None
+        if cutBefore and not opaque and holding is None and seeking is None:
+            cuts.append(position)
+        if typ == T_PREPROC_IF:
+            condition = node.child_by_field_name("condition")
+            if condition is not None:
+                holding = max(holding or 0, condition.end_byte)
+        if typ in functionTypes:
+            seeking = max(seeking or 0, enclosingEnd(node, typ, cutBefore))
+        while cut is None and cuts:
+            k = cuts.popleft()
+            if k - offset >= chunkSize:
+                cut = k
+        parents.append(parent)
+        ends.append(0)   # not known yet
+        levels.append(level)
+        nodes.append(node)
+        types.append(typ)
+        startBytes.append(node.start_byte)
+        endBytes.append(node.end_byte)
+        rows.append(node.start_point[0])
+        boundaries.append(boundary)
+        stack.append((position, typ, cutBefore))
+        if typ not in containers and position:
+            opaque += 1
+
+        if cut is not None and len(nodes) >= cut - offset + need \
+                and node.start_point[0] > rows[cut - offset - 1]:
+            if (yield piece(len(nodes), cut)):
+                need = 2 * need + 1
+            else:
+                drop(cut - offset)
+                offset, cut, need = cut, None, margin
+
+        if typ not in pruned and cursor.goto_first_child():
+            level += 1
+            continue
+
+        # No children: move to the next sibling, going up when needed
+        while True:
+            position, typ, _ = stack.pop()
+            if typ not in containers and position:
+                opaque -= 1
+            if position >= offset:
+                ends[position - offset] = offset + len(nodes)
+            if level == 0:
+                # Every piece left holds the rest of the tree: no growing
+                if cut is not None:
+                    if (yield piece(len(nodes), cut)):
+                        yield None
+                        return
+                    drop(cut - offset)
+                    offset = cut
+                if (yield piece(len(nodes), offset + len(nodes))):
+                    yield None
+                return
+            if cursor.goto_next_sibling():
+                break
+            cursor.goto_parent()
+            level -= 1
+
+def _preprocessedWalk(root, pruned, pp):
+    """`walker` with a Preprocessor: the same traversal over the children
+    lists, leaving out the bodies of the branches not taken"""
+    source, filename = pp.source, pp.filename
+    conditionals = set(typeId(t) for t in CONDITIONAL_TYPES)
+    nodes = []
+    # levels, types, startBytes, endBytes, rows, parents, ends (as in `walker`)
+    columns = [array.array(t) for t in "iiqqiiq"]
+    endsColumn = columns[-1]
+    chunk = [[] for _ in columns]
+    levels, types, startBytes, endBytes, rows, parents, ends = chunk
+    base = 0     # position of the first node in `chunk`
+    dead = set()   # ids of the nodes left out
+    # Frames: [position, children, next child, directives applied?]
+    frames = [[-1, [root], 0, True]]
+    while frames:
+        frame = frames[-1]
+        parent, children, k, certain = frame
+        if k == len(children):
+            frames.pop()
+            if parent >= base:
+                ends[parent - base] = len(nodes)
+            elif parent >= 0:
+                endsColumn[parent] = len(nodes)
+            continue
+        frame[2] = k + 1
+        node = children[k]
+        if dead and node.id in dead:
+            continue
+        typ = typeId(node.type)
+        decided = True
+        if typ in conditionals:
+            bodies = pp.deadBodies(node, source)
+            if bodies is None:
+                decided = False   # the defines inside are not trusted
+            else:
+                pp.pruned += len(bodies)
+                dead.update(c.id for c in bodies)
+        elif certain and typ in _DIRECTIVE_TYPES:
+            pp.directive(node, source, filename)
+
+        position = len(nodes)
+        if position - base == WALK_CHUNK:
+            _flush(columns, chunk)
+            base = position
+        parents.append(parent)
+        ends.append(position + 1)
+        levels.append(len(frames) - 1)
+        nodes.append(node)
+        types.append(typ)
+        startBytes.append(node.start_byte)
+        endBytes.append(node.end_byte)
+        rows.append(node.start_point[0])
+        if typ not in pruned and node.child_count > 0:
+            frames.append([position, node.children, 0, certain and decided])
+    _flush(columns, chunk)
+    levels, types, startBytes, endBytes, rows, parents, ends = columns
+    parsed = Parsed(levels, nodes, types, startBytes, endBytes, rows, parents, ends)
+    parsed.preprocessed = True
+    return parsed
+
+class Source:
+    """Bytes of a header, memory-mapped when they come from a file.
+
+    `source[a:b]` is a memoryview over the bytes (nothing is copied) and
+    `text(a, b)` the decoded, stripped text. The handlers read the same
+    nodes several times, so the last `cacheSize` texts are kept.
+    """
+    def __init__(self, data, cacheSize=256):
+        self.data = data
+        self.view = memoryview(data)
+        self.cacheSize = cacheSize
+        self._texts = {}
+        self._mmap = None
+
+    @classmethod
+    def open(cls, filename, cacheSize=256):
+        with open(filename, "rb") as fp:
+            try:
+                data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError: # empty file
+                return cls(b"", cacheSize)
+        if data.find(b"\r") != -1:
+            # Same newlines as a file opened in text mode
+            txt = data[:].replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+            data.close()
+            return cls(txt, cacheSize)
+        source = cls(data, cacheSize)
+        source._mmap = data
+        return source
+
+    def __len__(self):
+        return len(self.view)
+
+    def __getitem__(self, key):
+        return self.view[key]
+
+    def find(self, sub, start=0, end=None):
+        if end is None:
+            end = len(self.view)
+        return self.data.find(sub, start, end)
+
+    def text(self, start, end):
+        key = (start, end)
+        try:
+            return self._texts[key]
+        except KeyError:
+            pass
+        txt = str(self.view[start:end], "utf-8").strip()
+        if len(self._texts) >= self.cacheSize:
+            del self._texts[next(iter(self._texts))] # oldest
+        self._texts[key] = txt
+        return txt
+
+    def close(self):
+        self._texts = {}
+        self.view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
 def read(data, node):
+    """Stripped text of `node`; `data` is a Source or the bytes of the header"""
+    if type(data) is Source:
+        return data.text(node.start_byte, node.end_byte)
     return data[node.start_byte:node.end_byte].decode("utf-8").strip()
 
 def cleanInclude(name):
@@ -68,13 +742,518 @@ def cleanInclude(name):
     return name
 
 def get_includes(parsed, data):
-    includes = []
-    for level, node in parsed:
-        if node.type == "preproc_include":
-            for i in node.children:
-                if i.type in ["system_lib_string", "string_literal"]:
-                    includes.append(read(data,i))
-    return includes
+    root = parsed.nodes[0]
+    includes = getQuery("includes").captures(root)
+    if parsed.preprocessed:
+        # Only the includes of the branches taken
+        kept = set(parsed.startBytes[parsed.types == T_PREPROC_INCLUDE].tolist())
+        includes = [(node, name) for node, name in includes if node.parent.start_byte in kept]
+    return [read(data, node) for node, _ in includes]
+
+# Tree-sitter queries: the matching runs in C and Python only assembles the
+# captures. Used by `get_includes` and `extract`.
+QUERY_PATTERNS = {
+    "includes": """
+        (preproc_include [(system_lib_string) (string_literal)] @include)
+    """,
+    "defines": """
+        (preproc_def name: (identifier) @name value: (preproc_arg)? @value) @define
+        (preproc_function_def name: (identifier) @name parameters: (preproc_params) @params
+                              value: (preproc_arg)? @value) @funcDefine
+    """,
+    "functions": """
+        (function_declarator declarator: (_) @name parameters: (parameter_list) @params) @function
+        (parameter_declaration type: (_) @type declarator: (_)? @declarator) @param
+        (optional_parameter_declaration type: (_) @type declarator: (_)? @declarator
+                                        default_value: (_) @default) @param
+    """,
+    "typedefs": """
+        (type_definition type: (_) @type declarator: (_) @declarator) @typedef
+        (alias_declaration name: (_) @declarator type: (_) @type) @typedef
+    """,
+}
+
+_queries = {}
+
+def getQuery(name):
+    """Returns the query `name` of QUERY_PATTERNS, compiled once per process"""
+    try:
+        return _queries[name]
+    except KeyError:
+        _queries[name] = CPP_LANGUAGE.query(QUERY_PATTERNS[name])
+        return _queries[name]
+
+# Nodes that may hold a function declaration (what `extract` reports)
+FUNCTION_OWNERS = ["declaration", "field_declaration", "function_definition"]
+# Declarators wrapped around a name, with the qualifier they add
+DECLARATOR_QUALIFIERS = {"pointer_declarator": "*", "abstract_pointer_declarator": "*",
+                         "reference_declarator": "&", "abstract_reference_declarator": "&"}
+
+def _innerDeclarator(node):
+    """Strips pointer/reference declarators: returns (node, qualifiers)"""
+    qualifiers = []
+    while node is not None and node.type in DECLARATOR_QUALIFIERS:
+        qualifiers.append(DECLARATOR_QUALIFIERS[node.type])
+        inner = node.child_by_field_name("declarator")
+        if inner is None and node.named_child_count > 0:
+            inner = node.named_children[-1]   # reference_declarator has no field
+        node = inner
+    return node, qualifiers
+
+def _extractParam(data, captures):
+    param = captures["param"]
+    typeNode = captures["type"]
+    declarator, qualifier = _innerDeclarator(captures.get("declarator"))
+    _id = "-nil-"
+    if declarator is not None and declarator.type == "identifier":
+        _id = read(data, declarator)
+    for child in param.children:
+        if child.type == "type_qualifier":
+            qualifier.insert(0, read(data, child))
+    default = captures.get("default")
+    return Param(_id, read(data, typeNode), read(data, default) if default else None,
+                 qualifier, typeNode.type == "primitive_type")
+
+def _extractFunction(data, captures, params):
+    """Function for the captures of a function_declarator, or None when the
+    declarator is not a function (function pointers, typedefs, parameters)"""
+    declarator = captures["function"]
+    if captures["name"].type == "parenthesized_declarator":
+        return None
+    owner = declarator.parent
+    returnQualifiers = []
+    while owner is not None and owner.type in DECLARATOR_QUALIFIERS:
+        returnQualifiers.append(DECLARATOR_QUALIFIERS[owner.type])
+        owner = owner.parent
+    if owner is None or owner.type not in FUNCTION_OWNERS:
+        return None
+
+    f = Function(id=read(data, captures["name"]))
+    f.params = params.get(captures["params"].id, [])
+    for child in owner.children:
+        if child.type in ["storage_class_specifier", "virtual_function_specifier",
+                          "explicit_function_specifier", "virtual"]:
+            f.qualifiers.append(read(data, child))
+        elif child.type == "type_qualifier":
+            returnQualifiers.insert(0, read(data, child))
+    for child in declarator.children:
+        if child.type == "type_qualifier":
+            f.qualifiers.append(read(data, child))
+    returnType = owner.child_by_field_name("type")
+    if returnType is not None:
+        f.returnType = read(data, returnType)
+    f.returnQualifiers = returnQualifiers
+    body = owner.child_by_field_name("body")
+    if body is not None:
+        f.funcDecl = read(data, body)
+
+    node = owner.parent
+    while node is not None:
+        if node.type in ["class_specifier", "struct_specifier"]:
+            name = node.child_by_field_name("name")
+            if name is not None:
+                f.classes.insert(0, read(data, name))
+        node = node.parent
+    if f.classes:
+        f.owner = f.classes[-1]
+    return f
+
+def extract(source, filename=None, kept=None):
+    """Includes, defines and function signatures of a header (bytes or a
+    Source), found with tree-sitter queries instead of `process`.
+
+    Returns a flat TranslationUnit of Include, Define, FuncDefine and
+    Function entities in the order they appear. It is much faster than
+    `convert` when only the signatures matter, but it does not report
+    preprocessor conditions, comments, typedefs or declarations. With
+    `kept`, the start bytes of the nodes a preprocessed `walker` kept, the
+    entities of the branches not taken are left out.
+    """
+    if type(source) is not Source:
+        source = Source(source)
+    root = getParser().parse(source.view, keep_text=False).root_node
+    found = []   # (node the entity comes from, entity)
+
+    for node, _ in getQuery("includes").captures(root):
+        found.append((node, Include(0, read(source, node))))
+
+    defines = {}
+    for node, name in getQuery("defines").captures(root):
+        if name in ["define", "funcDefine"]:
+            defines[node.id] = {name: node}
+        else:
+            defines[node.parent.id][name] = node
+    for captures in defines.values():
+        value = captures.get("value")
+        value = read(source, value) if value else None
+        if "define" in captures:
+            found.append((captures["define"],
+                          Define(0, read(source, captures["name"]), value)))
+        else:
+            params = [read(source, n) for n in captures["params"].named_children
+                      if n.type == "identifier"]
+            found.append((captures["funcDefine"],
+                          FuncDefine(read(source, captures["name"]), params, value)))
+
+    functions = {}
+    paramCaptures = {}
+    for node, name in getQuery("functions").captures(root):
+        if name == "function":
+            functions[node.id] = {name: node}
+        elif name == "param":
+            paramCaptures[node.id] = {name: node}
+        elif name in ["name", "params"]:
+            functions[node.parent.id][name] = node
+        else:
+            paramCaptures[node.parent.id][name] = node
+    params = {}   # parameter_list id -> [Param]
+    for captures in paramCaptures.values():
+        params.setdefault(captures["param"].parent.id, []).append(
+            _extractParam(source, captures))
+    for captures in functions.values():
+        f = _extractFunction(source, captures, params)
+        if f is not None:
+            found.append((captures["function"], f))
+
+    if kept is not None:
+        found = [(node, entity) for node, entity in found if node.start_byte in kept]
+    found.sort(key=lambda x: x[0].start_byte)
+    unit = TranslationUnit(filename)
+    idx = 0
+    for node, entity in found:
+        entity.span = (node.start_point[0] + 1, node.start_byte, node.end_byte)
+        if type(entity) is not FuncDefine:
+            entity.idx = idx
+            idx += 1
+        unit.add(entity)
+        if type(entity) is Include:
+            unit.includes.append(entity.value)
+    return unit
+
+
+class IncludeResolver:
+    """Finds the file that an include (as returned by `get_includes`) refers to.
+
+    Quoted includes are looked for in the folder of the including header and
+    then in `includePaths` (like `-I`); `<...>` includes only in
+    `includePaths`. Every (folder, name) lookup hits the filesystem once.
+    """
+    def __init__(self, includePaths=()):
+        self.includePaths = [os.path.abspath(p) for p in includePaths]
+        self._cache = {}
+
+    def lookup(self, folder, name):
+        key = (folder, name)
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        path = os.path.join(folder, name)
+        path = os.path.realpath(path) if os.path.isfile(path) else None
+        self._cache[key] = path
+        return path
+
+    def resolve(self, include, fromFile):
+        """Returns the real path of `include` or None if it is not found"""
+        if include[0] not in ['"', '<'] or include[-1] not in ['"', '>']:
+            return None
+        name = include[1:-1]
+        folders = self.includePaths
+        if include[0] == '"':
+            folders = [os.path.dirname(os.path.abspath(fromFile))] + folders
+        for folder in folders:
+            path = self.lookup(folder, name)
+            if path != None:
+                return path
+        return None
+
+def readIncludes(filename):
+    """Parses `filename` and returns its includes (as `get_includes` does,
+    with the includes query alone: no node table is built)"""
+    with Source.open(filename) as source:
+        root = getParser().parse(source.view, keep_text=False).root_node
+        return [read(source, node) for node, _ in getQuery("includes").captures(root)]
+
+def includeGraph(filenames, includePaths=(), resolver=None):
+    """Follows the includes of `filenames` through the whole include tree.
+
+    Returns `(graph, order)`. `graph` maps the real path of every header
+    found to the headers it includes. `order` lists every header once, after
+    all the headers it includes. Include cycles are reported and the edge
+    closing the cycle is left out of `order`.
+    """
+    if resolver is None:
+        resolver = IncludeResolver(includePaths)
+    graph = {}
+    pending = [os.path.realpath(f) for f in reversed(filenames)]
+    while pending:
+        filename = pending.pop()
+        if filename in graph:
+            continue
+        graph[filename] = deps = []
+        try:
+            includes = readIncludes(filename)
+        except FileNotFoundError:
+            print("ERROR: File not found: ", filename)
+            continue
+        for incl in includes:
+            path = resolver.resolve(incl, filename)
+            if path != None and path not in deps:
+                deps.append(path)
+                pending.append(path)
+
+    # Topological order (iterative depth first search)
+    order = []
+    state = {}   # 1: being visited, 2: done
+    for root in graph:
+        if root in state:
+            continue
+        state[root] = 1
+        stack = [(root, iter(graph[root]))]
+        while stack:
+            filename, deps = stack[-1]
+            for dep in deps:
+                if state.get(dep) == 1:
+                    print("WARNING: include cycle: ", filename, "->", dep)
+                elif dep not in state:
+                    state[dep] = 1
+                    stack.append((dep, iter(graph.get(dep, []))))
+                    break
+            else:
+                state[filename] = 2
+                order.append(filename)
+                stack.pop()
+    return graph, order
+
+
+# ---------- Preprocessor
+CONDITIONAL_TYPES = ["preproc_if", "preproc_ifdef"]
+# Directives applied by `Preprocessor.directive`
+_DIRECTIVE_TYPES = set(typeId(t) for t in ["preproc_def", "preproc_function_def",
+                                           "preproc_call", "preproc_include"])
+BRANCH_TYPES = ["preproc_elif", "preproc_else"]
+# Nodes that may hold directives seen by `Preprocessor.scan`
+DIRECTIVE_OWNERS = ["translation_unit", "declaration_list", "namespace_definition",
+                    "linkage_specification", "field_declaration_list",
+                    "class_specifier", "struct_specifier"]
+_INTEGER = re.compile(r"(0[xX][0-9a-fA-F]+|\d+)[uUlL]*")
+_BINARY = {"+": lambda a, b: a + b, "-": lambda a, b: a - b, "*": lambda a, b: a * b,
+           "/": lambda a, b: int(a / b) if b else None,
+           "%": lambda a, b: a % b if b else None,
+           "<<": lambda a, b: a << b if 0 <= b < 64 else None,
+           ">>": lambda a, b: a >> b if 0 <= b < 64 else None,
+           "&": lambda a, b: a & b, "|": lambda a, b: a | b, "^": lambda a, b: a ^ b,
+           "==": lambda a, b: int(a == b), "!=": lambda a, b: int(a != b),
+           "<": lambda a, b: int(a < b), ">": lambda a, b: int(a > b),
+           "<=": lambda a, b: int(a <= b), ">=": lambda a, b: int(a >= b)}
+_UNARY = {"!": lambda a: int(not a), "-": lambda a: -a, "~": lambda a: ~a, "+": lambda a: a}
+
+def _integer(text):
+    """Value of the C integer literal `text`, or None"""
+    m = _INTEGER.fullmatch(text)
+    if m is None:
+        return None
+    digits = m.group(1)
+    if digits[:2] in ["0x", "0X"]:
+        return int(digits, 16)
+    try:
+        return int(digits, 8) if len(digits) > 1 and digits[0] == "0" else int(digits)
+    except ValueError:   # 08, 09: not a valid octal literal
+        return None
+
+_includedTrees = {}   # path -> (mtime, size, Source, tree)
+
+def _parseIncluded(path, maxSize=512):
+    """(Source, tree) of a header scanned by Preprocessor. The same headers
+    are included by most files of a batch, so the last `maxSize` are kept
+    (while their mtime and size do not change)."""
+    st = os.stat(path)
+    cached = _includedTrees.get(path)
+    if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2:]
+    with open(path, "rb") as fp:
+        source = Source(fp.read().replace(b"\r\n", b"\n"))
+    tree = getParser().parse(source.view, keep_text=False)
+    if len(_includedTrees) >= maxSize:
+        del _includedTrees[next(iter(_includedTrees))]
+    _includedTrees[path] = (st.st_mtime_ns, st.st_size, source, tree)
+    return source, tree
+
+def parseDefines(items):
+    """{name: value} for `-D` style items: NAME (value 1) or NAME=VALUE"""
+    defines = {}
+    for item in items:
+        name, _, value = item.partition("=")
+        defines[name.strip()] = value.strip() if _ else "1"
+    return defines
+
+class Preprocessor:
+    """Decides which branch of every `#if`/`#ifdef` is taken, for `walker`.
+
+    `defines` ({name: value}, see `parseDefines`) are the macros given on
+    the command line; the `#define`/`#undef` found while walking are added,
+    as well as those of the headers included on the way (found as
+    `IncludeResolver` does, each header scanned once). Conditions may use
+    `defined()`, integer literals, macros with integer values and the C
+    operators. A condition that cannot be decided (a function-like macro, a
+    macro that is not an integer...) keeps the whole conditional, and the
+    defines inside it are not trusted.
+
+    `start(source, filename)` binds it to the header about to be walked.
+    """
+    MAX_DEPTH = 32   # nested macro values followed by `value`
+
+    def __init__(self, defines=None, includePaths=()):
+        self.macros = dict(defines or {})
+        self.includes = IncludeResolver(includePaths)
+        self.source = None
+        self.filename = None
+        self._scanned = set()
+        self.pruned = 0   # branches left out
+
+    def start(self, source, filename=None):
+        self.source = source
+        self.filename = filename
+        if filename is not None:
+            self._scanned.add(os.path.realpath(filename))
+        return self
+
+    def value(self, name, depth=0):
+        """Integer value of the macro `name` (0 if it is not defined), or
+        None when it is not an integer"""
+        if name not in self.macros:
+            return 0
+        text = self.macros[name]
+        value = _integer(text)
+        if value is None and depth < self.MAX_DEPTH and re.fullmatch(r"[A-Za-z_]\w*", text):
+            return self.value(text, depth + 1)
+        return value
+
+    def evaluate(self, node, source):
+        """Value of the condition `node`, or None if it cannot be decided"""
+        typ = node.type
+        if typ == "number_literal":
+            return _integer(read(source, node))
+        if typ == "identifier":
+            return self.value(read(source, node))
+        if typ == "preproc_defined":
+            for child in node.children:
+                if child.type == "identifier":
+                    return int(read(source, child) in self.macros)
+            return None
+        if typ == "parenthesized_expression" and node.named_child_count == 1:
+            return self.evaluate(node.named_children[0], source)
+        if typ == "unary_expression" and node.child_count == 2:
+            op = _UNARY.get(node.children[0].type)
+            a = self.evaluate(node.children[1], source)
+            return None if op is None or a is None else op(a)
+        if typ == "binary_expression" and node.child_count == 3:
+            left, op, right = node.children
+            a = self.evaluate(left, source)
+            if op.type == "&&" and a == 0 or op.type == "||" and a not in [0, None]:
+                return int(a != 0)
+            b = self.evaluate(right, source)
+            if op.type in ["&&", "||"]:
+                if b is not None and (b == 0) == (op.type == "&&"):
+                    return int(b != 0)   # decided by the right side
+                return None if a is None or b is None else int(bool(b))
+            if a is None or b is None or op.type not in _BINARY:
+                return None
+            return _BINARY[op.type](a, b)
+        if typ == "conditional_expression" and node.named_child_count == 3:
+            c, a, b = node.named_children
+            c = self.evaluate(c, source)
+            if c is None:
+                return None
+            return self.evaluate(a if c else b, source)
+        return None
+
+    @staticmethod
+    def _branches(node):
+        """(branch, children of its body) for the conditional `node` and its
+        #elif/#else"""
+        while node is not None:
+            children = node.children
+            if node.type == "preproc_else":
+                yield node, children[1:]
+                return
+            yield node, [c for c in children[2:]
+                         if c.type not in BRANCH_TYPES and c.type not in ["\n", "#endif"]]
+            alternative = [c for c in children[2:] if c.type in BRANCH_TYPES]
+            node = alternative[0] if alternative else None
+
+    def _taken(self, node, source):
+        children = node.children
+        if node.type == "preproc_else":
+            return True
+        if node.type == "preproc_ifdef":
+            defined = read(source, children[1]) in self.macros
+            return defined if children[0].type == "#ifdef" else not defined
+        return self.evaluate(children[1], source)
+
+    def branch(self, node, source):
+        """The children of the branch of the conditional `node` that is taken
+        ([] when none is), or None when it cannot be decided"""
+        for b, body in self._branches(node):
+            taken = self._taken(b, source)
+            if taken is None:
+                return None
+            if taken:
+                return body
+        return []
+
+    def deadBodies(self, node, source):
+        """The children of the branches of the conditional `node` that are
+        not taken, or None when it cannot be decided"""
+        dead = []
+        found = False
+        for b, body in self._branches(node):
+            if not found:
+                taken = self._taken(b, source)
+                if taken is None:
+                    return None
+                if taken:
+                    found = True
+                    continue
+            dead.extend(body)
+        return dead
+
+    def directive(self, node, source, filename):
+        """Applies the #define, #undef or #include `node`"""
+        typ = node.type
+        if typ in ["preproc_def", "preproc_function_def"]:
+            name = node.child_by_field_name("name")
+            value = node.child_by_field_name("value")
+            if typ == "preproc_function_def":
+                value = None   # only its definedness matters
+            self.macros[read(source, name)] = read(source, value) if value else ""
+        elif typ == "preproc_call":
+            directive = node.child_by_field_name("directive")
+            argument = node.child_by_field_name("argument")
+            if read(source, directive) == "#undef" and argument is not None:
+                self.macros.pop(read(source, argument), None)
+        elif typ == "preproc_include" and filename is not None:
+            path = node.child_by_field_name("path")
+            if path is not None:
+                path = self.includes.resolve(read(source, path), filename)
+            if path is not None and path not in self._scanned:
+                self._scanned.add(path)
+                included, tree = _parseIncluded(path)
+                self.scan(tree.root_node.children, included, path)
+
+    def scan(self, nodes, source, filename):
+        """Applies the directives in `nodes` (and under them) that are not in
+        a dead branch"""
+        for node in nodes:
+            typ = node.type
+            if typ in CONDITIONAL_TYPES:
+                body = self.branch(node, source)
+                if body is not None:
+                    self.scan(body, source, filename)
+            elif typ.startswith("preproc_"):
+                self.directive(node, source, filename)
+            elif typ in DIRECTIVE_OWNERS:
+                self.scan(node.children, source, filename)
 
 
 def genComment(data, node):
@@ -93,139 +1272,262 @@ def genComment(data, node):
             _tmp = "'" + _tmp + "'"
     return _tmp
 
-directives        = [ "#ifndef", "#ifdef", 
-                      "#if", "#else", "#elif", "#endif", 
-                      "#define", "#include"]
-logical_operators = ["||", "&&", "!"]
-symbols           = ["[", "]", "{", "}", "=", "...", "*"]
-
-reinit = ["preproc_def", "preproc_include", "preproc_call", "declaration",
-          "preproc_if", "preproc_elif", "preproc_else", "preproc_function_def",
-          "preproc_ifdef", "comment"]
-
-excluded = ['', 'ERROR', "translation_unit", "#ifndef", "#ifdef", "preproc_call",
-            "preproc_if", "preproc_elif", "preproc_else", "preproc_include", 
-            "preproc_def", "preproc_ifdef"
-]
-
 def getChidrenTypes(node):
     l = []
     for n in node.children:
         l.append(n.type)    
     return l
 
-def getAllTypesUnder(parsed, i):
+def hasTypeUnder(parsed, i, typ):
+    """True if a node of type `typ` is found under the node at position `i`"""
     if i == 0:
-        return []
-    level,node = parsed[i]
-    lst = []
-    while True:
-        i += 1
-        l,n = parsed[i]
-        if l <= level:
-            break
-        else:
-            lst.append(n.type)
-    #print(lst)
-    return lst
+        return False
+    if typ in parsed.counts:
+        lst = parsed.counts[typ]
+        return lst[parsed.ends[i]] - lst[i+1] > 0
+    return bool(np.any(parsed.types[i+1:parsed.ends[i]] == typeId(typ)))
 #def checkNextType(node,i)
 #def condition(node):
 
-def isCallExpression(parsed, i):
-    line = parsed[i][1].start_point[0]
-    try:
-        if parsed[i+1][1].type in ["labeled_statement", "statement_identifier", "ERROR"]:
-            return False
-
-        if not parsed[i][1].type in ["type_identifier", "primitive_type", "sized_type_specifier"]:
-            return False
-        #j = i
-        while True:
-            if parsed[i][1].type in ["identifier", "call_expression"]:
-                return True
-            if parsed[i][1].start_point[0] > line:
-                break
-            i += 1           
-        return False
-    except:
-        return False
-
-def gotoNext(typ, parsed, i):
-    while True:
-        i += 1
-        try:
-            if parsed[i][1].type in ["parameter_list", "parenthesized_expression", "cast_expression", "argument_list"]:
-                break
-        except:
-            break
-    return i
-
-
-def addFunction(data, indent, currentClass, generalQualifier):
-    tmp = ""
+# ---------- IR
+# What `process` finds in a header. Every entity keeps `level`, the
+# indentation level at which it starts in the YAML; TranslationUnit uses it
+# to nest the entities under the Condition and Block entities. `span` is
+# (first line, start byte, end byte) of the declaration it comes from.
+
+@dataclass(slots=True)
+class Param:
+    id: str = None
+    type: str = None
+    default: str = None
+    qualifier: list = field(default_factory=list)
+    isPrimitive: bool = False
+
+@dataclass(slots=True)
+class Function:
+    idx: int = 0
+    id: str = None
+    qualifiers: list = field(default_factory=list)       # explicit, inline, const
+    returnType: str = None
+    returnQualifiers: list = field(default_factory=list)
+    params: list = field(default_factory=list)           # Param
+    funcDecl: str = None                                 # inline body
+    classes: list = field(default_factory=list)          # enclosing classes and bases
+    access: list = field(default_factory=list)           # public, private, protected
+    owner: str = None                                    # class whose body holds it
+    level: int = 0
+    span: tuple = None
+
+@dataclass(slots=True)
+class Define:
+    idx: int
+    id: str
+    arg: str = None
+    level: int = 0
+    span: tuple = None
+
+@dataclass(slots=True)
+class FuncDefine:
+    id: str
+    params: list = None          # None when the macro has no parameter list
+    definition: str = None
+    level: int = 0
+    span: tuple = None
+
+@dataclass(slots=True)
+class Condition:
+    """#ifdef/#ifndef (kind "defined"/"not_defined", `expression` is the
+    macro), #if (kind "if", `expression` is the raw condition), #elif and
+    #else"""
+    idx: int
+    kind: str
+    expression: str = None
+    block: list = field(default_factory=list)
+    level: int = 0
+    span: tuple = None
+
+@dataclass(slots=True)
+class Defined:
+    id: str
+    level: int = 0
+    span: tuple = None
+
+@dataclass(slots=True)
+class Typedef:
+    idx: int
+    id: str = None
+    funcDecl: str = None
+    qualifiers: list = field(default_factory=list)
+    level: int = 0
+    span: tuple = None
+
+@dataclass(slots=True)
+class Class:
+    """Forward declaration of a class, or the definition of a class or
+    struct (`isForwardDecl` False, no idx, only seen by the sinks: the YAML
+    leaves it out)"""
+    idx: int
+    id: str
+    base: str = None
+    isForwardDecl: bool = True
+    level: int = 0
+    span: tuple = None
+
+@dataclass(slots=True)
+class Declaration:
+    idx: int
+    id: str
+    type: str
+    qualifiers: list = field(default_factory=list)
+    level: int = 0
+    span: tuple = None
+
+@dataclass(slots=True)
+class Comment:
+    text: str
+    isMultiline: bool = False
+    level: int = 0
+    span: tuple = None
+
+@dataclass(slots=True)
+class Include:
+    idx: int
+    value: str
+    level: int = 0
+    span: tuple = None
+
+@dataclass(slots=True)
+class Extern:
+    idx: int
+    value: str
+    level: int = 0
+    span: tuple = None
+
+@dataclass(slots=True)
+class Block:
+    """Body of a class"""
+    block: list = field(default_factory=list)
+    level: int = 0
+    span: tuple = None
+
+CONTAINERS = (Condition, Block)
+
+@dataclass(slots=True)
+class TranslationUnit:
+    """Entities of a header, as returned by `convert`.
+
+    `items` holds the top-level entities; the ones found inside a Condition
+    or a Block are in its `block`. `add` is the sink used by `process`.
+    """
+    filename: str = None
+    includes: list = field(default_factory=list)
+    items: list = field(default_factory=list)
+    _stack: list = field(default_factory=list, repr=False, compare=False)
+
+    def add(self, entity):
+        stack = self._stack
+        while stack and stack[-1].level >= entity.level:
+            stack.pop()
+        if stack:
+            stack[-1].block.append(entity)
+        else:
+            self.items.append(entity)
+        if isinstance(entity, CONTAINERS):
+            stack.append(entity)
+
+    def entities(self):
+        """All the entities, in the order they appear in the header"""
+        stack = list(reversed(self.items))
+        while stack:
+            entity = stack.pop()
+            yield entity
+            if isinstance(entity, CONTAINERS):
+                stack.extend(reversed(entity.block))
+
+    def toYaml(self, out=None):
+        """Writes the YAML (as `process` does) into the Emitter `out`.
+
+        When `out` is not given, the YAML is returned as a string.
+        """
+        if out is None:
+            out = Emitter()
+            self.toYaml(out)
+            return out.getvalue()
+        writer = YamlWriter(out)
+        for entity in self.entities():
+            writer.add(entity)
+
+def addFunction(data, indent, currentClass, generalQualifier, out=None):
+    """Writes the YAML for the Function `data` into the Emitter `out`.
+
+    When `out` is not given, the YAML is returned as a string.
+    """
+    if out is None:
+        out = Emitter()
+        addFunction(data, indent, currentClass, generalQualifier, out)
+        return out.getvalue()
+    write = out.write
     _indent = indent.get()   
-    tmp += f"{_indent}- function:\n"
+    write(f"{_indent}- function:\n")
     _indent = indent.inc()  
-    tmp += f'{_indent}idx: {data["idx"]}\n'
+    write(f'{_indent}idx: {data.idx}\n')
 
-    if len(data["qualifiers"]) > 0:
-        tmp += f"{_indent}funcQualifier:\n"
+    if len(data.qualifiers) > 0:
+        write(f"{_indent}funcQualifier:\n")
         _indent = indent.inc()   
-        for q in data["qualifiers"]:
-            tmp += f"{_indent}- {q}\n"
+        for q in data.qualifiers:
+            write(f"{_indent}- {q}\n")
         _indent = indent.dec() 
 
-    if data["return"] != None:
-        tmp += f'{_indent}return: {data["return"]}\n'
-    if len(data["returnQualifiers"]) > 0:
-        tmp += f"{_indent}returnQualifiers:\n" 
+    if data.returnType != None:
+        write(f'{_indent}return: {data.returnType}\n')
+    if len(data.returnQualifiers) > 0:
+        write(f"{_indent}returnQualifiers:\n")
         _indent = indent.inc()   
-        for q in data["returnQualifiers"]:
-            tmp += f"{_indent}- {q}\n" 
+        for q in data.returnQualifiers:
+            write(f"{_indent}- {q}\n")
         _indent = indent.dec()  
-    tmp += f'{_indent}id: {data["id"]}\n'
+    write(f'{_indent}id: {data.id}\n')
 
     if len(currentClass) > 0:
-        tmp += f'{_indent}class:\n'
+        write(f'{_indent}class:\n')
         _indent = indent.inc()
         for c in currentClass:
-            tmp += f'{_indent}- {c}\n'
+            write(f'{_indent}- {c}\n')
         _indent = indent.dec()
 
     if len(generalQualifier) > 0:
-        tmp += f'{_indent}qualifiers:\n'
+        write(f'{_indent}qualifiers:\n')
         _indent = indent.inc()
         for q in generalQualifier:
-            tmp += f'{_indent}- {q}\n'
+            write(f'{_indent}- {q}\n')
         _indent = indent.dec()
 
-    if len(data["params"]) > 0:
-        tmp += f"{_indent}params:\n"
+    if len(data.params) > 0:
+        write(f"{_indent}params:\n")
         _indent = indent.inc()           
-        for p in data["params"]:
-            tmp += f'{_indent}- {p["id"]}:\n'
-            tmp += f'{_indent}  type: {p["type"]}\n'
-            tmp += f'{_indent}  isPrimitive: {p["isPrimitive"]}\n'
-            if p["default"] != None:
-                tmp += f'{_indent}  default: {p["default"]}\n'
-
-            if len(p["qualifier"]) > 0:
-                tmp += f"{_indent}  qualifier:\n"                        
-                for q in p["qualifier"]:
-                    tmp += f"{_indent}  - {q}\n" 
+        for p in data.params:
+            write(f'{_indent}- {p.id}:\n')
+            write(f'{_indent}  type: {p.type}\n')
+            write(f'{_indent}  isPrimitive: {"true" if p.isPrimitive else "false"}\n')
+            if p.default != None:
+                write(f'{_indent}  default: {p.default}\n')
+
+            if len(p.qualifier) > 0:
+                write(f"{_indent}  qualifier:\n")
+                for q in p.qualifier:
+                    write(f"{_indent}  - {q}\n")
         _indent = indent.dec() 
 
     _indent = indent.dec()   
-    if data["funcDecl"] != None:
+    if data.funcDecl != None:
 
-        if "\n" in data["funcDecl"]:
-            tmp += f"{_indent}funcDecl: >\n" 
-            tmp += textwrap.indent(txt, spaces * indent.LEVEL + "  ")
-            tmp += '\n'                        
+        if "\n" in data.funcDecl:
+            write(f"{_indent}funcDecl: >\n")
+            write(textwrap.indent(data.funcDecl, indent.get() + "  "))
+            write('\n')
         else:
-            tmp += f'{_indent}funcDecl: "{_funcDecl}"\n'
-    #
-    return tmp
+            write(f'{_indent}funcDecl: "{data.funcDecl}"\n')
 
 def getParams(data, parsed, i):
     _params = []
@@ -243,13 +1545,11 @@ def getParams(data, parsed, i):
 
 
         if paramType in ["parameter_declaration","optional_parameter_declaration"]:
-            lvl = level
-
             _type      = None
             _id        = None
             _default   = None
             _qualifier = []
-            _isPrimitive = "false"
+            _isPrimitive = False
             _flagOptional = False
 
             # Read all params
@@ -260,7 +1560,7 @@ def getParams(data, parsed, i):
                 if node.type in ["primitive_type", "type_identifier", "sized_type_specifier"] and _type == None:
                     _type = read(data, node)
                     if node.type == "primitive_type":
-                        _isPrimitive = "true"
+                        _isPrimitive = True
                 elif node.type == "const":
                     _qualifier.append("const")
                 elif set(node.type)  == set(["*"]) or set(node.type) == set(["&"]):
@@ -285,85 +1585,42 @@ def getParams(data, parsed, i):
                     _id = '-nil-'
 
                 if node.type in [",", ")"]:
-                    _params.append({ "id": _id, 
-                                     "type":_type,
-                                     "default": _default,
-                                     "qualifier": [],
-                                     "isPrimitive": _isPrimitive
-                                    })
+                    _params.append(Param(_id, _type, _default, [], _isPrimitive))
                     _type      = None
                     _id        = None
                     _default   = None
                     _qualifier = []
-                    _isPrimitive = "false"
+                    _isPrimitive = False
                     _flagOptional = False
                     if node.type == ")":
                         break
     return _params, i
 
-def isFunction(data, parsed, i):
-    line = parsed[i][1].start_point[0]    
-    typ = parsed[i][1].type
-    #if line > 294:
-        #print("isFunction>>>", line, typ)
-    if typ in ["function_declarator", "function_definition"]:
-        #print("True1")
-        return True
-    elif typ == "declaration":
-        #print("True2")        
-        for k in ["cast_expression"]:
-            if  k in getAllTypesUnder(parsed, i+1):             
-                return True
-    elif typ == "field_declaration":
-        #print("True3")        
-        for k in ["parameter_list"]:
-            if  k in getAllTypesUnder(parsed, i+1):
-                
-                return True
-    elif isCallExpression(parsed, i):
-        #print("True4")         
-        for k in ["type_identifier", "primitive_type", "sized_type_specifier"]:
-            if k == parsed[i][1].type:
-               
-                return True
-        #return True
-    #print("5")
-    #if line > 294:
-    #    print("###", line, typ)
-    return False
-
-
 def getFunction(data, parsed, i, idx, isFriend ):
 
     level, node = parsed[i]
     line = node.start_point[0]
 
     checkFuncDecl = False
-    if "compound_statement" in getAllTypesUnder(parsed, i):
+    if hasTypeUnder(parsed, i, "compound_statement"):
         checkFuncDecl = True
 
     # Check if the function defines an operator
     k = re.compile("operator[ ]*([\*\=\+\-\,\<\>\|\&\/\%\^\!\~\(\)\[\]]{1,3})[ ]*")
-    _tmp = read(data,node)
     _operator = None
-    if "operator " in _tmp:
+    # Look for it in the bytes: the node may include a whole inline body
+    if data.find(b"operator ", node.start_byte, node.end_byte) != -1:
+        _tmp = read(data,node)
         _res = k.findall(_tmp)
         if len(_res) == 1:
             _operator = "`" + _res[0] + "`"
 
-    _data = {"idx" : idx,
-             "id": None,
-             "qualifiers": [],
-             "return": None,
-             "returnQualifiers": [],
-             "params" : [],
-             "funcDecl": None
-             }
+    _data = Function(idx)
 
     # isExplicit
     functionQualifiers = []
     if "explicit_function_specifier" in getChidrenTypes(node):
-        _data["qualifiers"].append("explicit")
+        _data.qualifiers.append("explicit")
         i += 1
         _, n = parsed[i]
         assert n.type == "explicit_function_specifier"
@@ -379,9 +1636,11 @@ def getFunction(data, parsed, i, idx, isFriend ):
     _return = None
     while not node.type in ["function_declarator", "field_identifier", "cast_expression", "expression_statement"]:
         if node.type in ["type_identifier", "sized_type_specifier", "primitive_type"] and _return == None:
-            _data["return"] = read(data, node)
+            _data.returnType = read(data, node)
+        elif node.type == "inline":
+            _data.qualifiers.append("inline")
         elif set(node.type) == set(["&"]):
-            _data["returnQualifiers"].append(node.type)
+            _data.returnQualifiers.append(node.type)
         i += 1
         level, node = parsed[i]            
         if node.start_point[0] > line:
@@ -389,22 +1648,23 @@ def getFunction(data, parsed, i, idx, isFriend ):
 
     # Get function name
     if node.type in ["function_declarator", "field_identifier", "cast_expression"]: 
+        declarator = i if node.type == "function_declarator" else None
         # Get the function name
         while True:
             i += 1
             level, node = parsed[i]
             #print("->", i, parsed[i][1].start_point[0])
-            if node.type in ["identifier", "field_identifier", "destructor_name", "expression_statement"] and _data["id"] == None:
-                _data["id"] = read(data, node)
-                if _data["id"] == "operator":
+            if node.type in ["identifier", "field_identifier", "destructor_name", "expression_statement"] and _data.id == None:
+                _data.id = read(data, node)
+                if _data.id == "operator":
                     i += 1
                     level, node = parsed[i]
-                    _data["id"] = "`" + _operator + "`"
+                    _data.id = "`" + _operator + "`"
                 break
             elif node.type == "inline":
-                data["qualifiers"].append("inline")  
+                _data.qualifiers.append("inline")
             elif node.type == "const":
-                data["qualifiers"].append("const")                                      
+                _data.qualifiers.append("const")
             elif node.type in ["function_definition", "compound_statement", 
                                 "(",")", "{", "}"]:
                 pass
@@ -416,9 +1676,15 @@ def getFunction(data, parsed, i, idx, isFriend ):
             i += 1                   
 
         # Read the params
-        #i = gotoNext("parameter_list", parsed, i)
         _params, i = getParams(data, parsed, i)
-        _data["params"] = _params
+        _data.params = _params
+
+        # const method: a type_qualifier after the parameters
+        if declarator is not None:
+            for k in range(i + 1, int(parsed.ends[declarator])):
+                if parsed.parents[k] == declarator and parsed[k][1].type == "type_qualifier" \
+                        and read(data, parsed[k][1]) == "const" and "const" not in _data.qualifiers:
+                    _data.qualifiers.append("const")
 
         #compound_statement
         if checkFuncDecl:
@@ -426,7 +1692,7 @@ def getFunction(data, parsed, i, idx, isFriend ):
                 i += 1
                 level, node = parsed[i]
                 if node.type in ["compound_statement", "compound_literal_expression"]:
-                    _data["funcDecl"] = read(data, node)
+                    _data.funcDecl = read(data, node)
                     #_lvl = level
                     break
             #while parsed[i][0] > _lvl:
@@ -439,537 +1705,1829 @@ class Indenter:
     def __init__(self):
         self.spaces = "  "
         self.LEVEL = 0
+        self._cache = [""]   # indentation string for every level seen so far
 
     def inc(self, n= 1):
         self.LEVEL += 1 * n
-        return self.spaces * self.LEVEL
+        return self.get()
 
     def dec(self, n=1):
         self.LEVEL -= 1 * n
-        return self.spaces * self.LEVEL
+        return self.get()
 
     def get(self):
-        return self.spaces * self.LEVEL
-
-
-def log(parsed, data, fromLine=0, n=0):
-    i = 0
-    k = 0
-    #print(parsed)
-    while True:
-        i += 1
-        if parsed[i][1].start_point[0] >= fromLine:
-            k += 1
-            print("==>",parsed[i][1].start_point[0], i,  parsed[i][0], parsed[i][1].type, read(data, parsed[i][1]))
-            if k > n:
-                break
-
-def process(parsed, data, header):
-    indent = Indenter()
-    nested = 0
-    idx = 0
-    tmp = ""
-    i = 0
-    txt = ""
-    levelDelta = 0
-    conditionLevel = 0
-    access = None
-    currentClass = []
-    generalQualifier = set([]) # public, private, protected
-    isFriend = False
-    isFriendLevel = -1
-    #log(parsed, data, 74, 80)
-    #data = []
-    while True:
-        level, node = parsed[i]
-        typ = node.type
-        #print("== ", i, ">>",node.start_point[0],typ, read(data, node)[0:15])
+        if self.LEVEL <= 0:
+            return ""
+        try:
+            return self._cache[self.LEVEL]
+        except IndexError:
+            while len(self._cache) <= self.LEVEL:
+                self._cache.append(self.spaces * len(self._cache))
+            return self._cache[self.LEVEL]
+
+
+class Emitter:
+    """Receives the YAML chunks produced by `process` and `addFunction`.
+
+    Chunks are buffered and flushed into `fp` once `bufferSize` characters
+    have been collected. Without `fp` everything is kept in memory and can be
+    recovered with `getvalue`.
+    """
+    def __init__(self, fp=None, bufferSize=65536):
+        self.fp = fp
+        self.bufferSize = bufferSize
+        self.writeTime = 0.0   # seconds spent writing into `fp`
+        self._chunks = []
+        self._size = 0
+
+    def write(self, txt):
+        self._chunks.append(txt)
+        self._size += len(txt)
+        if self.fp is not None and self._size >= self.bufferSize:
+            self.flush()
+
+    def flush(self):
+        if self.fp is not None:
+            t0 = time.perf_counter()
+            self.fp.write("".join(self._chunks))
+            self.writeTime += time.perf_counter() - t0
+            self._chunks = []
+            self._size = 0
+
+    def getvalue(self):
+        return "".join(self._chunks)
+
+
+class YamlWriter:
+    """Writes IR entities as YAML into the Emitter `out` as they arrive.
+
+    This is the sink `process` uses by default; `TranslationUnit.toYaml`
+    feeds it a whole unit.
+    """
+    def __init__(self, out):
+        self.out = out
+        self.write = out.write
+        self.indent = Indenter()
+        self._writers = {Function: self.function, Define: self.define,
+                         FuncDefine: self.funcDefine, Condition: self.condition,
+                         Defined: self.defined, Typedef: self.typedef, Class: self.klass,
+                         Declaration: self.declaration, Comment: self.comment,
+                         Include: self.include, Extern: self.extern, Block: self.block}
+
+    @staticmethod
+    def header(filename):
+        """First line of the file written for the header `filename`"""
+        return f"- filename: {filename}\n"
+
+    def add(self, entity):
+        self.indent.LEVEL = entity.level
+        self._writers[type(entity)](entity)
+
+    def function(self, f):
+        addFunction(f, self.indent, f.classes, f.access, self.out)
+
+    def define(self, d):
+        indent, write = self.indent, self.write
+        write(f'{indent.get()}- define:\n')
+        _indent = indent.inc()
+        write(f'{_indent}idx: {d.idx}\n')
+        write(f'{_indent}id: {d.id}\n')
+        _indent = indent.dec()
+        if d.arg != None:
+            write(f'{_indent}arg: {d.arg}\n')
 
-        if typ in ["labeled_statement"]:
-            pass
-        
-        elif level <= conditionLevel and conditionLevel != 0:
-            conditionLevel = 0
+    def funcDefine(self, d):
+        indent, write = self.indent, self.write
+        write(f"{indent.get()}- funcDefine:\n")
+        _indent = indent.inc()
+        write(f"{_indent}id: {d.id}\n")
+        if d.params != None:
+            write(f"{_indent}params:\n")
+            _indent = indent.inc()
+            for p in d.params:
+                write(f"{_indent}- {p}\n")
             _indent = indent.dec()
-            tmp += f'{_indent}block:\n'
+            if d.definition != None:
+                write(f"{_indent}definition: '{d.definition}'\n")
+
+    def condition(self, c):
+        indent, write = self.indent, self.write
+        _indent = indent.get()
+        if c.kind in ["defined", "not_defined"]:
+            write(f'{_indent}- CONDITION:\n')
             _indent = indent.inc()
-
-        # Dealing with directives
-        if typ in ["#ifndef", "#ifdef"]:
-            i += 1
-            level, node = parsed[i]
-            typ2 = node.type
-            assert typ2 == "identifier"
-
-            _indent = indent.get()
-            tmp += f'{_indent}- CONDITION:\n'
+            write(f'{_indent}{c.kind}: {c.expression}\n')
+            write(f'{_indent}idx: {c.idx}\n')
+            write(f'{_indent}block:\n')
+        elif c.kind == "if":
+            write(f'{_indent}- IF:\n')
             _indent = indent.inc()
-            key = "defined"
-            if typ == "#ifndef":
-                key = "not_defined"
-            tmp += f'{_indent}{key}: {read(data,node)}\n'
-            tmp += f'{_indent}idx: {idx}\n'
-            idx += 1
-            tmp += f'{_indent}block:\n'            
+            write(f'{_indent}raw: {c.expression}\n')
+            write(f'{_indent}idx: {c.idx}\n')
+            write(f'{_indent}block:\n')
+        else:
+            write(f'{_indent}- {c.kind.upper()}:\n')
             _indent = indent.inc()
+            write(f'{_indent}idx: {c.idx}\n')
 
-        elif typ == "#endif":
-            _indent = indent.dec(2)
-
-        elif typ == "preproc_directive":
-            val = read(data,node)
-            if val == "#endif":
-                _indent = indent.dec(2)
-            else:
-                print("WARNING: not covered: preproc_directive:", val)
-
-        elif typ == "preproc_if":
-            _LEVEL = indent.LEVEL
-
-            level, node = parsed[i]
-            _lvl = level
-            checkLevel = level           
-            typ2 = node.type
-            assert typ2 == "#if"  
-            _indent = indent.inc()                     
-            tmp += f'{_indent}- IF:\n'
-            _indent = indent.inc()
-            #----
-            i += 1
-            tmp += f'{_indent}raw: {read(data, parsed[i][1])}\n'    
-            tmp += f'{_indent}idx: {idx}\n'
-            idx += 1            
-            # Find first "binary_expression"
-            while parsed[i][1].type != "binary_expression":
-                i += 1
-            _lvl = parsed[i][0] + 1
-            i += 1
-            while parsed[i][0] >= _lvl:
-                i += 1
-            #    i += 1
-            tmp += f'{_indent}block:\n' 
-            _indent = indent.inc()
+    def defined(self, d):
+        self.write(f'{self.indent.get()}- isDefined: {d.id}\n')
 
-        elif typ == "preproc_elif":
-            i += 1
-            level, node = parsed[i]
-            typ2 = node.type
-            assert typ2 == "#elif"
-            _indent = indent.dec(2)                      
-            tmp += f'{_indent}- ELIF:\n'
-            #LEVEL += 1
+    def typedef(self, t):
+        indent, write = self.indent, self.write
+        write(f'{indent.get()}- typedef:\n')
+        _indent = indent.inc()
+        write(f'{_indent}idx: {t.idx}\n')
+        if t.id != None:
+            write(f'{_indent}id: {t.id}\n')
+        if t.funcDecl != None:
+            write(f'{_indent}funcDecl: {t.funcDecl}\n')
+        for q in t.qualifiers:
             _indent = indent.inc()
-            tmp += f'{_indent}idx: {idx}\n'
-            idx += 1            
-
-        elif typ == "preproc_else":
-            i += 1
-            level, node = parsed[i]
-            typ2 = node.type
-            assert typ2 == "#else"  
-            _indent = indent.dec(2)                   
-            tmp += f'{_indent}- ELSE:\n'
-            _indent = indent.inc() 
-            tmp += f'{_indent}idx: {idx}\n'
-            idx += 1            
-
-        elif typ == "preproc_include":
-            # get key
-            i += 1
-            level, node = parsed[i]
-            typ2 = node.type
-            assert typ2 == "#include"
-            #_key = "include"
-            
-            # get value
-            i += 1
-            level, node = parsed[i]
-            typ2 = node.type
-            assert typ2 in ["system_lib_string", "string_literal"]
-            _value = read(data,node)
-            _indent = indent.get() 
-            tmp += f'{_indent}- include: {_value}\n'            
+            write(f'{_indent}qualifiers:\n')
             _indent = indent.inc()
-            tmp += f'{_indent}idx: {idx}\n'
-            idx += 1
-            _indent = indent.dec()
-        
-        elif typ == "preproc_def":
-            i += 1
-            level, node = parsed[i]
-            typ2 = node.type
-            assert typ2 == "#define"
-            _indent = indent.get()            
-            tmp += f'{_indent}- define:\n' 
-
-            i += 1
-            level, node = parsed[i]
-            typ2 = node.type
-            assert typ2 == "identifier"
-            _indent = indent.inc()  
-            tmp += f'{_indent}idx: {idx}\n'
-            idx += 1                         
-            tmp += f'{_indent}id: {read(data,node)}\n'
-            _indent = indent.dec()             
-
-            level, node = parsed[i+1]
-            typ2 = node.type
-            if typ2 == "preproc_arg":
-                i += 1
-                tmp += f'{_indent}arg: {read(data,node)}\n'
-        
-        # extern "C"{
-        elif typ == "extern" and parsed[i+1][1].type == "string_literal": # Four different behaviours depending on context
-            i += 1
-            level, node = parsed[i]
-
-            typ2 = node.type            
-            assert typ2 == "string_literal"            
-            _indent = indent.get() 
-            _txt = read(data,node)
-
-            level, node = parsed[i+1]
-
-            while node.type in ["{", '}', '"']:
-                if node.type != '"':
-                    _txt += node.type
-                i += 1
-                level, node = parsed[i+1]           
-
-            if _txt == '"C"{':
-                tmp += f"{_indent}- extern: '{_txt}'\n"
-                _indent = indent.inc() 
-                tmp += f'{_indent}idx: {idx}\n'
-                idx += 1                  
-                _indent = indent.dec() 
-
-        elif typ == "preproc_function_def":
-            _indent = indent.get() 
-            tmp += f"{_indent}- funcDefine:\n"
-            
-            i += 1
-            level, node = parsed[i]  
-            levelPreproc = level
-            _indent = indent.inc() 
-
-            assert node.type == "#define"
-
-            i += 1
-            level, node = parsed[i]  
-            tmp += f"{_indent}id: {read(data, node)}\n"
-
-            i += 1
-            level, node = parsed[i]
-            if node.type == "preproc_params":
-                tmp += f"{_indent}params:\n"
-
-                _indent = indent.inc()                 
-                while True:
-                    if parsed[i+1][1].type == "preproc_arg" or parsed[i+1][0] <= levelPreproc:  
-                        break
-                    i += 1
-                    level, node = parsed[i]
-                    if node.type == "identifier":
-                        tmp += f"{_indent}- {read(data,node)}\n"
-                _indent = indent.dec()                   
-                i += 1
-                level, node = parsed[i]
-                if node.type == "preproc_arg":
-                    tmp += f"{_indent}definition: '{read(data,node)}'\n"
-
-            _indent = indent.dec()   
-
-
-        elif typ == "friend":
-            isFriend = True
-            isFriendLevel = level            
-
-
-        elif isFunction(data, parsed, i):            
-            _d = getFunction( data, parsed, i, idx, isFriend )
-            idx += 1 
-            isFriend = False
-
-            _tmp = ""
-            if _d != None:
-                _tmp = addFunction(_d, indent, currentClass, generalQualifier)
-
-            tmp += _tmp
-
-        #print("...")
-        elif typ == "comment":
-            isMultiline = False            
-            txt = genComment(data, node)
-
-            if txt[0:2] == "/*" or "\n" in txt:
-                isMultiline = True
-
-            _indent = indent.get()   
-            if isMultiline:
-                tmp += f'{_indent}- comment: >\n'
-                tmp += textwrap.indent(txt, spaces* indent.LEVEL + "  ")
-                tmp += '\n'
-            else:
-                if len(txt) > 0:
-                    if txt[0] != "'" and txt[-1] != "'":
-                        txt = "'" + txt + "'"
-                tmp += f"{_indent}- comment: {txt}\n"
-
-        
-        elif typ == "preproc_defined":
-            _indent = LEVEL * spaces            
-            i += 1
-            level, node = parsed[i]
-            _level = level
-            _type = None
-            assert node.type == "defined"
-            #if :
-            _type = "isDefined"
-
-            _id = None
-            while True:
-                i += 1                  
-                level, node = parsed[i]
-                if node.type == "identifier":
-                    _id = read(data, node)
-                    break
-            tmp += f'{_indent}- {_type}: {_id}\n'            
-
-
-        elif typ == "type_definition":
-            raw = read(data, node)
-            lvl = parsed[i][0]
+            write(f'{_indent}- {q}\n')
+            _indent = indent.dec(2)
 
-            i += 1
-            level, node = parsed[i]
-            
-            _indent = indent.get()
-            assert node.type == "typedef"
-            tmp += f'{_indent}- typedef:\n'
+    def klass(self, c):
+        if not c.isForwardDecl:
+            return
+        indent, write = self.indent, self.write
+        write(f'{indent.get()}- class:\n')
+        _indent = indent.inc()
+        write(f'{_indent}idx: {c.idx}\n')
+        write(f'{_indent}id: {c.id}\n')
+        write(f'{_indent}isForwardDecl: true\n')
+        if c.base != None:
+            write(f'{_indent}base: {c.base}\n')
+
+    def declaration(self, d):
+        indent, write = self.indent, self.write
+        write(f'{indent.get()}- declaration:\n')
+        _indent = indent.inc()
+        write(f'{_indent}idx: {d.idx}\n')
+        write(f'{_indent}id: {d.id}\n')
+        write(f'{_indent}type: {d.type}\n')
+        if len(d.qualifiers) > 0:
+            write(f'{_indent}qualifiers:\n')
             _indent = indent.inc()
-            tmp += f'{_indent}idx: {idx}\n'
-            idx += 1               
-
-
-            if parsed[i+1][1].type == "primitive_type":
-                i += 1
-                level, node = parsed[i]
-                _indent = indent.get()                 
-                tmp += f'{_indent}id: {read(data,node)}\n'
-
-            if parsed[i+1][1].type == "function_declarator":
-                i += 1
-                level, node = parsed[i]
-                _indent = indent.get()               
-                tmp += f'{_indent}funcDecl: {read(data,node)}\n'
-                #tmp += f'{_indent}raw: {raw}\n'
-
-            # Read the remaining stuff (TODO: maybe it could be parsed better if needed)
-            while parsed[i+1][0] > lvl:
-                if parsed[i+1][1].type == "const":
-                    _indent = indent.inc()
-                    tmp += f'{_indent}qualifiers:\n'
-                    _indent = indent.inc()
-                    tmp += f'{_indent}- const\n'
-                    _indent = indent.dec(2)
-                i += 1  
-
-            _indent = indent.dec()
+            for q in d.qualifiers:
+                write(f'{_indent}- {q}\n')
+
+    def comment(self, c):
+        indent, write = self.indent, self.write
+        _indent = indent.get()
+        txt = c.text
+        if c.isMultiline:
+            write(f'{_indent}- comment: >\n')
+            write(textwrap.indent(txt, _indent + "  "))
+            write('\n')
+        else:
+            if len(txt) > 0:
+                if txt[0] != "'" and txt[-1] != "'":
+                    txt = "'" + txt + "'"
+            write(f"{_indent}- comment: {txt}\n")
+
+    def include(self, inc):
+        self.write(f'{self.indent.get()}- include: {inc.value}\n')
+        self.write(f'{self.indent.inc()}idx: {inc.idx}\n')
+
+    def extern(self, e):
+        self.write(f"{self.indent.get()}- extern: '{e.value}'\n")
+        self.write(f'{self.indent.inc()}idx: {e.idx}\n')
+
+    def block(self, b):
+        self.write(f'{self.indent.get()}block:\n')
+
+
+class JsonLinesWriter:
+    """Writes IR entities into the Emitter `out` as JSON Lines.
+
+    Every entity is one object with the keys of its YAML. `entity` gives its
+    kind (the YAML key: function, define, CONDITION, IF, ...), `n` its
+    number (from 0) and `parent` the `n` of the CONDITION/IF/ELIF/ELSE or
+    block that contains it (None at the top level). Optional fields are
+    always present (null or []). `convert` returns the object of an entity
+    without writing it (`out` may be None then).
+    """
+    def __init__(self, out=None):
+        self.out = out
+        self.write = out.write if out is not None else None
+        self.n = 0
+        self._stack = []   # (level, n) of the open containers
+        self._converters = {Function: self.function, Define: self.define,
+                            FuncDefine: self.funcDefine, Condition: self.condition,
+                            Defined: self.defined, Typedef: self.typedef, Class: self.klass,
+                            Declaration: self.declaration, Comment: self.comment,
+                            Include: self.include, Extern: self.extern, Block: self.block}
+
+    @staticmethod
+    def header(filename):
+        """First line of the file written for the header `filename`"""
+        return json.dumps({"entity": "file", "filename": filename}) + "\n"
+
+    def add(self, entity):
+        stack = self._stack
+        while stack and stack[-1][0] >= entity.level:
+            stack.pop()
+        obj = {"n": self.n, "parent": stack[-1][1] if stack else None}
+        obj.update(self.convert(entity))
+        if isinstance(entity, CONTAINERS):
+            stack.append((entity.level, self.n))
+        self.n += 1
+        self.write(json.dumps(obj) + "\n")
+
+    def convert(self, entity):
+        return self._converters[type(entity)](entity)
+
+    def function(self, f):
+        params = [{"id": p.id, "type": p.type, "isPrimitive": p.isPrimitive,
+                   "default": p.default, "qualifier": p.qualifier} for p in f.params]
+        return {"entity": "function", "idx": f.idx, "funcQualifier": f.qualifiers,
+                "return": f.returnType, "returnQualifiers": f.returnQualifiers,
+                "id": f.id, "class": f.classes, "qualifiers": f.access,
+                "params": params, "funcDecl": f.funcDecl}
+
+    def define(self, d):
+        return {"entity": "define", "idx": d.idx, "id": d.id, "arg": d.arg}
+
+    def funcDefine(self, d):
+        return {"entity": "funcDefine", "id": d.id, "params": d.params,
+                "definition": d.definition}
+
+    def condition(self, c):
+        if c.kind in ["defined", "not_defined"]:
+            return {"entity": "CONDITION", "idx": c.idx, c.kind: c.expression}
+        if c.kind == "if":
+            return {"entity": "IF", "idx": c.idx, "raw": c.expression}
+        return {"entity": c.kind.upper(), "idx": c.idx}
+
+    def defined(self, d):
+        return {"entity": "isDefined", "id": d.id}
+
+    def typedef(self, t):
+        return {"entity": "typedef", "idx": t.idx, "id": t.id, "funcDecl": t.funcDecl,
+                "qualifiers": t.qualifiers}
+
+    def klass(self, c):
+        return {"entity": "class", "idx": c.idx, "id": c.id,
+                "isForwardDecl": c.isForwardDecl, "base": c.base}
+
+    def declaration(self, d):
+        return {"entity": "declaration", "idx": d.idx, "id": d.id, "type": d.type,
+                "qualifiers": d.qualifiers}
+
+    def comment(self, c):
+        return {"entity": "comment", "comment": c.text, "isMultiline": c.isMultiline}
+
+    def include(self, inc):
+        return {"entity": "include", "idx": inc.idx, "include": inc.value}
+
+    def extern(self, e):
+        return {"entity": "extern", "idx": e.idx, "extern": e.value}
+
+    def block(self, b):
+        return {"entity": "block"}
+
+# Output formats: name -> (extension, name of the writer)
+FORMATS = {"yaml": (".yaml", "YamlWriter"), "jsonl": (".jsonl", "JsonLinesWriter"),
+           "nim": (".nim", "NimWriter")}
+
+def writerFor(format):
+    """Writer class of `format` (see FORMATS)"""
+    return getattr(sys.modules[__name__], FORMATS[format][1])
+
+
+class Profile:
+    """Optional instrumentation of `parseFile` and `process`.
+
+    `phases` maps every phase of `parseFile` (read, parse, walker, includes,
+    process, write, cache) to the seconds spent; `handlers` maps every branch
+    of `process` (the node type, or function, ignored, unhandled...) to
+    [calls, seconds]. `merge` adds another Profile, so that a single one can
+    aggregate a batch; the report of every file is kept in `files`.
+    """
+    def __init__(self):
+        self.phases = {}
+        self.handlers = {}
+        self.files = {}
+        self._last = None
 
-        # ---------- CLASES
-        elif typ == "field_declaration_list":
-            #_indent = indent.inc()
-            tmp += f'{_indent}block:\n'
-            _indent = indent.inc()                    
+    def start(self):
+        self._last = time.perf_counter()
 
+    def mark(self, phase):
+        """Adds the time since the previous mark (or `start`) to `phase`"""
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._last
+        self._last = now
 
-        elif typ == "class_specifier": # This is for forward declaration
-            _line = parsed[i][1].start_point[0]
-            while True:
-                i += 1
-                if parsed[i][1].type == "type_identifier":
-                    break
-            #_data = {"className": read(data,parsed[i][1])}
-            _className = read(data,parsed[i][1])
-
-            # Continue reading items on the first line (looking for inheritance)
-            _base = None
-            isForwardDecl = False
-            while parsed[i][1].start_point[0] == _line:  
-                i += 1
-                if parsed[i][1].type == "base_class_clause":
-                    _base = read(data, parsed[i][1])
-                if parsed[i][1].type == ";":
-                    isForwardDecl = True
-                    break
-
-            if isForwardDecl:
-                tmp += f'{indent.get()}- class:\n'
-                _indent = indent.inc()       
-                tmp += f'{_indent}idx: {idx}\n'
-                idx += 1                        
-                tmp += f'{_indent}id: {_className}\n'                
-                tmp += f'{_indent}isForwardDecl: true\n'
-                _indent = indent.dec()
-                if _base != None:
-                    _indent = indent.inc()
-                    tmp += f'{_indent}base: {_base}\n'                 
-            else:
-                currentClass.append(_className)
-                if _base != None:
-                    currentClass.append(_base)
+    def addPhase(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
 
+    def addHandler(self, branch, seconds):
+        try:
+            counter = self.handlers[branch]
+            counter[0] += 1
+            counter[1] += seconds
+        except KeyError:
+            self.handlers[branch] = [1, seconds]
+
+    def report(self):
+        return {"phases": dict(self.phases),
+                "handlers": {k: {"calls": v[0], "seconds": v[1]}
+                             for k, v in self.handlers.items()}}
+
+    def merge(self, report, filename=None):
+        """Adds a `report` (as returned by `report`) to the totals"""
+        for phase, seconds in report["phases"].items():
+            self.addPhase(phase, seconds)
+        for branch, v in report["handlers"].items():
+            counter = self.handlers.setdefault(branch, [0, 0.0])
+            counter[0] += v["calls"]
+            counter[1] += v["seconds"]
+        if filename is not None:
+            self.files[filename] = report
+
+    def format(self, nHandlers=15):
+        total = sum(self.phases.values()) or 1e-9
+        lines = ["phases:"]
+        for phase, seconds in sorted(self.phases.items(), key=lambda x: -x[1]):
+            lines.append(f"  {phase:12s} {seconds * 1000:10.1f} ms  {100 * seconds / total:5.1f}%")
+        lines.append("process handlers:")
+        handlers = sorted(self.handlers.items(), key=lambda x: -x[1][1])
+        for branch, (calls, seconds) in handlers[:nHandlers]:
+            lines.append(f"  {branch:28s} {calls:9d} calls {seconds * 1000:10.1f} ms")
+        return "\n".join(lines)
+
+
+class ProcessState:
+    """Variables shared by `process` and its handlers.
+
+    `i` is the position of the current node; handlers that consume the
+    nodes after it move `i` to the last node they used. The entities they
+    find go to `sink` (see `process`).
+    """
+    def __init__(self, parsed, data, sink):
+        self.parsed = parsed
+        self.data = data
+        self.sink = sink
+        self.start = 0   # node that the current handler was called for
+        self.indent = Indenter()
+        self.idx = 0
+        self.i = 0
+        self.conditionLevel = 0
+        self.currentClass = []
+        self.classScopes = []   # (level, name, count in currentClass) of the classes we are in
+        self.generalQualifier = set([]) # public, private, protected
+        self.isFriend = False
+        self.isFriendLevel = -1
+        self._indent = ""
+
+    def add(self, entity):
+        entity.span = self.parsed.span(self.start)
+        self.sink.add(entity)
+
+    def save(self):
+        """Copy of the state but the nodes, the source and the sink (see
+        processChunks)"""
+        return copy.deepcopy({name: value for name, value in vars(self).items()
+                              if name not in ["parsed", "data", "sink"]})
+
+    def load(self, saved):
+        vars(self).update(copy.deepcopy(saved))
+
+    def next(self):
+        """Moves to the next node and returns it as (level, node)"""
+        self.i += 1
+        return self.parsed[self.i]
+
+    def nextIdx(self):
+        idx = self.idx
+        self.idx += 1
+        return idx
+
+    def leaveClasses(self, level):
+        """Pops the classes whose body ends before a node at `level`"""
+        scopes = self.classScopes
+        while scopes and level <= scopes[-1][0]:
+            del self.currentClass[len(self.currentClass) - scopes.pop()[2]:]
+
+    def checkpoint(self):
+        return (self.idx, self.indent.LEVEL, self._indent, self.conditionLevel,
+                tuple(self.currentClass), tuple(self.generalQualifier),
+                self.isFriend, self.isFriendLevel, tuple(self.classScopes))
+
+    def restore(self, state):
+        # generalQualifier is kept (see Segments.visit)
+        (self.idx, self.indent.LEVEL, self._indent, self.conditionLevel, currentClass,
+         _, self.isFriend, self.isFriendLevel, classScopes) = state
+        self.currentClass = list(currentClass)
+        self.classScopes = list(classScopes)
+
+
+# Handlers called by `process`: handler(st, level, node) with the
+# ProcessState `st`. They may return the name under which Profile counts
+# them (by default, the node type).
+
+# Dealing with directives
+def _processIfdef(st, level, node):
+    typ = node.type
+    level, node = st.next()
+    typ2 = node.type
+    assert typ2 == "identifier"
+
+    key = "defined"
+    if typ == "#ifndef":
+        key = "not_defined"
+    st.add(Condition(st.nextIdx(), key, read(st.data,node), level=st.indent.LEVEL))
+    st.indent.inc()
+    st._indent = st.indent.inc()
+
+def _processEndif(st, level, node):
+    st._indent = st.indent.dec(2)
+
+def _processDirective(st, level, node):
+    val = read(st.data,node)
+    if val == "#endif":
+        st._indent = st.indent.dec(2)
+    else:
+        print("WARNING: not covered: preproc_directive:", val)
+
+def _processIf(st, level, node):
+    parsed, indent = st.parsed, st.indent
+    level, node = st.next()
+    typ2 = node.type
+    assert typ2 == "#if"  
+    indent.inc()
+    #----
+    i = st.i + 1
+    st.add(Condition(st.nextIdx(), "if", read(st.data, parsed[i][1]), level=indent.LEVEL))
+    indent.inc()
+    # Find first "binary_expression" of the condition
+    n = int(parsed.ends[i])
+    while i < n and parsed[i][1].type != "binary_expression":
+        i += 1
+    if i == n:
+        # None (#if X, #if defined(X)): skip the condition only
+        st.i = n
+        st._indent = indent.inc()
+        return
+    _lvl = parsed[i][0] + 1
+    i += 1
+    while parsed[i][0] >= _lvl:
+        i += 1
+    st.i = i
+    st._indent = indent.inc()
+
+def _processElif(st, level, node):
+    level, node = st.next()
+    typ2 = node.type
+    assert typ2 == "#elif"
+    st.indent.dec(2)
+    st.add(Condition(st.nextIdx(), "elif", level=st.indent.LEVEL))
+    st._indent = st.indent.inc()
+
+def _processElse(st, level, node):
+    level, node = st.next()
+    typ2 = node.type
+    assert typ2 == "#else"  
+    st.indent.dec(2)
+    st.add(Condition(st.nextIdx(), "else", level=st.indent.LEVEL))
+    st._indent = st.indent.inc()
+
+def _processInclude(st, level, node):
+    # get key
+    level, node = st.next()
+    typ2 = node.type
+    assert typ2 == "#include"
+    
+    # get value
+    level, node = st.next()
+    typ2 = node.type
+    assert typ2 in ["system_lib_string", "string_literal"]
+    st.add(Include(st.nextIdx(), read(st.data,node), level=st.indent.LEVEL))
+    st._indent = st.indent.get()
+
+def _processDefine(st, level, node):
+    level, node = st.next()
+    typ2 = node.type
+    assert typ2 == "#define"
+
+    level, node = st.next()
+    typ2 = node.type
+    assert typ2 == "identifier"
+    define = Define(st.nextIdx(), read(st.data,node), level=st.indent.LEVEL)
+
+    level, node = st.parsed[st.i+1]
+    typ2 = node.type
+    if typ2 == "preproc_arg":
+        st.i += 1
+        define.arg = read(st.data,node)
+    st.add(define)
+    st._indent = st.indent.get()
+
+# extern "C"{
+def _processExtern(st, level, node):
+    parsed = st.parsed
+    if parsed[st.i+1][1].type != "string_literal": # Four different behaviours depending on context
+        return _processUnhandled(st, level, node)
+    level, node = st.next()
+
+    typ2 = node.type            
+    assert typ2 == "string_literal"            
+    _txt = read(st.data,node)
+
+    level, node = parsed[st.i+1]
+
+    while node.type in ["{", '}', '"']:
+        if node.type != '"':
+            _txt += node.type
+        st.i += 1
+        level, node = parsed[st.i+1]           
+
+    if _txt == '"C"{':
+        st.add(Extern(st.nextIdx(), _txt, level=st.indent.LEVEL))
+    st._indent = st.indent.get()
+
+def _processFuncDefine(st, level, node):
+    parsed, data = st.parsed, st.data
+    level, node = st.next()
+    levelPreproc = level
+
+    assert node.type == "#define"
+
+    level, node = st.next()
+    define = FuncDefine(read(data, node), level=st.indent.LEVEL)
+
+    level, node = st.next()
+    if node.type == "preproc_params":
+        define.params = []
+        while True:
+            if parsed[st.i+1][1].type == "preproc_arg" or parsed[st.i+1][0] <= levelPreproc:  
+                break
+            level, node = st.next()
+            if node.type == "identifier":
+                define.params.append(read(data,node))
+        level, node = st.next()
+        if node.type == "preproc_arg":
+            define.definition = read(data,node)
+    st.add(define)
+    st._indent = st.indent.get()
+
+def _processFriend(st, level, node):
+    st.isFriend = True
+    st.isFriendLevel = level            
+
+def _processFunction(st, level, node):
+    _d = getFunction( st.data, st.parsed, st.i, st.idx, st.isFriend )
+    st.idx += 1 
+    st.isFriend = False
+
+    if _d != None:
+        _d.classes = list(st.currentClass)
+        if st.classScopes:
+            _d.owner = st.classScopes[-1][1]
+        _d.access = list(st.generalQualifier)
+        _d.level = st.indent.LEVEL
+        st.add(_d)
+    return "function"
+
+def _processComment(st, level, node):
+    txt = genComment(st.data, node)
+    isMultiline = txt[0:2] == "/*" or "\n" in txt
+    st.add(Comment(txt, isMultiline, level=st.indent.LEVEL))
+    st._indent = st.indent.get()
+
+def _processDefined(st, level, node):
+    level, node = st.next()
+    assert node.type == "defined"
+
+    _id = None
+    while True:
+        level, node = st.next()
+        if node.type == "identifier":
+            _id = read(st.data, node)
+            break
+    st.add(Defined(_id, level=st.indent.LEVEL))
+    st._indent = st.indent.get()
+
+def _processTypedef(st, level, node):
+    parsed, data = st.parsed, st.data
+    lvl = level
+
+    level, node = st.next()
+    assert node.type == "typedef"
+    typedef = Typedef(st.nextIdx(), level=st.indent.LEVEL)
+
+    if parsed[st.i+1][1].type == "primitive_type":
+        level, node = st.next()
+        typedef.id = read(data,node)
+
+    if parsed[st.i+1][1].type == "function_declarator":
+        level, node = st.next()
+        typedef.funcDecl = read(data,node)
+
+    # Read the remaining stuff (TODO: maybe it could be parsed better if needed)
+    while parsed[st.i+1][0] > lvl:
+        if parsed[st.i+1][1].type == "const":
+            typedef.qualifiers.append("const")
+        st.i += 1  
+
+    st.add(typedef)
+    st._indent = st.indent.get()
+
+# ---------- CLASES
+def _processFieldDeclarationList(st, level, node):
+    st.add(Block(level=len(st._indent) // len(st.indent.spaces)))
+    st._indent = st.indent.inc()                    
+
+def _processClass(st, level, node): # This is for forward declaration
+    parsed, data = st.parsed, st.data
+    _line = node.start_point[0]
+    i = st.i
+    while True:
+        i += 1
+        if parsed[i][1].type == "type_identifier":
+            break
+    _className = read(data,parsed[i][1])
 
-        elif typ in ["access_specifier", "statement_identifier"]:  
-            _access = read(data, node)
-            _access = _access.replace(":", "")            
-            if "protected" in generalQualifier:
-                generalQualifier.remove("protected")
-            if "private" in generalQualifier:
-                generalQualifier.remove("private")
-            if "public" in generalQualifier:
-                generalQualifier.remove("public")
+    # Continue reading items on the first line (looking for inheritance)
+    _base = None
+    isForwardDecl = False
+    while parsed[i][1].start_point[0] == _line:  
+        i += 1
+        if parsed[i][1].type == "base_class_clause":
+            _base = read(data, parsed[i][1])
+        if parsed[i][1].type == ";":
+            isForwardDecl = True
+            break
+    st.i = i
+
+    if isForwardDecl:
+        st.add(Class(st.nextIdx(), _className, _base, level=st.indent.LEVEL))
+        if _base != None:
+            st.indent.inc()
+        st._indent = st.indent.get()
+    else:
+        st.add(Class(None, _className, _base, isForwardDecl=False, level=st.indent.LEVEL))
+        st.currentClass.append(_className)
+        if _base != None:
+            st.currentClass.append(_base)
+        st.classScopes.append((level, _className, 1 if _base is None else 2))
+
+def _processStruct(st, level, node):
+    # Only the definition is reported; the nodes under it are handled as usual
+    name = node.child_by_field_name("name")
+    body = node.child_by_field_name("body")
+    if name is not None and body is not None:
+        base = None
+        for child in node.children:
+            if child.type == "base_class_clause":
+                base = read(st.data, child)
+        st.add(Class(None, read(st.data, name), base, isForwardDecl=False,
+                     level=st.indent.LEVEL))
+
+def _processAccess(st, level, node):
+    generalQualifier = st.generalQualifier
+    _access = read(st.data, node)
+    _access = _access.replace(":", "")            
+    if "protected" in generalQualifier:
+        generalQualifier.remove("protected")
+    if "private" in generalQualifier:
+        generalQualifier.remove("private")
+    if "public" in generalQualifier:
+        generalQualifier.remove("public")
+
+    generalQualifier.add(_access)
+
+def _processDeclaration(st, level, node):
+    pass
+
+def _processStorageClass(st, level, node):
+    # Jump to the first node after the subtree
+    st.i = int(st.parsed.ends[st.i])
+
+def _processTypeDeclaration(st, level, node):
+    data = st.data
+    line = node.start_point[0]
 
-                
-            generalQualifier.add(_access)
-
-        elif typ == "declaration":
-
-            """
-                tmp += f'{_indent}- declaration:\n'
-                _indent = indent.inc()
-                tmp += f'{_indent}idx: {idx}\n'
-                idx += 1                   
-                tmp += f'{_indent}id: {_functionID}\n'                
-                tmp += f'{_indent}return: {_returnType}\n'
-                tmp += f'{_indent}returnQualifiers: {_returnQualifiers}\n'
-                _indent = indent.dec()
-            """
-            pass
+    _type = read(data,node)
+    _qualifiers = []
+    _id = None
+    while node.start_point[0] == line:
+        level, node = st.next()
+        if set(node.type) == set(["*"]):
+            _qualifiers.append(node.type)
+        if node.type in ["identifier", "field_identifier"]:
+            _id = read(data, node)
+            break
 
-        elif typ == "storage_class_specifier":
-            lvl = level
-            while True:
-                i += 1
-                level, node = parsed[i]
-                if level <= lvl:
-                    break
+    if _id != None:
+        st.add(Declaration(st.nextIdx(), _id, _type, _qualifiers, level=st.indent.LEVEL))
+        st._indent = st.indent.get() 
+
+# Unhandled types
+def _processUnhandled(st, level, node):
+    print("WARNING: unhandled", node.type, read(st.data, node))
+    return "unhandled"
+
+# Node type -> handler. None: the node is skipped; types not listed here
+# are unhandled. Functions are detected before looking at this table.
+HANDLERS = {
+    "#ifndef": _processIfdef,
+    "#ifdef": _processIfdef,
+    "#endif": _processEndif,
+    "preproc_directive": _processDirective,
+    "preproc_if": _processIf,
+    "preproc_elif": _processElif,
+    "preproc_else": _processElse,
+    "preproc_include": _processInclude,
+    "preproc_def": _processDefine,
+    "extern": _processExtern,
+    "preproc_function_def": _processFuncDefine,
+    "friend": _processFriend,
+    "comment": _processComment,
+    "preproc_defined": _processDefined,
+    "type_definition": _processTypedef,
+    "field_declaration_list": _processFieldDeclarationList,
+    "class_specifier": _processClass,
+    "struct_specifier": _processStruct,
+    "access_specifier": _processAccess,
+    "statement_identifier": _processAccess,
+    "declaration": _processDeclaration,
+    "storage_class_specifier": _processStorageClass,
+    "type_identifier": _processTypeDeclaration,
+    "primitive_type": _processTypeDeclaration,
+    "sized_type_specifier": _processTypeDeclaration,
+}
+for _typ in [";", "(", ")", "{", "}", ',', ":", "\n", "ERROR", "public",
+             "translation_unit", "preproc_ifdef", "friend_declaration",
+             "type_qualifier", "const", "field_declaration"]:
+    HANDLERS[_typ] = None
+
+def process(parsed, data, header, out=None, segments=None, profile=None, sink=None):
+    """Writes the YAML for `parsed` into the Emitter `out`.
+
+    When `out` is not given, the YAML is returned as a string. `segments`
+    (see Segments) records the state at every declaration boundary and may
+    replace the processing of a declaration with the previous output. With
+    a Profile in `profile`, calls and time of every branch are counted.
+
+    Every node goes to the handler of its type in HANDLERS, unless
+    `parsed.functions` says it is a function. The handlers pass the IR
+    entities they build to `sink.add`: by default a YamlWriter over `out`;
+    `convert` gives a TranslationUnit instead.
+    """
+    if sink is None:
+        if out is None:
+            out = Emitter()
+            process(parsed, data, header, out, segments, profile)
+            return out.getvalue()
+        sink = YamlWriter(out)
+    if type(data) is not Source:
+        data = Source(data)
+    st = ProcessState(parsed, data, sink)
+    _processNodes(st, _handlers(), len(parsed), segments, out, profile)
+
+def processChunks(chunks, data, header, out=None, profile=None, sink=None):
+    """`process` over the pieces of `walkChunks`, one after the other.
+
+    The ProcessState (idx, indentation, class and access specifiers...)
+    goes on from a piece to the next, so the YAML is the same as with
+    `process` over the whole `walker`; every piece is written out before
+    the next one is walked. When a handler reads past the end of a piece,
+    the piece is processed again, from the state it started with, with more
+    nodes after the cut (see walkChunks); its entities only go to the sink
+    once it is done.
+    """
+    if sink is None:
+        if out is None:
+            out = Emitter()
+            processChunks(chunks, data, header, out, profile)
+            return out.getvalue()
+        sink = YamlWriter(out)
+    if type(data) is not Source:
+        data = Source(data)
+    st = None
+    chunk = next(chunks, None)
+    while chunk is not None:
+        parsed, start, cut = chunk
+        handlers = _handlers()   # the walk may have met new types
+        if st is None:
+            st = ProcessState(parsed, data, None)
+            previousCut = start
+        saved = st.save()
+        # Handlers may have gone past the previous cut
+        st.parsed, st.i = parsed, st.i - previousCut + start
+        st.sink = pending = _Pending()
+        try:
+            _processNodes(st, handlers, cut, profile=profile)
+        except IndexError:
+            chunk = chunks.send(True)
+            if chunk is None:
+                raise
+            st.load(saved)
+            continue
+        for entity in pending:
+            sink.add(entity)
+        previousCut = cut
+        chunk = next(chunks, None)
+
+class _Pending(list):
+    """Sink holding the entities of a piece until it is done (see processChunks)"""
+    add = list.append
+
+def _handlers():
+    """Handler for every type id"""
+    return [HANDLERS.get(name, _processUnhandled) for name in NODE_TYPE_NAMES]
+
+def _processNodes(st, handlers, stop, segments=None, out=None, profile=None):
+    """Calls the handlers from node `st.i` up to `stop`"""
+    parsed = st.parsed
+    types = parsed.types.tolist()
+    levels = parsed._levels
+    isFunction = parsed.isFunction
+    while st.i < stop:
+        i = st.i
+        if st.classScopes:
+            st.leaveClasses(levels[i])
+        if segments is not None and parsed.boundaries[i]:
+            resumed = segments.visit(i, st.checkpoint(), out)
+            if resumed != None:
+                st.i, state = resumed
+                st.restore(state)
+                continue
 
-        elif typ in ["type_identifier", "primitive_type", "sized_type_specifier"]:      
-            #print("---")
-            line = node.start_point[0]
-            #print("ll>", line) 
-    
-            level, node = parsed[i]
-            lvl = level                      
+        level, node = parsed[i]
+        if profile is not None:
+            t0 = time.perf_counter()
 
-            _type = read(data,node)
-            _qualifiers = []
-            _id = None
-            while node.start_point[0] == line: #parsed[i][1].type != "identifier":
-                i += 1
-                level, node = parsed[i]
-                #print(node.type)
-                if set(node.type) == set(["*"]):
-                    _qualifiers.append(node.type)
-                if node.type in ["identifier", "field_identifier"]:
-                    _id = read(data, parsed[i][1])
-                    break
+        if st.conditionLevel != 0 and level <= st.conditionLevel and types[i] != T_LABELED_STATEMENT:
+            st.conditionLevel = 0
+            st.indent.dec()
+            st.add(Block(level=st.indent.LEVEL))
+            st._indent = st.indent.inc()
 
-            if _id != None:
-                _indent = indent.get() 
-                tmp += f'{_indent}- declaration:\n' 
-
-                _indent = indent.inc()
-                tmp += f'{_indent}idx: {idx}\n'
-                idx += 1                   
-                tmp += f'{_indent}id: {_id}\n'            
-                tmp += f'{_indent}type: {_type}\n'
-                if len(_qualifiers) > 0:
-                    tmp += f'{_indent}qualifiers:\n'                
-                    _indent = indent.inc()
-                    for q in _qualifiers:
-                        tmp += f'{_indent}- {q}\n'
-                    LEVEL -= 1
-                _indent = indent.dec() 
-
-
-        elif typ in [ ";", "(", ")", "{", "}", ',', ":", "\n", "ERROR", "public",
-                      "translation_unit", "preproc_ifdef", "friend_declaration", 
-                      "type_qualifier", "const", "field_declaration"]:
+        if isFunction(i):
+            handler = _processFunction
+        else:
+            handler = handlers[types[i]]
+        st.start = i
+        branch = None
+        if handler is not None:
+            branch = handler(st, level, node)
+        elif profile is not None:
+            branch = "ignored"
+
+        if profile is not None:
+            profile.addHandler(branch or node.type, time.perf_counter() - t0)
+
+        st.i += 1
+
+
+_parser = None
+
+def getParser():
+    """Returns the C++ parser of this process (created on first use)"""
+    global _parser
+    if _parser is None:
+        _parser = Parser()
+        _parser.set_language(CPP_LANGUAGE)
+    return _parser
+
+class ConversionCache:
+    """On-disk cache of converted headers, addressed by content.
+
+    Entries are keyed by the SHA-256 of the header bytes together with the
+    converter source and the type tables (`types`, `NIM_KEYWORDS`), so that
+    changing any of them invalidates the cache. Every entry keeps the YAML
+    produced by `process` and the list of includes.
+
+    The digest of every header is remembered with its mtime and size; while
+    those do not change the file is not hashed again. When the entries take
+    more than `maxBytes`, the least recently used ones are removed.
+    """
+    def __init__(self, folder, maxBytes=512 * 1024 * 1024):
+        self.folder = folder
+        self.maxBytes = maxBytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._salt = None
+        self._size = None   # bytes used by the entries (computed on demand)
+        os.makedirs(os.path.join(folder, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(folder, "stat"), exist_ok=True)
+
+    def __getstate__(self):
+        # Sent to the workers of `parseFiles`: they count on their own
+        state = self.__dict__.copy()
+        state.update(hits=0, misses=0, evictions=0, _size=None)
+        return state
+
+    def salt(self):
+        if self._salt is None:
+            h = hashlib.sha256()
+            folder = os.path.dirname(os.path.abspath(__file__))
+            for module in [__file__] + [os.path.join(folder, m + ".py")
+                                        for m in sorted(set(MODULES.values()))]:
+                with open(module, "rb") as fp:
+                    h.update(fp.read())
+            h.update(repr(sorted(types.items())).encode("utf8"))
+            h.update(repr(sorted(NIM_KEYWORDS)).encode("utf8"))
+            self._salt = h.digest()
+        return self._salt
+
+    def _statPath(self, filename):
+        name = hashlib.sha1(os.path.realpath(filename).encode("utf8")).hexdigest()
+        return os.path.join(self.folder, "stat", name)
+
+    def _objectPath(self, key, ext):
+        return os.path.join(self.folder, "objects", key + ext)
+
+    def key(self, filename):
+        """Returns the cache key of `filename`"""
+        st = os.stat(filename)
+        statPath = self._statPath(filename)
+        try:
+            with open(statPath) as fp:
+                mtime, size, key = fp.read().split()
+            if int(mtime) == st.st_mtime_ns and int(size) == st.st_size:
+                return key
+        except (FileNotFoundError, ValueError):
             pass
-
-        # Unhandled types
+        h = hashlib.sha256(self.salt())
+        with open(filename, "rb") as fp:
+            h.update(fp.read())
+        key = h.hexdigest()
+        _writeAtomic(statPath, f"{st.st_mtime_ns} {st.st_size} {key}\n".encode("utf8"))
+        return key
+
+    def get(self, key):
+        """Returns (yaml path, includes) for `key`, or None on a miss"""
+        yamlPath = self._objectPath(key, ".yaml")
+        try:
+            with open(self._objectPath(key, ".json")) as fp:
+                includes = json.load(fp)
+            os.utime(yamlPath)   # most recently used
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return yamlPath, includes
+
+    def put(self, key, yaml, includes):
+        """Stores the YAML and includes of a converted header. `yaml` is
+        bytes or a binary file, copied from its current position."""
+        yamlPath = self._objectPath(key, ".yaml")
+        if isinstance(yaml, bytes):
+            _writeAtomic(yamlPath, yaml)
+            size = len(yaml)
         else:
-            print("WARNING: unhandled", node.type, read(data, node))
-
-
-        i += 1
-        if i > len(parsed) - 1:
-            break            
-
-    return tmp
-
-def show(parsed, data):
-    for level, node in parsed:
-        print( f"{'   ' * level}{level}: {node.type}" )
-        print( data[node.start_byte:node.end_byte])
-
-
-def parseFile(filename, passC=True):
+            _tmp = f"{yamlPath}.{os.getpid()}.tmp"
+            with open(_tmp, "wb") as fp:
+                shutil.copyfileobj(yaml, fp)
+                size = fp.tell()
+            os.replace(_tmp, yamlPath)
+        _writeAtomic(self._objectPath(key, ".json"), json.dumps(includes).encode("utf8"))
+        if self._size is None:
+            self._size = sum(size for _, size, _ in self._entries())
+        else:
+            self._size += size
+        if self._size > self.maxBytes:
+            self.evict()
+
+    def _entries(self):
+        folder = os.path.join(self.folder, "objects")
+        for name in os.listdir(folder):
+            if name.endswith(".yaml"):
+                try:
+                    st = os.stat(os.path.join(folder, name))
+                except FileNotFoundError:
+                    continue
+                yield st.st_mtime_ns, st.st_size, name[:-5]
+
+    def evict(self):
+        """Removes the least recently used entries until they fit in maxBytes"""
+        entries = sorted(self._entries())
+        size = sum(e[1] for e in entries)
+        for _, entrySize, key in entries:
+            if size <= self.maxBytes:
+                break
+            for ext in [".json", ".yaml"]:
+                try:
+                    os.remove(self._objectPath(key, ext))
+                except FileNotFoundError:
+                    pass
+            size -= entrySize
+            self.evictions += 1
+        self._size = size
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / total if total else 0.0,
+                "evictions": self.evictions}
+
+def _writeAtomic(filename, content):
+    _tmp = f"{filename}.{os.getpid()}.tmp"
+    with open(_tmp, "wb") as fp:
+        fp.write(content)
+    os.replace(_tmp, filename)
+
+class Tee:
+    """Sink that hands every entity to several sinks"""
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def add(self, entity):
+        for sink in self.sinks:
+            sink.add(entity)
+
+
+def destinationFor(filename, outputFolder=None, format="yaml", root=None):
+    """Name of the file written for `filename` (see FORMATS). With `root`,
+    the folders between `root` and the header are kept, so that the output
+    mirrors the input tree; otherwise (or for a header that is not under
+    `root`) it goes into `outputFolder` itself."""
     folder, header = os.path.split(filename)
-    destination = header.lower()
-    destination = os.path.splitext(destination)[0] + ".yaml"
+    destination = os.path.splitext(header.lower())[0] + FORMATS[format][0]
+    if root is not None:
+        relative = os.path.relpath(os.path.abspath(folder), os.path.abspath(root))
+        if relative != "." and relative != ".." and not relative.startswith(".." + os.sep):
+            destination = os.path.join(relative, destination)
+    if outputFolder:
+        destination = os.path.join(outputFolder, destination)
+    return destination
+
+def rootFor(filename, roots):
+    """The folder of `roots` that `filename` is under (the deepest one), or
+    None; see `destinationFor`"""
+    found = None
+    path = os.path.abspath(filename)
+    for root in roots:
+        root = os.path.abspath(root)
+        if path.startswith(os.path.join(root, "")) and (found is None or len(root) > len(found)):
+            found = root
+    return found
+
+def parseFile(filename, passC=True, cache=None, outputFolder=None, profile=None,
+              format="yaml", skipBodies=False, index=None, includePaths=(), defines=None,
+              stream=False, root=None):
+    """Converts `filename` into a YAML file in `outputFolder` (by default,
+    the current folder). With `format` "jsonl", a JSON Lines file is written
+    instead (see JsonLinesWriter); with "nim", Nim bindings (see NimWriter,
+    which looks for the typedefs of the includes in `includePaths`). With
+    `skipBodies`, function bodies are not walked (see `walker`). With
+    `defines` ({name: value}), the preprocessor branches that are not taken
+    are left out (see Preprocessor; the includes are looked for in
+    `includePaths`). With `stream`, the tree is walked and converted one
+    piece at a time (see walkChunks), so that the memory used does not grow
+    with the size of the header; the output is the same. With `root`, the
+    output keeps the folders of the header under `root` (see destinationFor).
+
+    With a ConversionCache in `cache`, unchanged headers are not parsed
+    again. With a Profile in `profile`, the time of every phase is recorded.
+    With a SymbolIndex in `index`, the rows of the header are replaced (the
+    cache is not used while the index is out of date for the header).
+    Returns the list of includes of the header.
+    """
+    folder, header = os.path.split(filename)
+    destination = destinationFor(filename, outputFolder, format, root)
+    writer = writerFor(format)
     print(destination)
+    # Every process writes its own temporary file
+    _tmpDestination = f"{destination}.{os.getpid()}.tmp"
+    if format == "nim" or defines is not None:
+        # The output depends on the included headers too: not cached
+        cache = None
 
     try:
-        fp = open(filename, "r")
-        txt = fp.read()
-        fp.close()
-
-        data = bytes(txt, "utf8")
-
-        parser = Parser()
-        parser.set_language(CPP_LANGUAGE)
-        tree = parser.parse(bytes(txt, "utf8") )
+        # Compiled once per process: not counted in the "includes" phase
+        getQuery("includes")
+        if profile is not None:
+            profile.start()
+        if cache is not None:
+            key = cache.key(filename)
+            if format != "yaml" or skipBodies:
+                # The cache keeps the output of every format and mode apart
+                key = hashlib.sha256(f"{key} {format} {skipBodies}".encode("utf8")).hexdigest()
+            cached = None
+            if index is None or index.isCurrent(filename):
+                cached = cache.get(key)
+            if cached != None:
+                yamlPath, includes = cached
+                print("Writting (cached): ", destination)
+                _makeFolder(destination)
+                with open(_tmpDestination, "wb") as fp, open(yamlPath, "rb") as src:
+                    fp.write( writer.header(filename).encode("utf8") )
+                    shutil.copyfileobj(src, fp)
+                os.replace(_tmpDestination, destination)
+                if profile is not None:
+                    profile.mark("cache")
+                return includes
+            if profile is not None:
+                profile.mark("cache")
+
+        data = Source.open(filename)
+        if profile is not None:
+            profile.mark("read")
+
+        parser = getParser()
+        tree = parser.parse(data.view, keep_text=False)
         cursor = tree.walk()
+        if profile is not None:
+            profile.mark("parse")
+
+        preprocessor = None
+        if defines is not None:
+            preprocessor = Preprocessor(defines, includePaths).start(data, filename)
+        chunks = None
+        if stream and preprocessor is None:
+            # Walked piece by piece while `processChunks` writes the output
+            chunks = walkChunks(cursor, skipBodies)
+            includes = [read(data, node) for node, _ in
+                        getQuery("includes").captures(tree.root_node)]
+        else:
+            parsed = walker(cursor, skipBodies, preprocessor)
+            if profile is not None:
+                profile.mark("walker")
+            includes = get_includes(parsed, data)
+        if profile is not None:
+            profile.mark("includes")
+
+        # The output is streamed into a temporary file that replaces the
+        # destination once `process` has finished
+        print("Writting: ", destination)
+        _makeFolder(destination)
+        fp = open(_tmpDestination, "w")
+        try:
+            fp.write( writer.header(filename) )
+            #if passC:
+            #    fp.write( f'passC: "-I{folder}"\n' )
+
+            out = Emitter(fp)
+            _start = fp.tell()
+            yamlOut = out
+            if format == "nim":
+                # The bindings are written from the signatures `extract`
+                # finds: those of `process` lose static, the operators and
+                # the pointers and references of the parameters
+                from header2yaml_nim import getResolver
+                nim = writer(out, filename, getResolver(includePaths))
+                kept = None
+                if chunks is None and parsed.preprocessed:
+                    kept = set(parsed.startBytes.tolist())
+                for entity in extract(data, filename, kept).entities():
+                    nim.add(entity)
+                sink = None
+                yamlOut = None   # `process` only runs for the index
+            else:
+                sink = writer(out)
+            if index is not None:
+                indexSink = index.sink(filename, data)
+                sink = Tee(sink, indexSink) if sink is not None else indexSink
+            if sink is not None and chunks is not None:
+                processChunks(chunks, data, header, yamlOut, profile=profile, sink=sink)
+            elif sink is not None:
+                process(parsed, data, header, yamlOut, profile=profile, sink=sink)
+            out.flush()
+            fp.close()
+            if index is not None:
+                indexSink.finish()
+        except:
+            fp.close()
+            os.remove(_tmpDestination)
+            raise
+        finally:
+            data.close()
+        if cache is not None:
+            with open(_tmpDestination, "rb") as fp:
+                fp.seek(_start)
+                cache.put(key, fp, includes)
+        os.replace(_tmpDestination, destination)
+        if profile is not None:
+            profile.mark("process")
+            # Time spent flushing the output is reported apart
+            profile.addPhase("process", -out.writeTime)
+            profile.addPhase("write", out.writeTime)
+        return includes        
+    except FileNotFoundError as e:
+        if e.filename != filename:
+            raise
+        print("ERROR: File not found: ", filename)
 
-        parsed = walker(cursor)
-        includes = get_includes(parsed, data)
+def _makeFolder(destination):
+    folder = os.path.dirname(destination)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
 
-        txt = process(parsed, data, header)
-        print("Writting: ", destination)
-        fp = open(destination, "w")
+IDX_LINE = re.compile(r" *idx: (\d+)\n")
 
-        fp.write( f"- filename: {filename}\n" )
-        #if passC:
-        #    fp.write( f'passC: "-I{folder}"\n' )
+class RecordingEmitter(Emitter):
+    """In-memory Emitter that remembers where every idx value was written"""
+    def __init__(self):
+        super().__init__()
+        self.idxOffsets = []
+
+    def write(self, txt):
+        m = IDX_LINE.fullmatch(txt)
+        if m:
+            self.idxOffsets.append(self._size + m.start(1))
+        super().write(txt)
+
+    def tell(self):
+        return self._size
+
+    def writeReused(self, text, start, end, idxOffsets, delta):
+        """Copies text[start:end] (previous output) adding `delta` to its idx"""
+        k = bisect.bisect_left(idxOffsets, start)
+        pos = start
+        while k < len(idxOffsets) and idxOffsets[k] < end:
+            o = idxOffsets[k]
+            e = text.index("\n", o)
+            Emitter.write(self, text[pos:o])
+            self.idxOffsets.append(self._size)
+            Emitter.write(self, str(int(text[o:e]) + delta))
+            pos = e
+            k += 1
+        Emitter.write(self, text[pos:end])
+
+
+class TrackedParsed(Parsed):
+    """Parsed that remembers the furthest position read through parsed[i]"""
+    def __init__(self, parsed):
+        self.__dict__.update(parsed.__dict__)
+        self.furthest = 0
+
+    def __getitem__(self, i):
+        if i > self.furthest:
+            self.furthest = i
+        node = self.nodes[i]
+        if node is None:
+            node = self._node(i)
+        return self._levels[i], node
+
+    def _node(self, i):
+        """Node i of a subtree that `rewalk` copied: the children of its
+        ancestors are filled in, down from the nearest one known"""
+        nodes, parents, ends = self.nodes, self.parents, self.ends
+        path = [i]
+        while nodes[parents[path[-1]]] is None:
+            path.append(int(parents[path[-1]]))
+        for k in reversed(path):
+            parent = int(parents[k])
+            position = parent + 1
+            for child in nodes[parent].children:
+                nodes[position] = child
+                position = int(ends[position])
+        return nodes[i]
+
+    def isFunction(self, i):
+        reach = self.functionReach[i]
+        if reach > self.furthest:
+            self.furthest = int(reach)
+        return self._functionList[i]
+
+
+class Segments:
+    """Checkpoints taken by `process` at every declaration boundary.
+
+    A checkpoint keeps the node (byte range, type and level), the state of
+    `process`, the output offset and how far (in bytes) the handlers read
+    until the next checkpoint. Given the checkpoints of the previous
+    conversion, the edited byte range and the changed ranges reported by
+    tree-sitter, a declaration whose bytes (including everything the
+    handlers peeked at) did not change is not processed again: its previous
+    output is copied with the idx values shifted.
+
+    `parsed` must be a TrackedParsed.
+    """
+    def __init__(self, parsed, previous=None, edit=None, dirty=()):
+        self.parsed = parsed
+        self.checkpoints = []   # [position, key, state, offset, reach]
+        self.previous = previous
+        self.reused = 0
+        self._reusable = {}     # position -> (previous checkpoint, next position)
+        if previous is not None:
+            self._match(edit, dirty)
+
+    def _key(self, i):
+        parsed = self.parsed
+        return (int(parsed.startBytes[i]), int(parsed.endBytes[i]),
+                int(parsed.types[i]), parsed._levels[i])
+
+    def _match(self, edit, dirty):
+        start, oldEnd, newEnd = edit
+        positions = {}
+        for i in np.nonzero(self.parsed.boundaries)[0]:
+            positions[self._key(i)] = int(i)
+
+        old = self.previous.checkpoints
+        for k in range(len(old) - 1):
+            key, nextKey, reach = old[k][1], old[k + 1][1], old[k][4]
+            if reach < start:
+                delta = 0
+            elif key[0] > oldEnd:
+                delta = newEnd - oldEnd
+            else:
+                continue
+            a, b = key[0] + delta, reach + delta
+            if any(a <= dEnd and dStart <= b for dStart, dEnd in dirty):
+                continue
+            i = positions.get((key[0] + delta, key[1] + delta) + key[2:])
+            j = positions.get((nextKey[0] + delta, nextKey[1] + delta) + nextKey[2:])
+            if i != None and j != None:
+                self._reusable[i] = (k, j)
+
+    def _close(self, i):
+        """Sets the reach of the last checkpoint, now that `i` is the next one"""
+        if self.checkpoints:
+            last = self.checkpoints[-1]
+            if last[4] is None:
+                parsed = self.parsed
+                furthest = min(max(parsed.furthest, i) + 2, len(parsed))
+                last[4] = int(parsed.endBytes[last[0]:furthest].max())
+        self.parsed.furthest = i
+
+    def visit(self, i, state, out):
+        """Records a checkpoint; returns (next position, state) if the
+        declaration at `i` was copied from the previous output"""
+        self._close(i)
+        checkpoint = [i, self._key(i), state, out.tell(), None]
+        self.checkpoints.append(checkpoint)
+        match = self._reusable.get(i)
+        if match is None:
+            return None
+        k, j = match
+        old = self.previous.checkpoints
+        oldState, nextState = old[k][2], old[k + 1][2]
+        # generalQualifier is not restored (a rebuilt set may iterate in a
+        # different order), so it must not change within the declaration
+        if oldState[1:] != state[1:] or nextState[5] != oldState[5]:
+            return None
+        delta = state[0] - oldState[0]
+        out.writeReused(self.previous.text, old[k][3], old[k + 1][3],
+                        self.previous.idxOffsets, delta)
+        shift = checkpoint[1][0] - old[k][1][0]
+        checkpoint[4] = old[k][4] + shift
+        self.reused += 1
+        return j, (nextState[0] + delta,) + nextState[1:]
+
+    def finish(self):
+        self._close(len(self.parsed) - 1)
+
+
+def _commonLength(a, b, n):
+    """Length of the common prefix of `a` and `b` (at most `n`)"""
+    lo, hi = 0, n
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+def _point(data, offset):
+    """(row, column) of the byte `offset`"""
+    row = data.count(b"\n", 0, offset)
+    return row, offset - (data.rfind(b"\n", 0, offset) + 1)
+
+class IncrementalParser:
+    """Converts successive versions of the same header.
+
+    The tree, the source and the output of the last conversion are kept. On
+    the next one, the changed byte range is applied with `tree.edit`, the
+    header is reparsed from the old tree (even when the result has syntax
+    errors), only the subtrees touching the edited or changed ranges are
+    walked again (see `rewalk`) and `process` only reruns the declarations
+    touching them (see Segments).
+    """
+    def __init__(self, filename, outputFolder=None, root=None):
+        self.filename = filename
+        self.outputFolder = outputFolder
+        self.root = root
+        self.data = None
+        self.tree = None
+        self.parsed = None
+        self.segments = None
+        self.text = None
+        self.checkpoints = []
+        self.idxOffsets = []
+        self.includes = None
+
+    def convert(self, data=None):
+        """Returns the YAML (without the filename line) for `data`, which
+        defaults to the current content of the file"""
+        if data is None:
+            with open(self.filename, "rb") as fp:
+                data = fp.read()
+        if data == self.data:
+            return self.text
+
+        parser = getParser()
+        previous = None
+        if self.tree is None:
+            tree = parser.parse(data)
+        else:
+            # Single edit: everything between the common prefix and suffix
+            old = self.data
+            n = min(len(old), len(data))
+            start = _commonLength(old, data, n)
+            end = _commonLength(old[::-1], data[::-1], n - start)
+            edit = (start, len(old) - end, len(data) - end)
+            # The old tree is modified in place: start over if this fails
+            tree, self.tree = self.tree, None
+            tree.edit(edit[0], edit[1], edit[2], _point(old, edit[0]),
+                      _point(old, edit[1]), _point(data, edit[2]))
+            oldTree = tree
+            tree = parser.parse(data, oldTree)
+            dirty = [(edit[0], edit[2])]
+            for r in oldTree.get_changed_ranges(tree):
+                dirty.append((r.start_byte, r.end_byte))
+            previous = self
+
+        if previous is None:
+            parsed = TrackedParsed(walker(tree.walk()))
+        else:
+            rowShift = _point(data, edit[2])[0] - _point(old, edit[1])[0]
+            parsed = TrackedParsed(rewalk(tree.walk(), self.parsed, edit, dirty, rowShift))
+        header = os.path.split(self.filename)[1]
+        segments = Segments(parsed, previous, edit, dirty) if previous else Segments(parsed)
+        out = RecordingEmitter()
+        process(parsed, data, header, out, segments)
+        segments.finish()
+
+        self.includes = get_includes(parsed, data)
+        self.data = data
+        self.tree = tree
+        self.parsed = parsed
+        self.segments = segments
+        self.checkpoints = segments.checkpoints
+        self.text = out.getvalue()
+        self.idxOffsets = out.idxOffsets
+        return self.text
+
+    def parseFile(self, data=None):
+        """Same as `parseFile` for the current version of the header"""
+        destination = destinationFor(self.filename, self.outputFolder, root=self.root)
+        text = self.convert(data)
+        print("Writting: ", destination)
+        _makeFolder(destination)
+        _writeAtomic(destination, f"- filename: {self.filename}\n{text}".encode("utf8"))
+        return self.includes
+
+
+HEADER_EXTENSIONS = [".h", ".hh", ".hpp", ".hxx", ".h++"]
+
+def scanHeaders(folder):
+    """Returns {path: (mtime, size)} for the headers under `folder`"""
+    headers = {}
+    for root, dirs, files in os.walk(folder):
+        for name in files:
+            if os.path.splitext(name)[1].lower() in HEADER_EXTENSIONS:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                headers[path] = (st.st_mtime_ns, st.st_size)
+    return headers
+
+class Watcher:
+    """Keeps the YAML of the headers under `folder` in sync with them (in
+    the same folders under `outputFolder`).
+
+    The folder is polled every `interval` seconds. A header is converted
+    again once it has not changed for `debounce` seconds, so a burst of saves
+    triggers a single conversion. Every header keeps its IncrementalParser
+    (and so its tree) between conversions.
+    """
+    def __init__(self, folder, interval=0.5, debounce=0.3, outputFolder=None):
+        self.folder = folder
+        self.outputFolder = outputFolder
+        self.interval = interval
+        self.debounce = debounce
+        self.known = {}     # path -> (mtime, size)
+        self.pending = {}   # path -> time of the last change seen
+        self.parsers = {}   # path -> IncrementalParser
+        self.conversions = 0
+
+    def convert(self, path):
+        parser = self.parsers.get(path)
+        if parser is None:
+            parser = self.parsers[path] = IncrementalParser(path, self.outputFolder, self.folder)
+        try:
+            parser.parseFile()
+            self.conversions += 1
+        except FileNotFoundError:
+            print("ERROR: File not found: ", path)
+        except Exception as e:
+            print("ERROR: failed to convert: ", path, f"({type(e).__name__}: {e})")
+            del self.parsers[path]
+
+    def poll(self):
+        """Checks the folder once and converts the headers that are due"""
+        now = time.monotonic()
+        current = scanHeaders(self.folder)
+        for path, st in current.items():
+            if self.known.get(path) != st:
+                self.known[path] = st
+                self.pending[path] = now
+        for path in list(self.known):
+            if path not in current:
+                del self.known[path]
+                self.pending.pop(path, None)
+                self.parsers.pop(path, None)
+        for path, changed in list(self.pending.items()):
+            if now - changed >= self.debounce:
+                del self.pending[path]
+                self.convert(path)
+
+    def run(self):
+        print("Watching: ", self.folder)
+        try:
+            while True:
+                self.poll()
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            pass
 
-        fp.write(txt )
-            #print(f"{'  ' * nested}{value}")
-        fp.close()
-        return includes        
-    except FileNotFoundError:
-        print("ERROR: File not found: ", filename)
+def _initWorker():
+    getParser()
+
+def _parseFileSafe(filename, cache=None, outputFolder=None, withProfile=False,
+                   format="yaml", skipBodies=False, index=None, includePaths=(),
+                   defines=None, stream=False, root=None):
+    """Returns (includes, cache hits, cache misses, seconds, size, profile
+    report) for `filename`"""
+    hits = misses = 0
+    if cache is not None:
+        hits, misses = cache.hits, cache.misses
+    profile = Profile() if withProfile else None
+    t0 = time.perf_counter()
+    try:
+        includes = parseFile(filename, cache=cache, outputFolder=outputFolder,
+                             profile=profile, format=format, skipBodies=skipBodies,
+                             index=index, includePaths=includePaths, defines=defines,
+                             stream=stream, root=root)
+    except Exception as e:
+        print("ERROR: failed to convert: ", filename, f"({type(e).__name__}: {e})")
+        includes = None
+    seconds = time.perf_counter() - t0
+    if cache is not None:
+        hits, misses = cache.hits - hits, cache.misses - misses
+    try:
+        size = os.path.getsize(filename)
+    except OSError:
+        size = 0
+    report = profile.report() if profile is not None else None
+    return includes, hits, misses, seconds, size, report
+
+def parseFiles(filenames, workers=None, followIncludes=True, includePaths=(),
+               cache=None, outputFolder=None, timings=None, profile=None, format="yaml",
+               skipBodies=False, index=None, defines=None, stream=False):
+    """Converts a set of headers using a pool of `workers` processes.
+
+    Every worker creates its parser once and reuses it for all the files it
+    gets. When `followIncludes` is True, the headers that `filenames`
+    include are converted too, each one before the headers that include it:
+    the include graph is built first (see `includeGraph`) and a header is
+    queued once all the headers it includes are done. With `defines`, the
+    includes of the branches taken are only known once a header is
+    converted: they are resolved (see `IncludeResolver`) and queued then.
+    Every header is converted once.
+
+    `cache` is an optional ConversionCache; its hit/miss counters are updated
+    with the work done by the pool. When `timings` is a dictionary, it gets
+    filename -> (seconds, size in bytes) for every header. A Profile in
+    `profile` aggregates the profile of every header. `format` is the output
+    format (see FORMATS) and `skipBodies` enables the signatures-only mode.
+    Every worker writes into the SymbolIndex `index`, if given. `defines`
+    enables the pruning of preprocessor branches and `stream` the piece by
+    piece conversion (see `parseFile`).
+
+    The output mirrors the folders of the headers under the folder common to
+    `filenames`; the included headers found elsewhere keep their folders
+    under the `includePaths` folder they are in (see destinationFor). A
+    header whose output would overwrite that of another one is reported
+    and not converted.
+
+    Returns a dictionary: filename -> list of includes (None on failure).
+    """
+    resolver = IncludeResolver(includePaths)
+    roots = list(includePaths)
+    if filenames:
+        roots.append(os.path.commonpath([os.path.dirname(os.path.abspath(f))
+                                         for f in filenames]))
+    # Dependency order: real path -> headers it includes that are not done
+    blocking, dependents = {}, collections.defaultdict(list)
+    if followIncludes and defines is None:
+        graph, order = includeGraph(filenames, includePaths, resolver)
+        position = {f: k for k, f in enumerate(order)}
+        for f in order:
+            # The include closing a cycle comes later in `order`: not waited for
+            blocking[f] = set(d for d in graph[f] if position[d] < position[f])
+            for d in blocking[f]:
+                dependents[d].append(f)
+    names = {os.path.realpath(f): f for f in filenames}
+    results = {}
+    seen = set()
+    destinations = {}   # destination -> header written into it
+    pending = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initWorker) as pool:
+        def submit(filename):
+            key = os.path.realpath(filename)
+            if key in seen:
+                return
+            seen.add(key)
+            root = rootFor(filename, roots)
+            destination = destinationFor(filename, outputFolder, format, root)
+            if destination in destinations:
+                print("ERROR: not converted: ", filename, "(", destination,
+                      "is written for", destinations[destination], ")")
+                results[filename] = None
+                done(key)
+                return
+            destinations[destination] = filename
+            pending[pool.submit(_parseFileSafe, filename, cache,
+                                outputFolder, profile is not None, format,
+                                skipBodies, index, includePaths,
+                                defines, stream, root)] = filename
+
+        def done(key):
+            """Queues the headers that were only waiting for `key`"""
+            for f in dependents.pop(key, ()):
+                blocking[f].discard(key)
+                if not blocking[f]:
+                    submit(names.get(f, f))
+
+        if blocking:
+            for f, deps in blocking.items():
+                if not deps:
+                    submit(names.get(f, f))
+        else:
+            for filename in filenames:
+                submit(filename)
+
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                filename = pending.pop(future)
+                includes, hits, misses, seconds, size, report = future.result()
+                results[filename] = includes
+                if timings is not None:
+                    timings[filename] = (seconds, size)
+                if report is not None:
+                    profile.merge(report, filename)
+                if cache is not None:
+                    cache.hits += hits
+                    cache.misses += misses
+                if followIncludes and not blocking and includes != None:
+                    for incl in includes:
+                        path = resolver.resolve(incl, filename)
+                        if path != None:
+                            submit(path)
+                done(os.path.realpath(filename))
+    return results
+
+def expandInputs(inputs):
+    """Headers named by `inputs`: files, folders (searched recursively) and
+    glob patterns"""
+    filenames = []
+    for item in inputs:
+        if os.path.isdir(item):
+            filenames.extend(sorted(scanHeaders(item)))
+        elif glob.has_magic(item):
+            filenames.extend(sorted(glob.glob(item, recursive=True)))
+        else:
+            filenames.append(item)
+    return filenames
+
+def percentile(values, p):
+    """Nearest-rank percentile of the sorted list `values`"""
+    if not values:
+        return 0.0
+    k = min(len(values), max(1, math.ceil(p / 100.0 * len(values)))) - 1
+    return values[k]
+
+def summary(results, timings, elapsed, nSlowest=10):
+    """Text report of a `parseFiles` run"""
+    failed = sum(1 for v in results.values() if v is None)
+    latencies = sorted(t for t, _ in timings.values())
+    size = sum(n for _, n in timings.values())
+    elapsed = max(elapsed, 1e-9)
+    lines = [f"Converted {len(results) - failed} files ({failed} failed) in {elapsed:.2f} s",
+             f"  files/s: {len(results) / elapsed:.1f}    MB/s: {size / elapsed / 1e6:.2f}",
+             f"  latency p50: {percentile(latencies, 50) * 1000:.1f} ms"
+             f"    p95: {percentile(latencies, 95) * 1000:.1f} ms"
+             f"    max: {(latencies[-1] if latencies else 0) * 1000:.1f} ms"]
+    slowest = sorted(timings.items(), key=lambda x: x[1][0], reverse=True)[:nSlowest]
+    if slowest:
+        lines.append("  slowest:")
+        for filename, (seconds, _) in slowest:
+            lines.append(f"    {seconds * 1000:9.1f} ms  {filename}")
+    return "\n".join(lines)
+
+def convert(source, filename=None, skipBodies=False, preprocessor=None):
+    """Returns the TranslationUnit of a header given as bytes or as a Source.
+    With `skipBodies`, function bodies are not walked; with a Preprocessor,
+    the dead branches are left out (see `walker`)."""
+    if type(source) is not Source:
+        source = Source(source)
+    tree = getParser().parse(source.view, keep_text=False)
+    if preprocessor is not None:
+        preprocessor.start(source, filename)
+    parsed = walker(tree.walk(), skipBodies, preprocessor)
+    unit = TranslationUnit(filename, get_includes(parsed, source))
+    process(parsed, source, filename, sink=unit)
+    return unit
+
+def headerToYaml(source, filename, skipBodies=False):
+    """Returns the YAML (as `parseFile` writes it) and the includes of the
+    header in the Source `source`"""
+    tree = getParser().parse(source.view, keep_text=False)
+    parsed = walker(tree.walk(), skipBodies)
+    includes = get_includes(parsed, source)
+    txt = process(parsed, source, os.path.basename(filename))
+    return f"- filename: {filename}\n{txt}", includes
 
 #------------------------------
+def main():
+    import argparse
+    argParser = argparse.ArgumentParser(description="Converts C++ headers into YAML")
+    argParser.add_argument("inputs", nargs="*",
+                           help="headers, folders or glob patterns")
+    argParser.add_argument("-o", "--output", default=".",
+                           help="folder where the YAML files are written")
+    argParser.add_argument("-j", "--workers", type=int, default=None,
+                           help="number of worker processes (default: CPU count)")
+    argParser.add_argument("-I", dest="includePaths", action="append", default=[],
+                           metavar="FOLDER", help="folder where includes are looked for")
+    argParser.add_argument("-D", dest="defines", action="append", default=None,
+                           metavar="NAME[=VALUE]",
+                           help="define a macro and leave out the preprocessor branches not taken")
+    argParser.add_argument("--no-includes", action="store_true",
+                           help="do not convert the headers included by the inputs")
+    argParser.add_argument("--cache", metavar="FOLDER",
+                           help="reuse conversions cached in FOLDER")
+    argParser.add_argument("--watch", metavar="FOLDER",
+                           help="keep the YAML of the headers in FOLDER up to date")
+    argParser.add_argument("--profile", metavar="FILE",
+                           help="time every phase and handler; save the report as JSON")
+    argParser.add_argument("--format", choices=sorted(FORMATS), default="yaml",
+                           help="output format (default: yaml)")
+    argParser.add_argument("--signatures-only", action="store_true",
+                           help="do not walk function bodies (faster on header-only code)")
+    argParser.add_argument("--stream", action="store_true",
+                           help="walk and convert every header piece by piece (bounded memory)")
+    argParser.add_argument("--index", metavar="DB",
+                           help="index the symbols of the converted headers in the SQLite DB")
+    argParser.add_argument("--serve", metavar="SOCKET",
+                           help="serve conversions over the Unix socket SOCKET")
+    args = argParser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    if args.serve:
+        cache = ConversionCache(args.cache) if args.cache else None
+        from header2yaml_server import ConversionServer
+        ConversionServer(args.serve, workers=args.workers, cache=cache).run()
+    elif args.watch:
+        Watcher(args.watch, outputFolder=args.output).run()
+    else:
+        filenames = expandInputs(args.inputs)
+        if not filenames:
+            argParser.error("no headers given")
+        cache = ConversionCache(args.cache) if args.cache else None
+        profile = Profile() if args.profile else None
+        index = None
+        if args.index:
+            from header2yaml_index import SymbolIndex
+            index = SymbolIndex(args.index)
+        timings = {}
+        t0 = time.perf_counter()
+        results = parseFiles(filenames, workers=args.workers,
+                             followIncludes=not args.no_includes,
+                             includePaths=args.includePaths, cache=cache,
+                             outputFolder=args.output, timings=timings,
+                             profile=profile, format=args.format,
+                             skipBodies=args.signatures_only, index=index,
+                             defines=parseDefines(args.defines) if args.defines else None,
+                             stream=args.stream)
+        print(summary(results, timings, time.perf_counter() - t0))
+        if cache is not None:
+            print("  cache:", cache.stats())
+        if profile is not None:
+            print(profile.format())
+            with open(args.profile, "w") as fp:
+                json.dump({"total": profile.report(), "files": profile.files}, fp, indent=1)
+
 if __name__ == "__main__":
-    import os
-    #fileHeader = "/usr/share/arduino/hardware/archlinux-arduino/avr/cores/arduino/Arduino.h"
-    #fileHeader = "/usr/share/arduino/hardware/archlinux-arduino/avr/cores/arduino/WString.h"
-    fileHeader = "/usr/include/opencascade/gp_Ax3.hxx"    
-    print(fileHeader)
-
-    folder, header = os.path.split(fileHeader)
-    includes = parseFile(fileHeader)
-
-    # Process the other files
-    for incl in includes:
-        if incl[0] == '"':
-            newHeader = incl[1:-1]
-            newHeader = os.path.join(folder, newHeader)
-            print(newHeader)
-            parseFile(newHeader,passC=False)
+    # Run as the module `header2yaml`, the one its other modules import
+    import header2yaml
+    header2yaml.main()
 
 """
 TODO:
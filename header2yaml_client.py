@@ -0,0 +1,82 @@
+"""Client of the conversion server started with
+
+    python header2yaml.py --serve SOCKET [-j WORKERS] [--cache FOLDER]
+
+Usage:
+
+    python header2yaml_client.py SOCKET [-o OUTPUT [--format jsonl]] headers...
+
+With `-o` the server writes the YAML files into OUTPUT; otherwise the YAML
+is printed. A header named `-` is read from the standard input. Only the
+standard library is imported, so the client starts fast.
+"""
+import socket, json, base64, os, sys, argparse
+
+
+class Client:
+    """Connection to a ConversionServer; requests are answered in order"""
+    def __init__(self, socketPath):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socketPath)
+        self.rfile = self.sock.makefile("rb")
+
+    def request(self, request):
+        self.sock.sendall(json.dumps(request).encode("utf8") + b"\n")
+        line = self.rfile.readline()
+        if not line:
+            raise ConnectionError("the server closed the connection")
+        return json.loads(line)
+
+    def convert(self, filename, outputFolder=None, format=None, signaturesOnly=False):
+        """Converts the header `filename` (paths are sent absolute)"""
+        request = {"path": os.path.abspath(filename), "signaturesOnly": signaturesOnly}
+        if outputFolder:
+            request["output"] = os.path.abspath(outputFolder)
+            if format:
+                request["format"] = format
+        return self.request(request)
+
+    def convertData(self, data, filename="<stdin>", signaturesOnly=False):
+        """Converts the header given as bytes"""
+        return self.request({"data": base64.b64encode(data).decode("ascii"),
+                             "filename": filename, "signaturesOnly": signaturesOnly})
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    argParser = argparse.ArgumentParser(description="Converts C++ headers using a header2yaml server")
+    argParser.add_argument("socket", help="Unix socket of the server")
+    argParser.add_argument("headers", nargs="+", help="headers to convert ('-' for stdin)")
+    argParser.add_argument("-o", "--output", help="folder where the server writes the YAML files")
+    argParser.add_argument("--format", choices=["yaml", "jsonl", "nim"],
+                           help="format of the files written with -o (default: yaml)")
+    argParser.add_argument("--signatures-only", action="store_true",
+                           help="do not walk function bodies")
+    args = argParser.parse_args()
+
+    failed = 0
+    with Client(args.socket) as client:
+        for filename in args.headers:
+            if filename == "-":
+                reply = client.convertData(sys.stdin.buffer.read(),
+                                           signaturesOnly=args.signatures_only)
+            else:
+                reply = client.convert(filename, args.output, args.format,
+                                       args.signatures_only)
+            if "error" in reply:
+                print("ERROR:", filename, reply["error"], file=sys.stderr)
+                failed += 1
+            elif "destination" in reply:
+                print(reply["destination"])
+            else:
+                sys.stdout.write(reply["yaml"])
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,149 @@
+"""SQLite index of the symbols of the converted headers (`--index DB`).
+
+Imported by header2yaml on demand; `header2yaml.SymbolIndex` is this one.
+"""
+import os, json, hashlib, sqlite3
+
+from header2yaml import (Class, Declaration, Define, FuncDefine, Function, Include, Typedef,
+                         JsonLinesWriter)
+
+
+class SymbolIndex:
+    """SQLite database of the symbols found in the converted headers.
+
+    `sink(filename, data)` returns the sink that `process` feeds (see
+    `parseFile`); once `finish` is called, the rows of that header replace
+    the old ones in a single transaction, so a header is never half indexed.
+
+    Tables:
+
+        files(path, hash, mtime, size)
+        entities(rowid, file, idx, kind, id, class, line, start, end, hash, data)
+        params(entity, position, id, type, isPrimitive, "default", qualifier)
+
+    `kind` is the YAML key (function, class, define, funcDefine, typedef,
+    include, declaration; "class" rows are the forward declarations and the
+    definitions of the classes and structs, with `data.isForwardDecl` telling
+    them apart); `class` the class whose body holds a function
+    (`owner`); (`line`, `start`, `end`) the first line and byte range of the
+    declaration, `hash` the SHA-1 of those bytes and `data` the entity as
+    JsonLinesWriter writes it. `entities` is indexed on id and class. The
+    qualifiers of a parameter are joined by spaces.
+    """
+    KINDS = (Function, Class, Define, FuncDefine, Typedef, Include, Declaration)
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, hash TEXT,
+                                          mtime INTEGER, size INTEGER);
+        CREATE TABLE IF NOT EXISTS entities (file TEXT, idx INTEGER, kind TEXT,
+                                             id TEXT, class TEXT, line INTEGER,
+                                             start INTEGER, end INTEGER,
+                                             hash TEXT, data TEXT);
+        CREATE TABLE IF NOT EXISTS params (entity INTEGER, position INTEGER,
+                                           id TEXT, type TEXT, isPrimitive INTEGER,
+                                           "default" TEXT, qualifier TEXT);
+        CREATE INDEX IF NOT EXISTS entities_id ON entities (id);
+        CREATE INDEX IF NOT EXISTS entities_class ON entities (class);
+        CREATE INDEX IF NOT EXISTS entities_file ON entities (file);
+        CREATE INDEX IF NOT EXISTS params_entity ON params (entity);
+    """
+
+    def __init__(self, path, timeout=60):
+        self.path = path
+        self.timeout = timeout
+        self._conn = None
+
+    def __getstate__(self):
+        # Sent to the workers of `parseFiles`: every process opens its own
+        # connection
+        state = self.__dict__.copy()
+        state["_conn"] = None
+        return state
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            # Transactions are opened explicitly (see `replace`)
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def isCurrent(self, filename):
+        """True when the rows of `filename` were built from its current content"""
+        st = os.stat(filename)
+        row = self.conn.execute("SELECT mtime, size FROM files WHERE path = ?",
+                                (os.path.realpath(filename),)).fetchone()
+        return row is not None and tuple(row) == (st.st_mtime_ns, st.st_size)
+
+    def sink(self, filename, data):
+        return _IndexSink(self, filename, data)
+
+    def replace(self, filename, digest, rows):
+        """Replaces the rows of `filename` by `rows` (see _IndexSink)"""
+        path = os.path.realpath(filename)
+        st = os.stat(filename)
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM params WHERE entity IN "
+                         "(SELECT rowid FROM entities WHERE file = ?)", (path,))
+            conn.execute("DELETE FROM entities WHERE file = ?", (path,))
+            for row, params in rows:
+                rowid = conn.execute("INSERT INTO entities VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                     (path,) + row).lastrowid
+                conn.executemany("INSERT INTO params VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 [(rowid, k) + p for k, p in enumerate(params)])
+            conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                         (path, digest, st.st_mtime_ns, st.st_size))
+            conn.execute("COMMIT")
+        except:
+            conn.execute("ROLLBACK")
+            raise
+
+    def find(self, id, kind=None, className=None):
+        """Rows (file, line, kind, class, data) of the symbols named `id`"""
+        query = "SELECT file, line, kind, class, data FROM entities WHERE id = ?"
+        args = [id]
+        if kind is not None:
+            query += " AND kind = ?"
+            args.append(kind)
+        if className is not None:
+            query += " AND class = ?"
+            args.append(className)
+        return [(file, line, kind, klass, json.loads(data))
+                for file, line, kind, klass, data in self.conn.execute(query, args)]
+
+class _IndexSink:
+    """Collects the rows of one header for SymbolIndex"""
+    def __init__(self, index, filename, data):
+        self.index = index
+        self.filename = filename
+        self.data = data
+        self.rows = []
+        self._converter = JsonLinesWriter()
+
+    def add(self, entity):
+        if type(entity) not in SymbolIndex.KINDS:
+            return
+        obj = self._converter.convert(entity)
+        params = []
+        className = None
+        if type(entity) is Function:
+            params = [(p.id, p.type, p.isPrimitive, p.default, " ".join(p.qualifier))
+                      for p in entity.params]
+            className = entity.owner
+        line, start, end = entity.span
+        digest = hashlib.sha1(self.data[start:end]).hexdigest()
+        self.rows.append(((getattr(entity, "idx", None), obj["entity"],
+                           getattr(entity, "id", None) or getattr(entity, "value", None),
+                           className, line, start, end, digest, json.dumps(obj)), params))
+
+    def finish(self):
+        digest = hashlib.sha256(self.data[:]).hexdigest()
+        self.index.replace(self.filename, digest, self.rows)
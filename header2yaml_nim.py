@@ -0,0 +1,388 @@
+"""Nim bindings of the headers: the types of C++ are translated into Nim
+following the typedefs of the included headers (`TypeResolver`, memoized
+per process by `getResolver`) and `NimWriter` writes `importcpp` procs
+from the entities `process` emits.
+
+    python header2yaml.py --format nim -I /usr/include/opencascade gp_Ax3.hxx
+
+Imported by header2yaml on demand; its names are reachable from there as
+well (`header2yaml.getResolver`).
+"""
+import os, re
+
+from header2yaml import (NIM_KEYWORDS, types, IncludeResolver, Source, read, getParser,
+                         getQuery, _innerDeclarator, Class, Define, Function)
+
+
+# ---------- Types
+# Words that make up the builtin integer types, in their canonical order
+_INTEGER_WORDS = ["unsigned", "signed", "short", "long", "char", "int"]
+_TYPE_TOKEN = re.compile(r"::|\w+|&&|[*&<>,\[\]()]")
+_DROPPED_WORDS = {"volatile", "struct", "class", "union", "enum", "typename"}
+
+def _normalizeType(spelling):
+    """See `normalizeType` (memoized there)"""
+    words = []
+    modifiers = ""
+    isConst = False
+    depth = 0   # template arguments are kept as written (without spaces)
+    for token in _TYPE_TOKEN.findall(spelling):
+        if depth == 0 and token in ["*", "&", "&&"]:
+            modifiers += token
+        elif depth == 0 and token == "const":
+            isConst = True
+        elif depth == 0 and token in _DROPPED_WORDS:
+            pass
+        else:
+            depth += (token == "<") - (token == ">")
+            words.append(token)
+    if words and all(w in _INTEGER_WORDS for w in words):
+        words.sort(key=_INTEGER_WORDS.index)
+        if words[0] == "signed" and words[1:] != ["char"]:
+            words.pop(0)   # signed long -> long
+        if len(words) > 1 and words[-1] == "int":
+            words.pop()    # unsigned long int -> unsigned long
+        if words in (["unsigned"], []):
+            words.append("int")
+    base = ""
+    for w in words:
+        if base and base[-1].isalnum() and w[0].isalnum() or base.endswith(">") and w[0].isalnum():
+            base += " "
+        base += w
+    return base, modifiers, isConst
+
+_normalized = {}
+
+def normalizeType(spelling):
+    """Canonical form of a C++ type: (base, modifiers, isConst).
+
+    `modifiers` holds the `*`, `&` and `&&` applied to the base, outermost
+    last; `const`, `volatile` and the `struct`/`class`/... keywords are left
+    out (`isConst` tells whether there was a const) and the builtin integer
+    types are spelled one way: "long unsigned int" gives "unsigned long".
+    """
+    try:
+        return _normalized[spelling]
+    except KeyError:
+        if len(_normalized) > 65536:
+            _normalized.clear()
+        result = _normalized[spelling] = _normalizeType(spelling)
+        return result
+
+# `types` keyed by (base, modifiers)
+NIM_TYPES = {normalizeType(k)[:2]: v for k, v in types.items()}
+
+def readTypedefs(filename):
+    """Parses `filename`; returns its includes and its typedefs (also the
+    `using X = ...` aliases) as a dictionary alias -> spelling of the type.
+    Typedefs of function pointers and arrays are left out."""
+    source = Source.open(filename)
+    try:
+        root = getParser().parse(source.view, keep_text=False).root_node
+        includes = [read(source, node) for node, _ in getQuery("includes").captures(root)]
+        # Captures come in order, every typedef before its type and
+        # declarators (the missing declarator of "typedef unsigned long
+        # size_t" is not a child of the typedef)
+        found = []   # {"typedef": node, "type": node, "declarator": [nodes]}
+        for node, name in getQuery("typedefs").captures(root):
+            if name == "typedef":
+                found.append({"typedef": node, "declarator": []})
+            elif name == "type":
+                found[-1]["type"] = node
+            else:
+                found[-1]["declarator"].append(node)
+        typedefs = {}
+        for captures in found:
+            for node in captures["declarator"]:
+                alias, spelling = _typedefSpelling(source, captures["typedef"],
+                                                   captures["type"], node)
+                if alias is not None and alias != spelling:
+                    typedefs[alias] = spelling
+        return includes, typedefs
+    finally:
+        source.close()
+
+def _typedefSpelling(source, owner, typeNode, node):
+    """(alias, spelling of the type) for the declarator `node` of a typedef,
+    or (None, None) when it does not name a plain type"""
+    if node.start_byte == node.end_byte and typeNode.type == "sized_type_specifier":
+        # "typedef unsigned long size_t": size_t is taken as the primitive
+        # type of the sized_type_specifier
+        node = typeNode.named_children[-1]
+        spelling = source.text(typeNode.start_byte, node.start_byte)
+    else:
+        nameNode = typeNode.child_by_field_name("name")
+        if typeNode.type.endswith("_specifier") and nameNode is not None:
+            spelling = read(source, nameNode)   # typedef struct Foo {...} Foo
+        else:
+            spelling = read(source, typeNode)
+    node, modifiers = _innerDeclarator(node)
+    if node is None or node.type not in ["type_identifier", "primitive_type"]:
+        return None, None
+    for child in owner.children:
+        if child.type == "type_qualifier":
+            spelling = f"{read(source, child)} {spelling}"
+    return read(source, node), " ".join([spelling] + modifiers)
+
+class TypeResolver:
+    """Translates C++ type spellings into Nim types.
+
+    The spelling is normalized (see `normalizeType`) and looked up in
+    `types`; typedefs are followed through the headers the file includes
+    (found as `IncludeResolver` does, with `includePaths`), so that
+    `Standard_Real` gives `cdouble` when some included header has
+    `typedef double Standard_Real`. Pointers become `ptr T` (but `char *` is
+    `cstring`...), non-const references `var T`. Other names are kept as
+    they are (Nim keywords are quoted).
+
+    Results are memoized by (normalized type, header that defines its base),
+    so a header included everywhere is resolved once for the whole batch;
+    at most `maxSize` results are kept (least recently used go first).
+    `getResolver` returns the resolver of the process.
+    """
+    MAX_DEPTH = 32   # longest typedef chain (also stops typedef cycles)
+
+    def __init__(self, includePaths=(), maxSize=65536):
+        self.includes = IncludeResolver(includePaths)
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self._cache = {}
+        self._typedefs = {}   # header -> (includes, typedefs)
+        self._scopes = {}     # header -> {alias: header that defines it}
+
+    def typedefs(self, filename):
+        try:
+            return self._typedefs[filename]
+        except KeyError:
+            try:
+                result = readTypedefs(filename)
+            except FileNotFoundError:
+                print("ERROR: File not found: ", filename)
+                result = ([], {})
+            self._typedefs[filename] = result
+            return result
+
+    def scope(self, filename):
+        """{alias: header defining it} for the typedefs visible in `filename`
+        (its own first, then those of its includes, in order)"""
+        try:
+            return self._scopes[filename]
+        except KeyError:
+            pass
+        path = os.path.realpath(filename)
+        if path != filename:
+            self._scopes[filename] = scope = self.scope(path)
+            return scope
+        self._scopes[filename] = {}   # an include cycle sees an empty scope
+        includes, typedefs = self.typedefs(filename)
+        scope = dict.fromkeys(typedefs, filename)
+        for incl in includes:
+            path = self.includes.resolve(incl, filename)
+            if path is not None:
+                for alias, owner in self.scope(path).items():
+                    scope.setdefault(alias, owner)
+        self._scopes[filename] = scope
+        return scope
+
+    def resolve(self, spelling, filename=None, _depth=0):
+        """Nim type of `spelling` as seen from the header `filename`"""
+        base, modifiers, isConst = normalizeType(spelling)
+        owner = self.scope(filename).get(base) if filename else None
+        key = (base, modifiers, isConst, owner)
+        cache = self._cache
+        try:
+            result = cache.pop(key)
+            self.hits += 1
+        except KeyError:
+            self.misses += 1
+            result = self._resolve(base, modifiers, isConst, owner, _depth)
+            if len(cache) >= self.maxSize:
+                del cache[next(iter(cache))]
+        cache[key] = result   # most recently used last
+        return result
+
+    def _resolve(self, base, modifiers, isConst, owner, depth):
+        pointers = modifiers.rstrip("&")
+        nim = NIM_TYPES.get((base, pointers))
+        if nim is not None:
+            pointers = ""
+        elif owner is not None and depth < self.MAX_DEPTH:
+            # The pointers of the typedef come before ours
+            underlying = self.typedefs(owner)[1][base]
+            nim = self.resolve(f"{underlying} {pointers}", owner, depth + 1)
+            pointers = ""
+        else:
+            nim = NIM_TYPES.get((base, ""), base)
+            if nim in NIM_KEYWORDS:
+                nim = f"`{nim}`"
+        for _ in pointers:
+            nim = f"ptr {nim}"
+        if modifiers.endswith("&") and not modifiers.endswith("&&") and not isConst:
+            nim = f"var {nim}"
+        return nim
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / total if total else 0.0,
+                "size": len(self._cache)}
+
+_resolvers = {}
+
+def getResolver(includePaths=()):
+    """Returns the TypeResolver of this process for `includePaths`"""
+    key = tuple(includePaths)
+    if key not in _resolvers:
+        _resolvers[key] = TypeResolver(includePaths)
+    return _resolvers[key]
+
+
+# ---------- Nim bindings
+NIM_NUMBER = re.compile(r"-?(0[xX][0-9a-fA-F]+|\d+(\.\d*)?([eE][-+]?\d+)?)")
+# C++ operators that keep their name in Nim -> importcpp pattern (binary, unary)
+NIM_OPERATORS = {op: ("(# " + op + " #)", "(" + op + " #)")
+                 for op in ["+", "-", "*", "/", "%", "==", "!=", "<", "<=", ">", ">=",
+                            "+=", "-=", "*=", "/=", "<<", ">>", "&", "|", "^", "!", "~"]}
+NIM_OPERATORS["[]"] = ("#[#]", None)
+NIM_OPERATORS["()"] = ("#(@)", "#()")
+
+def nimIdent(name):
+    """`name` as a Nim identifier (keywords quoted), or None if Nim does not
+    accept it"""
+    if name in NIM_KEYWORDS:
+        return f"`{name}`"
+    if name.startswith("_") or name.endswith("_") or "__" in name:
+        return None
+    return name
+
+class NimWriter:
+    """Writes Nim `importcpp` bindings into the Emitter `out` as the entities
+    arrive, without the YAML round-trip. `parseFile` feeds it the entities
+    of `extract`, which keep the qualifiers of the functions (static,
+    const), the operators and the pointers and references of the parameters.
+
+    Functions become procs: methods take `this` (`var` unless the method is
+    const), static methods are called as `Class::name`, constructors are
+    `constructClass` procs and operators keep their symbol. Classes become
+    importcpp objects (declared before their first method), numeric defines
+    consts and the typedefs of `filename` type aliases. Types are translated
+    by `resolver` (by default, `getResolver()`) as seen from `filename`.
+    Preprocessor conditions are flattened; comments, declarations and
+    function-like macros are left out. A proc with the same class, name and
+    parameter types is written once.
+    """
+    def __init__(self, out, filename=None, resolver=None):
+        self.out = out
+        self.write = out.write
+        self.filename = filename
+        self.resolver = resolver if resolver is not None else getResolver()
+        self._types = set()   # objects already declared
+        self._procs = set()
+        self._writers = {Function: self.function, Define: self.define, Class: self.klass}
+        if filename is not None and os.path.isfile(filename):
+            self.typedefs()
+
+    @staticmethod
+    def header(filename):
+        """First lines of the file written for the header `filename`"""
+        name = os.path.basename(filename)
+        return f'# Generated from {name}\nconst headerFilename = "{name}"\n\n'
+
+    def add(self, entity):
+        writer = self._writers.get(type(entity))
+        if writer is not None:
+            writer(entity)
+
+    def nimType(self, typ, qualifiers=()):
+        return self.resolver.resolve(" ".join([typ, *qualifiers]), self.filename)
+
+    def declareType(self, name):
+        if name not in self._types:
+            self._types.add(name)
+            self.write(f'type {name}* {{.importcpp: "{name}", header: headerFilename.}} = object\n')
+
+    def typedefs(self):
+        _, typedefs = self.resolver.typedefs(os.path.realpath(self.filename))
+        for alias in typedefs:
+            nim = self.nimType(alias)
+            if nim != alias and nimIdent(alias) is not None:
+                self._types.add(alias)
+                self.write(f"type {nimIdent(alias)}* = {nim}\n")
+
+    def function(self, f):
+        if f.id is None:
+            return
+        className = f.owner
+        params, types = [], []
+        for k, p in enumerate(f.params):
+            if p.type is None or p.type == "void" and not p.qualifier:
+                continue   # f(void)
+            nim = self.nimType(p.type, p.qualifier)
+            name = nimIdent(p.id) if p.id != "-nil-" else None
+            line = f"{name or f'a{k}'}: {nim}"
+            if p.default is not None and (NIM_NUMBER.fullmatch(p.default) or
+                                          p.default in ["true", "false"]):
+                line += f" = {p.default}"
+            params.append(line)
+            types.append(nim)
+        ret = None
+        # Export macros (Standard_EXPORT void f()) are taken as the return type
+        if f.returnType is not None and not f.returnType.endswith("_EXPORT"):
+            ret = self.nimType(f.returnType, f.returnQualifiers)
+            if ret == "void":
+                ret = None
+        pragmas = ""
+
+        name = f.id
+        operator = None
+        if name.startswith("operator"):
+            operator = NIM_OPERATORS.get(name[8:].strip())
+            if operator is None:
+                return   # conversion operators, new, delete...
+            name = f"`{name[8:].strip()}`"
+        if className is not None and f.id == className:
+            procName = f"construct{className}"
+            ret = className
+            pragmas = "constructor, "
+            pattern = f"{className}(@)"
+        elif className is not None and f.id.startswith("~"):
+            return   # destructors are called by Nim
+        else:
+            procName = name if operator else nimIdent(name)
+            if procName is None:
+                return
+            if operator:
+                pattern = operator[0] if len(params) > (className is None) else operator[1]
+                if pattern is None:
+                    return
+            elif className is not None and "static" in f.qualifiers:
+                pattern = f"{className}::{f.id}(@)"
+            elif className is not None:
+                pattern = f"#.{f.id}(@)"
+            else:
+                pattern = f"{f.id}(@)"
+            if className is not None and "static" not in f.qualifiers:
+                this = className if "const" in f.qualifiers else f"var {className}"
+                params.insert(0, f"this: {this}")
+                types.insert(0, this)
+
+        key = (className, procName, tuple(types))
+        if key in self._procs:
+            return
+        self._procs.add(key)
+        if className is not None:
+            self.declareType(className)
+        ret = f": {ret}" if ret else ""
+        self.write(f'proc {procName}*({"; ".join(params)}){ret} '
+                   f'{{.{pragmas}importcpp: "{pattern}", header: headerFilename.}}\n')
+
+    def define(self, d):
+        name = nimIdent(d.id)
+        if d.arg is not None and name is not None and NIM_NUMBER.fullmatch(d.arg):
+            self.write(f"const {name}* = {d.arg}\n")
+
+    def klass(self, c):
+        if nimIdent(c.id) is not None:
+            self.declareType(c.id)
@@ -0,0 +1,94 @@
+"""Conversion server (`--serve SOCKET`): keeps the grammar loaded in a pool
+of workers and converts the headers sent over a Unix socket. See
+`header2yaml_client.py` for the client.
+
+Imported by header2yaml on demand; `header2yaml.ConversionServer` is this one.
+"""
+import os, sys, json, base64, signal, socketserver
+from concurrent.futures import ProcessPoolExecutor
+
+from header2yaml import Source, parseFile, destinationFor, headerToYaml, _initWorker
+
+
+def _convertRequest(request, cache=None):
+    """Runs in a worker of ConversionServer; see `ConversionServer`"""
+    skipBodies = request.get("signaturesOnly", False)
+    if "data" in request:
+        filename = request.get("filename", "<stdin>")
+        with Source(base64.b64decode(request["data"])) as source:
+            txt, includes = headerToYaml(source, filename, skipBodies)
+        return {"yaml": txt, "includes": includes}
+
+    filename = request["path"]
+    if not os.path.isfile(filename):
+        raise FileNotFoundError(f"File not found: {filename}")
+    outputFolder = request.get("output")
+    if outputFolder:
+        os.makedirs(outputFolder, exist_ok=True)
+        format = request.get("format", "yaml")
+        includes = parseFile(filename, cache=cache, outputFolder=outputFolder, format=format,
+                             skipBodies=skipBodies)
+        return {"destination": destinationFor(filename, outputFolder, format),
+                "includes": includes}
+    with Source.open(filename) as source:
+        txt, includes = headerToYaml(source, filename, skipBodies)
+    return {"yaml": txt, "includes": includes}
+
+class _ConversionHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                future = self.server.pool.submit(_convertRequest, request, self.server.cache)
+                reply = future.result()
+            except Exception as e:
+                reply = {"error": f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(reply).encode("utf8") + b"\n")
+            self.wfile.flush()
+
+class ConversionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Converts headers on request over the Unix socket `socketPath`.
+
+    The grammar and the parsers stay loaded in a pool of `workers` processes,
+    so a request does not pay the start up of the converter. Every client
+    gets a thread; its requests go to the pool, so several clients are
+    served at once.
+
+    The protocol is one JSON object per line, each answered by one line:
+
+        {"path": "/abs/header.hxx"}                    -> {"yaml": ..., "includes": [...]}
+        {"path": "/abs/header.hxx", "output": "/abs"}  -> {"destination": ..., "includes": [...]}
+        {"data": "<base64>", "filename": "header.hxx"} -> {"yaml": ..., "includes": [...]}
+
+    On failure the reply is {"error": "..."}. With "output", the YAML is
+    written as `parseFile` does (using `cache`, a ConversionCache, if given);
+    "format": "jsonl" writes JSON Lines instead. Any request may set
+    "signaturesOnly": true (see `walker`).
+    See `header2yaml_client.py` for a client.
+    """
+    daemon_threads = True
+
+    def __init__(self, socketPath, workers=None, cache=None):
+        if os.path.exists(socketPath):   # left by a previous server
+            os.remove(socketPath)
+        super().__init__(socketPath, _ConversionHandler)
+        self.socketPath = socketPath
+        self.cache = cache
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_initWorker)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown()
+        if os.path.exists(self.socketPath):
+            os.remove(self.socketPath)
+
+    def run(self):
+        print(f"Listening on {self.socketPath}")
+        # Stop cleanly on SIGTERM as on Ctrl-C
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            self.serve_forever()
+        except (KeyboardInterrupt, SystemExit):
+            pass
+        finally:
+            self.server_close()
@@ -0,0 +1,37 @@
+"""Tests of header2yaml, on the headers of `tests/headers`:
+
+    python -m pytest tests
+"""
+import os, sys, glob, io, contextlib
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEADERS = os.path.join(ROOT, "tests", "headers")
+
+# The grammar is loaded from treesitter/my-languages.so, relative to the
+# current folder
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+
+import header2yaml
+
+
+def quiet(function, *args, **kwargs):
+    """Calls `function` without the warnings the converter prints"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+def toYaml(data, header="header.hxx", skipBodies=False):
+    """YAML of the header `data` (bytes), converted in one go"""
+    tree = header2yaml.getParser().parse(data)
+    return quiet(header2yaml.process, header2yaml.walker(tree.walk(), skipBodies), data, header)
+
+
+@pytest.fixture
+def headers():
+    return sorted(glob.glob(os.path.join(HEADERS, "*.h*")))
+
+@pytest.fixture
+def header():
+    return os.path.join(HEADERS, "gp_Ax3.hxx")
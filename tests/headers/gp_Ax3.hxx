@@ -0,0 +1,69 @@
+#ifndef _gp_Ax3_HeaderFile
+#define _gp_Ax3_HeaderFile
+
+#include <Standard.hxx>
+#include "gp_Types.hxx"
+#define MAXV 10
+#define SQR(a, b) a*b
+
+// Forward declarations
+class gp_Ax1;
+struct gp_XYZ;
+
+//! Coordinate system in 3D space
+class gp_Ax3 : public Base
+{
+public:
+
+  Standard_EXPORT gp_Ax3(const gp_Pnt& P, const gp_Dir& V);
+
+  Standard_EXPORT void XReverse();
+
+  Standard_EXPORT Standard_Real Angle (const gp_Ax3& Other, int mode = 3) const;
+
+  Standard_Boolean Direct() const;
+
+  void SetLocation (const gp_Pnt& P);
+
+  void SetName (char *name);
+
+  static gp_Ax3 Origin();
+
+  bool operator== (const gp_Ax3& Other) const;
+
+  inline Standard_Real Scale() const { return myScale; }
+
+  void Coord (Standard_Real& X, Standard_Real& Y) const;
+
+  struct Bounds
+  {
+    Standard_Real Min;
+    Standard_Real Max;
+  };
+
+protected:
+
+  int value;
+
+private:
+
+  gp_Pnt myLocation;
+  Standard_Real myScale;
+};
+
+enum gp_TrsfForm { gp_Identity, gp_Rotation, gp_Translation };
+
+#ifdef FOO
+int foo(int a, char *b);
+#else
+int foo3(void);
+#endif
+
+#if defined(WITH_X) && WITH_X > 1
+typedef int myint;
+double bar(double x, const char* s = "hi");
+#elif 0
+int neverDeclared();
+#endif
+
+#endif
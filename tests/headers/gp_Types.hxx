@@ -0,0 +1,12 @@
+#ifndef _gp_Types_HeaderFile
+#define _gp_Types_HeaderFile
+
+typedef double Standard_Real;
+typedef bool Standard_Boolean;
+typedef Standard_Real Quantity_Length;
+typedef unsigned int Standard_Size;
+
+class gp_Pnt;
+class gp_Dir;
+
+#endif
@@ -0,0 +1,19 @@
+#include <stdint.h>
+
+/* Plain C declarations */
+int f1(int a, float b);
+unsigned long f2(unsigned int x);
+void f3(char *name, int n);
+typedef int myint;
+int globalv;
+
+struct point {
+  int x;
+  int y;
+};
+
+#if CHECK_VERSION(2, 0)
+int f4(struct point *p);
+#else
+int f5(void);
+#endif
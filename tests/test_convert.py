@@ -0,0 +1,164 @@
+"""The ways of converting a header give the same output as `process` over
+the whole tree: from the cache, incrementally and piece by piece"""
+import os, random
+
+import pytest
+
+import header2yaml
+from conftest import quiet, toYaml
+
+
+def test_cache(tmp_path, headers):
+    cache = header2yaml.ConversionCache(str(tmp_path / "cache"))
+    out = tmp_path / "out"
+    out.mkdir()
+    for filename in headers:
+        includes = quiet(header2yaml.parseFile, filename, cache=cache, outputFolder=str(out))
+        destination = header2yaml.destinationFor(filename, str(out))
+        with open(destination) as fp:
+            converted = fp.read()
+        os.remove(destination)
+        assert quiet(header2yaml.parseFile, filename, cache=cache, outputFolder=str(out)) == includes
+        with open(destination) as fp:
+            assert fp.read() == converted
+    assert cache.stats()["hits"] == len(headers)
+
+@pytest.mark.parametrize("chunkSize", [1, 7, 64, 4096])
+@pytest.mark.parametrize("margin", [0, 1, 16, 1024])
+def test_stream(headers, chunkSize, margin):
+    # Pieces whose handlers need more than the margin are walked again
+    for filename in headers:
+        with open(filename, "rb") as fp:
+            data = fp.read()
+        tree = header2yaml.getParser().parse(data)
+        chunks = header2yaml.walkChunks(tree.walk(), chunkSize=chunkSize, margin=margin)
+        assert quiet(header2yaml.processChunks, chunks, data, "header.hxx") == toYaml(data)
+
+def test_streamGrow():
+    # The piece is handed again with twice the margin, then None at the end
+    data = b"void a();\nvoid b();\nvoid c();\nvoid d();\n"
+    chunks = header2yaml.walkChunks(header2yaml.getParser().parse(data).walk(),
+                                    chunkSize=1, margin=0)
+    parsed, start, cut = next(chunks)
+    grown, start2, cut2 = chunks.send(True)
+    assert (start2, cut2) == (start, cut) and len(grown) > len(parsed)
+    # The last piece holds the rest of the tree and cannot grow
+    last = next(chunks)
+    while chunks.send(True) is not None:
+        last = next(chunks)
+    assert last[0].endBytes[-1] == len(data) - 1
+    assert next(chunks, None) is None
+
+@pytest.mark.parametrize("prefix", [b"", b"#if defined(X)\nint x;\n#endif\n"])
+def test_streamBounded(prefix):
+    # A flat header is cut in pieces of about chunkSize nodes, whatever the
+    # parameters of its functions or the #if before them
+    data = prefix + b"".join(b"int f%d(int a, char *b);\n" % k for k in range(800)) \
+           + b"#define END 1\n"
+    tree = header2yaml.getParser().parse(data)
+    sizes = [len(parsed) for parsed, _, _ in
+             header2yaml.walkChunks(tree.walk(), chunkSize=256, margin=16)]
+    assert len(sizes) > 40 and max(sizes) < 2 * 256
+    chunks = header2yaml.walkChunks(tree.walk(), chunkSize=256, margin=16)
+    assert quiet(header2yaml.processChunks, chunks, data, "header.hxx") == toYaml(data)
+
+def test_incremental(headers):
+    snippets = [b"int extra(int z);\n", b"// note\n", b"#define X 3\n", b"typedef int qq;\n",
+                b"x", b"", b"double w(double a, int b = 2);\n"]
+    rng = random.Random(0)
+    for filename in headers:
+        with open(filename, "rb") as fp:
+            data = fp.read()
+        parser = header2yaml.IncrementalParser(filename)
+        quiet(parser.convert, data)
+        for _ in range(20):
+            position = rng.randrange(len(data) + 1)
+            position = data.rfind(b"\n", 0, position) + 1
+            data = data[:position] + rng.choice(snippets) + data[position + rng.choice([0, 1, 5]):]
+            assert quiet(parser.convert, data) == toYaml(data)
+
+def test_incrementalReuse(header):
+    # gp_Ax3.hxx does not parse without errors (Standard_EXPORT): the tree
+    # parsed from the edited one is kept, most declarations are copied from
+    # the previous output and most subtrees are not walked again
+    with open(header, "rb") as fp:
+        data = fp.read()
+    parser = header2yaml.IncrementalParser(header)
+    quiet(parser.convert, data)
+    for old, new in [(b"void XReverse();", b"void XReverse(int k);"),
+                     (b"void XReverse(int k);", b"void XReverse(int k;")]:
+        data = data.replace(old, new)
+        assert quiet(parser.convert, data) == toYaml(data)
+        assert parser.tree.root_node.has_error
+        assert parser.segments.reused > 0.8 * len(parser.segments.checkpoints)
+        assert parser.parsed.nodes.count(None) > len(parser.parsed) // 2
+
+def test_signaturesOnly(header):
+    with open(header, "rb") as fp:
+        data = fp.read()
+    full, signatures = toYaml(data), toYaml(data, skipBodies=True)
+    # Only what is inside the bodies is left out
+    assert "Scale" in signatures
+    assert set(signatures.splitlines()) <= set(full.splitlines())
+
+def test_funcQualifier():
+    # inline and const are written in funcQualifier (the blocks had no
+    # funcQualifier for them before)
+    data = b"inline int twice(int a) { return 2 * a; }\n" \
+           b"class A\n{\npublic:\n  void Y(int a) const;\n};\n#define END 1\n"
+    txt = toYaml(data)
+    assert "- function:\n  idx: 0\n  funcQualifier:\n    - inline\n  return: int\n  id: twice\n" in txt
+    assert "  funcQualifier:\n    - const\n  return: void\n  id: Y\n" in txt
+    assert txt.count("funcQualifier:") == txt.count("- inline\n") + txt.count("- const\n")
+
+def test_destinations(tmp_path):
+    # The output mirrors the input tree; a header that would overwrite the
+    # output of another one is not converted
+    for name in ["a/point.h", "b/point.h", "c/Point.h", "c/point.h"]:
+        (tmp_path / "in" / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / "in" / name).write_text("#define POINT 1\n")
+    out = tmp_path / "out"
+    filenames = header2yaml.expandInputs([str(tmp_path / "in")])
+    results = quiet(header2yaml.parseFiles, filenames, workers=1, outputFolder=str(out))
+    assert sorted(str(p.relative_to(out)) for p in out.rglob("*")) == [
+        "a", "a/point.yaml", "b", "b/point.yaml", "c", "c/point.yaml"]
+    assert [f for f, includes in results.items() if includes is None] == [
+        str(tmp_path / "in" / "c" / "point.h")]
+
+    assert header2yaml.destinationFor("/x/y/z.h", "out", root="/x") == "out/y/z.yaml"
+    assert header2yaml.destinationFor("/w/z.h", "out", root="/x") == "out/z.yaml"
+    assert header2yaml.destinationFor("/x/Z.hxx", "out", "nim") == "out/z.nim"
+
+def test_includeOrder(tmp_path):
+    # A header is converted after the headers it includes, and once; the
+    # include closing a cycle is not waited for
+    (tmp_path / "inc").mkdir()
+    (tmp_path / "a.h").write_text('#include "b.h"\n#include <c.h>\n')
+    (tmp_path / "b.h").write_text('#include <c.h>\n#include "d.h"\n')
+    (tmp_path / "inc" / "c.h").write_text("#define C 1\n")
+    (tmp_path / "d.h").write_text('#include "b.h"\n')
+    results = quiet(header2yaml.parseFiles, [str(tmp_path / "a.h")], workers=2,
+                    outputFolder=str(tmp_path / "out"), followIncludes=True,
+                    includePaths=[str(tmp_path / "inc")])
+    order = [os.path.basename(f) for f in results]
+    assert sorted(order) == ["a.h", "b.h", "c.h", "d.h"]
+    assert order.index("c.h") < order.index("b.h") < order.index("a.h")
+    assert order.index("d.h") < order.index("b.h")
+
+def test_classLeft():
+    # Only the functions in the body of a class are given the class
+    data = b"class A : public B\n{\npublic:\n  Standard_EXPORT void f(int a);\n};\n" \
+           b"void g(int b);\n#define END 1\n"
+    head, tail = toYaml(data).split("id: g\n", 1)
+    assert "id: f\n  class:\n    - A\n    - : public B\n" in head
+    assert "class:" not in tail
+
+def test_ifCondition():
+    # The declarations after a condition without binary_expression are
+    # kept, in the block of the #if they are in (they were skipped up to the
+    # next binary_expression of the header)
+    data = b"#if defined(X)\nvoid f(int a);\n#endif\nvoid g(int b);\nint k = 1 + 2;\n" \
+           b"#define END 1\n"
+    txt = toYaml(data)
+    assert "    block:\n      - function:\n        idx: 1\n        return: void\n        id: f\n" in txt
+    assert "\n  - function:\n    idx: 4\n    return: void\n    id: g\n" in txt
@@ -0,0 +1,38 @@
+import json
+
+import header2yaml
+from conftest import quiet
+
+
+def test_index(tmp_path, headers):
+    # Every row holds the entity as JsonLinesWriter writes it
+    index = header2yaml.SymbolIndex(str(tmp_path / "index.db"))
+    for filename in headers:
+        quiet(header2yaml.parseFile, filename, outputFolder=str(tmp_path), format="jsonl",
+              index=index)
+        with open(header2yaml.destinationFor(filename, str(tmp_path), "jsonl")) as fp:
+            written = [json.loads(line) for line in fp][1:]
+        rows = [json.loads(data) for data, in index.conn.execute(
+            "SELECT data FROM entities WHERE file = ? ORDER BY rowid", (filename,))]
+        kinds = set(row["entity"] for row in rows)
+        # Without the position in the tree ("n", "parent")
+        assert rows == [{k: v for k, v in obj.items() if k not in ["n", "parent"]}
+                        for obj in written if obj["entity"] in kinds]
+        assert index.isCurrent(filename)
+
+    rows = index.find("SetLocation", className="gp_Ax3")
+    assert set((line, kind) for _, line, kind, _, _ in rows) == {(26, "function")}
+
+    # Classes and structs are found where they are defined too
+    found = lambda name: sorted((line, data["isForwardDecl"]) for _, line, _, _, data
+                                in index.find(name, kind="class"))
+    assert found("gp_Ax3") == [(14, False)]
+    assert found("gp_Ax1") == [(10, True)]
+    assert found("Bounds") == [(38, False)]
+    assert found("point") == [(10, False)]
+
+    # Converting again replaces the rows
+    count = index.conn.execute("SELECT count(*) FROM entities").fetchone()
+    quiet(header2yaml.parseFile, headers[0], outputFolder=str(tmp_path), index=index)
+    assert index.conn.execute("SELECT count(*) FROM entities").fetchone() == count
+    index.close()
@@ -0,0 +1,59 @@
+import pytest
+
+import header2yaml
+from conftest import HEADERS
+
+
+@pytest.mark.parametrize("a, b", [("unsigned long int", "long unsigned"),
+                                  ("const char*", "char const *"),
+                                  ("struct point", "point")])
+def test_normalizeType(a, b):
+    assert header2yaml.normalizeType(a) == header2yaml.normalizeType(b)
+
+@pytest.mark.parametrize("spelling, nim", [("const Standard_Real&", "cdouble"),
+                                           ("Standard_Boolean", "bool"),
+                                           ("Quantity_Length", "cdouble"),
+                                           ("Quantity_Length *", "ptr cdouble"),
+                                           ("Standard_Size", "cuint"),
+                                           ("char *", "cstring"),
+                                           ("gp_Pnt*", "ptr gp_Pnt"),
+                                           ("unsigned long int", "culong")])
+def test_resolve(header, spelling, nim):
+    # The typedefs are followed through the included gp_Types.hxx
+    assert header2yaml.TypeResolver().resolve(spelling, header) == nim
+
+def test_memoized(header):
+    resolver = header2yaml.TypeResolver()
+    first = resolver.resolve("const Quantity_Length&", header)
+    misses = resolver.stats()["misses"]
+    assert resolver.resolve("const Quantity_Length&", header) == first
+    assert resolver.stats()["misses"] == misses
+    assert header2yaml.getResolver() is header2yaml.getResolver()
+
+def bindings(tmp_path, header, **kwargs):
+    header2yaml.parseFile(header, outputFolder=str(tmp_path), format="nim", **kwargs)
+    with open(header2yaml.destinationFor(header, str(tmp_path), "nim")) as fp:
+        return fp.read()
+
+def test_bindings(tmp_path, header):
+    nim = bindings(tmp_path, header, includePaths=[HEADERS])
+    for line in [
+            # static: called on the class, no `this`
+            'proc Origin*(): gp_Ax3 {.importcpp: "gp_Ax3::Origin(@)", header: headerFilename.}',
+            # const: `this` is not var
+            'proc Direct*(this: gp_Ax3): bool {.importcpp: "#.Direct(@)", header: headerFilename.}',
+            # operators keep their symbol
+            'proc `==`*(this: gp_Ax3; Other: gp_Ax3): bool {.importcpp: "(# == #)", header: headerFilename.}',
+            # pointers and references
+            'proc SetName*(this: var gp_Ax3; name: cstring) {.importcpp: "#.SetName(@)", header: headerFilename.}',
+            'proc Coord*(this: gp_Ax3; X: var cdouble; Y: var cdouble) {.importcpp: "#.Coord(@)", header: headerFilename.}',
+            'proc SetLocation*(this: var gp_Ax3; P: gp_Pnt) {.importcpp: "#.SetLocation(@)", header: headerFilename.}',
+            'type gp_Ax3* {.importcpp: "gp_Ax3", header: headerFilename.} = object',
+            "const MAXV* = 10"]:
+        assert line + "\n" in nim
+
+def test_bindingsPreprocessed(tmp_path, header):
+    # The branches not taken are left out
+    nim = bindings(tmp_path, header, includePaths=[HEADERS], defines={"FOO": "1"})
+    assert "proc foo*(a: cint; b: cstring): cint" in nim
+    assert "foo3" not in nim and "neverDeclared" not in nim
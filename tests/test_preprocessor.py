@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+import pytest
+
+import header2yaml
+from conftest import HEADERS, quiet
+
+
+class NeverPruned(header2yaml.Preprocessor):
+    def deadBodies(self, node, source):
+        return None
+
+def walk(filename, preprocessor=None):
+    source = header2yaml.Source.open(filename)
+    tree = header2yaml.getParser().parse(source.view, keep_text=False)
+    if preprocessor is not None:
+        preprocessor.start(source, filename)
+    return header2yaml.walker(tree.walk(), preprocessor=preprocessor), source
+
+def convert(filename, defines):
+    preprocessor = header2yaml.Preprocessor(header2yaml.parseDefines(defines), [HEADERS])
+    parsed, source = walk(filename, preprocessor)
+    return quiet(header2yaml.process, parsed, source, "header.hxx")
+
+@pytest.mark.parametrize("chunk", [header2yaml.WALK_CHUNK, 7])
+def test_nothingPruned(headers, chunk, monkeypatch):
+    # Walking with a preprocessor that keeps every branch builds the same table
+    monkeypatch.setattr(header2yaml, "WALK_CHUNK", chunk)
+    for filename in headers:
+        a, _ = walk(filename)
+        b, _ = walk(filename, NeverPruned())
+        for attr in ["levels", "types", "startBytes", "endBytes", "rows", "parents", "ends",
+                     "functions", "boundaries"]:
+            assert np.array_equal(getattr(a, attr), getattr(b, attr)), (filename, attr)
+
+def test_branches(header):
+    txt = convert(header, [])
+    assert "id: foo3\n" in txt and "id: foo\n" not in txt
+    assert "id: bar\n" not in txt and "neverDeclared" not in txt
+
+    txt = convert(header, ["FOO", "WITH_X=2"])
+    assert "id: foo\n" in txt and "id: foo3\n" not in txt
+    assert "id: bar\n" in txt and "neverDeclared" not in txt
+
+def test_undecidable():
+    # The value of a function-like macro is not known: both branches are kept
+    txt = convert(os.path.join(HEADERS, "plain.h"), [])
+    assert "id: f4\n" in txt and "id: f5\n" in txt
+
+def test_invalidOctal(tmp_path):
+    # 08 is not an integer: the #if cannot be decided and both branches stay
+    header = tmp_path / "octal.h"
+    header.write_text("#if VERSION > 08\nint f1(int a);\n#else\nint f2(int a);\n#endif\n")
+    txt = convert(str(header), ["VERSION=3"])
+    assert "id: f1\n" in txt and "id: f2\n" in txt
+    assert header2yaml._integer("010") == 8 and header2yaml._integer("09") is None
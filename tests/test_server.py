@@ -0,0 +1,38 @@
+import threading
+
+import pytest
+
+import header2yaml
+from conftest import quiet
+from header2yaml_client import Client
+
+
+@pytest.fixture
+def server(tmp_path):
+    socketPath = str(tmp_path / "server.sock")
+    server = header2yaml.ConversionServer(socketPath, workers=1)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield socketPath
+    server.shutdown()
+    thread.join()
+    server.server_close()
+
+def test_server(server, tmp_path, headers):
+    # The server answers what headerToYaml and parseFile give
+    with Client(server) as client:
+        for filename in headers:
+            with header2yaml.Source.open(filename) as source:
+                txt, includes = quiet(header2yaml.headerToYaml, source, filename)
+            assert client.convert(filename) == {"yaml": txt, "includes": includes}
+            with open(filename, "rb") as fp:
+                reply = client.convertData(fp.read(), filename)
+            assert reply == {"yaml": txt, "includes": includes}
+
+            reply = client.convert(filename, str(tmp_path / "out"))
+            assert reply["includes"] == includes
+            with open(reply["destination"]) as fp:
+                assert fp.read().endswith(txt.split("\n", 1)[1])
+
+        reply = client.convert(str(tmp_path / "missing.h"))
+        assert reply["error"].startswith("FileNotFoundError")
@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+import header2yaml
+
+
+def reference(node, level=0, rows=None):
+    """(level, type, end byte) of the nodes under `node`, in pre-order"""
+    if rows is None:
+        rows = []
+    rows.append((level, node.type, node.end_byte))
+    for child in node.children:
+        reference(child, level + 1, rows)
+    return rows
+
+@pytest.mark.parametrize("chunk", [header2yaml.WALK_CHUNK, 7])
+def test_table(headers, chunk, monkeypatch):
+    # The table follows the tree, and `ends`/`counts` answer what scanning
+    # the subtrees would, however the walk moves the nodes to the columns
+    monkeypatch.setattr(header2yaml, "WALK_CHUNK", chunk)
+    for filename in headers:
+        with open(filename, "rb") as fp:
+            tree = header2yaml.getParser().parse(fp.read())
+        parsed = header2yaml.walker(tree.walk())
+        rows = reference(tree.root_node)
+        assert [(level, node.type, node.end_byte) for level, node in parsed] == rows
+        for i, (level, _, _) in enumerate(rows):
+            end = i + 1
+            while end < len(rows) and rows[end][0] > level:
+                end += 1
+            assert parsed.ends[i] == end
+        for typ in header2yaml.INDEXED_TYPES:
+            found = np.array([t == typ for _, t, _ in rows])
+            assert np.array_equal(parsed.counts[typ][1:], np.cumsum(found))